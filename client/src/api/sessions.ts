@@ -53,6 +53,9 @@ export async function callSumDataTool(
     },
   });
 
+  if (response.status == 202) {
+    return (await waitForJob(sessionId, response.data["job_id"])) as number;
+  }
   if (response.status != 200) {
     throw new Error(response.data["detail"]);
   }
@@ -60,6 +63,30 @@ export async function callSumDataTool(
   return response.data as number;
 }
 
+const JOB_POLL_MS = 500;
+
+interface Job {
+  job_id: string;
+  status: "queued" | "running" | "done" | "failed";
+  result: unknown;
+  error: string | null;
+}
+
+// Large operations are answered with a background job; poll until it settles.
+export async function waitForJob(sessionId: string, jobId: string) {
+  for (;;) {
+    const response = await api.get(`/session/${sessionId}/jobs/${jobId}`);
+    const job = response.data as Job;
+    if (job.status == "done") {
+      return job.result;
+    }
+    if (job.status == "failed") {
+      throw new Error(job.error ?? "Job failed");
+    }
+    await new Promise((resolve) => setTimeout(resolve, JOB_POLL_MS));
+  }
+}
+
 export async function uploadCSV(sessionId: string, file: File) {
   const formData = new FormData();
   formData.append("file", file);
@@ -78,15 +105,30 @@ export async function exportCSV(sessionId: string, nodeId: string) {
 }
 
 interface NodeEntry {
-  [key: string]: string;
+  [key: string]: string | number | null;
 }
 type NodeContents = NodeEntry[];
 
-export async function getNodeContents(sessionId: string, nodeId: string) {
+export interface NodeContentsPage {
+  rows: NodeContents;
+  total: number;
+}
+
+export async function getNodeContents(
+  sessionId: string,
+  nodeId: string,
+  offset: number,
+  limit: number
+) {
   const response = await api.get(`/session/${sessionId}/node_info`, {
     params: {
       node_id: nodeId,
+      offset: offset,
+      limit: limit,
     },
   });
-  return response.data as NodeContents;
+  return {
+    rows: response.data as NodeContents,
+    total: Number(response.headers["x-total-count"]),
+  } as NodeContentsPage;
 }
@@ -3,14 +3,17 @@
 import { getNodeContents, type SessionMetadata } from "@/api/sessions";
 import LoadingSpinner from "@/components/LoadingSpinner";
 import { Alert, AlertDescription, AlertTitle } from "@/components/ui/alert";
-import { useQuery, useQueryClient } from "@tanstack/react-query";
+import {
+  keepPreviousData,
+  useQuery,
+  useQueryClient,
+} from "@tanstack/react-query";
 import { useParams } from "react-router-dom";
 import {
   type ColumnDef,
   flexRender,
   getCoreRowModel,
   useReactTable,
-  getPaginationRowModel,
 } from "@tanstack/react-table";
 import {
   Table,
@@ -21,7 +24,9 @@ import {
   TableRow,
 } from "@/components/ui/table";
 import { Button } from "@/components/ui/button";
-import { useMemo } from "react";
+import { useMemo, useState } from "react";
+
+const PAGE_SIZE = 10;
 
 interface NodeInfoProps {
   nodeId: string;
@@ -36,15 +41,26 @@ const NodeInfo = ({ nodeId }: NodeInfoProps) => {
   const nodeInfo = metadata.nodes.find((node) => node.node_id === nodeId);
   const scalarMap = metadata.scalar_map;
 
+  const [pagination, setPagination] = useState({
+    pageIndex: 0,
+    pageSize: PAGE_SIZE,
+  });
+
   const { data, isPending, error } = useQuery({
-    queryKey: ["nodedata", nodeId],
+    queryKey: ["nodedata", nodeId, pagination.pageIndex, pagination.pageSize],
     queryFn: async () => {
       if (!nodeInfo || nodeInfo.type === "scalar") {
         return { scalar: scalarMap[nodeId] };
       }
-      const data = await getNodeContents(sessionId || "", nodeId);
-      return { data: data };
+      const page = await getNodeContents(
+        sessionId || "",
+        nodeId,
+        pagination.pageIndex * pagination.pageSize,
+        pagination.pageSize
+      );
+      return { data: page.rows, total: page.total };
     },
+    placeholderData: keepPreviousData,
   });
 
   const columns = useMemo<ColumnDef<any>[]>(
@@ -61,7 +77,10 @@ const NodeInfo = ({ nodeId }: NodeInfoProps) => {
     data: data?.data || [],
     columns,
     getCoreRowModel: getCoreRowModel(),
-    getPaginationRowModel: getPaginationRowModel(),
+    manualPagination: true,
+    rowCount: data?.total ?? 0,
+    state: { pagination },
+    onPaginationChange: setPagination,
   });
 
   if (isPending) {
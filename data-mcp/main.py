@@ -1,119 +1,349 @@
 from fastmcp import FastMCP
-import requests
+import asyncio
+import httpx
+import importlib.util
+import os
+import sys
+import time
+from contextlib import AsyncExitStack, asynccontextmanager
+from pydantic import BaseModel
 from typing import Optional
 
-mcp = FastMCP("My MCP Server")
-
 BASE_URL = "http://127.0.0.1:8000/"
+# with DATA_MCP_EMBEDDED=1 the server app is loaded into this process and
+# called over ASGI instead of over a socket; install the embedded extra
+EMBEDDED = os.environ.get("DATA_MCP_EMBEDDED", "0") == "1"
+SERVER_DIR = os.environ.get(
+    "DATA_SERVER_DIR", os.path.join(os.path.dirname(__file__), "..", "server")
+)
+MAX_CONNECTIONS = int(os.environ.get("DATA_MCP_MAX_CONNECTIONS", 10))
+MAX_CONCURRENT_REQUESTS = int(os.environ.get("DATA_MCP_MAX_CONCURRENT", 8))
+CONNECT_TIMEOUT_SECONDS = 5
+REQUEST_TIMEOUT_SECONDS = float(os.environ.get("DATA_MCP_TIMEOUT_SECONDS", 300))
+JOB_POLL_SECONDS = 0.5
+JOB_TIMEOUT_SECONDS = 600
+
+_client: Optional[httpx.AsyncClient] = None
+_requests: Optional[asyncio.Semaphore] = None
+
+
+def load_server_app():
+    """Imports the server's FastAPI app from SERVER_DIR. Its sessions and
+    archives stay in SERVER_DIR, where running the server from its own
+    directory keeps them, unless SESSIONS_DIR and SESSION_ARCHIVE_DIR say
+    otherwise."""
+    server_dir = os.path.abspath(SERVER_DIR)
+    os.environ.setdefault("SESSIONS_DIR", os.path.join(server_dir, "sessions"))
+    os.environ.setdefault("SESSION_ARCHIVE_DIR", os.path.join(server_dir, "archive"))
+    if server_dir not in sys.path:
+        sys.path.insert(0, server_dir)
+    # the server's module is also called main; load it under another name
+    module = sys.modules.get("data_server")
+    if module is None:
+        spec = importlib.util.spec_from_file_location(
+            "data_server", os.path.join(server_dir, "main.py")
+        )
+        module = importlib.util.module_from_spec(spec)
+        sys.modules[spec.name] = module
+        spec.loader.exec_module(module)
+    return module.app
+
+
+class EmbeddedTransport(httpx.AsyncBaseTransport):
+    """Calls an ASGI app in this process. Unlike httpx.ASGITransport, a
+    request returns once its response is complete rather than once the app
+    returns, so the server's background tasks, such as 202 jobs, keep
+    running while their results are polled."""
+
+    def __init__(self, app):
+        self.app = app
+        self._tasks = set()
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        body = await request.aread()
+        scope = {
+            "type": "http",
+            "asgi": {"version": "3.0"},
+            "http_version": "1.1",
+            "method": request.method,
+            "headers": [(k.lower(), v) for (k, v) in request.headers.raw],
+            "scheme": request.url.scheme,
+            "path": request.url.path,
+            "raw_path": request.url.raw_path.split(b"?")[0],
+            "query_string": request.url.query,
+            "server": (request.url.host, request.url.port),
+            "client": ("127.0.0.1", 123),
+            "root_path": "",
+        }
+        response = {}
+        parts = []
+        complete = asyncio.Event()
+        received = False
+
+        async def receive():
+            nonlocal received
+            if received:
+                await complete.wait()
+                return {"type": "http.disconnect"}
+            received = True
+            return {"type": "http.request", "body": body, "more_body": False}
+
+        async def send(message):
+            if message["type"] == "http.response.start":
+                response["status"] = message["status"]
+                response["headers"] = message.get("headers", [])
+            elif message["type"] == "http.response.body":
+                parts.append(message.get("body", b""))
+                if not message.get("more_body", False):
+                    complete.set()
+
+        task = asyncio.create_task(self.app(scope, receive, send))
+        self._tasks.add(task)
+        task.add_done_callback(self._finished)
+        completed = asyncio.create_task(complete.wait())
+        await asyncio.wait([task, completed], return_when=asyncio.FIRST_COMPLETED)
+        if not complete.is_set():
+            completed.cancel()
+            # raises what the app raised before it responded
+            task.result()
+            raise RuntimeError("App returned without a complete response")
+        return httpx.Response(
+            response["status"], headers=response["headers"], content=b"".join(parts)
+        )
+
+    def _finished(self, task: asyncio.Task):
+        self._tasks.discard(task)
+        if not task.cancelled():
+            # background tasks fail after their response went out; nothing
+            # awaits them, so their errors are retrieved here
+            task.exception()
+
+    async def aclose(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+
+
+@asynccontextmanager
+async def lifespan(server):
+    """Holds one client for as long as the MCP server runs, so it keeps its
+    connections alive across tool calls. In embedded mode the server app's
+    own lifespan runs around it."""
+    global _client, _requests
+    timeout = httpx.Timeout(REQUEST_TIMEOUT_SECONDS, connect=CONNECT_TIMEOUT_SECONDS)
+    async with AsyncExitStack() as stack:
+        if EMBEDDED:
+            app = load_server_app()
+            await stack.enter_async_context(app.router.lifespan_context(app))
+            client = httpx.AsyncClient(
+                transport=EmbeddedTransport(app), base_url=BASE_URL, timeout=timeout
+            )
+        else:
+            client = httpx.AsyncClient(
+                base_url=BASE_URL,
+                timeout=timeout,
+                limits=httpx.Limits(
+                    max_connections=MAX_CONNECTIONS,
+                    max_keepalive_connections=MAX_CONNECTIONS,
+                ),
+            )
+        _client = await stack.enter_async_context(client)
+        _requests = asyncio.Semaphore(MAX_CONCURRENT_REQUESTS)
+        try:
+            yield
+        finally:
+            _client = None
+
+
+mcp = FastMCP("My MCP Server", lifespan=lifespan)
+
+
+async def request(method: str, url: str, params=None, json=None) -> httpx.Response:
+    if params is not None:
+        # httpx sends None as an empty value; leave those parameters out
+        params = {key: value for key, value in params.items() if value is not None}
+    async with _requests:
+        return await _client.request(method, url, params=params, json=json)
+
+
+async def tool_result(session_id: str, resp: httpx.Response):
+    """Returns the tool's result, waiting for it when the server answered with
+    a background job (202) instead of the result itself."""
+    resp.raise_for_status()
+    if resp.status_code != 202:
+        return resp.json()
+    job_id = resp.json()["job_id"]
+    url = f"session/{session_id}/jobs/{job_id}"
+    deadline = time.monotonic() + JOB_TIMEOUT_SECONDS
+    while time.monotonic() < deadline:
+        job = await request("GET", url)
+        job.raise_for_status()
+        job = job.json()
+        if job["status"] == "done":
+            return job["result"]
+        if job["status"] == "failed":
+            raise RuntimeError(job["error"])
+        await asyncio.sleep(JOB_POLL_SECONDS)
+    raise TimeoutError(f"Job {job_id} did not finish")
 
 
 @mcp.tool
-def get_metadata(session_id: str):
+async def get_metadata(session_id: str):
     """Returns all of the metadata (information on the session name, node IDs, and edges between nodes)."""
-    url = f"{BASE_URL}/session/{session_id}/metadata"
-    resp = requests.get(url)
+    url = f"session/{session_id}/metadata"
+    resp = await request("GET", url)
     resp.raise_for_status()
     return resp.json()
 
 
 @mcp.tool
-def get_node_info(session_id: str, node_id: str):
+async def get_node_info(session_id: str, node_id: str):
     """Returns the contents contained in the given node ID."""
-    url = f"{BASE_URL}/session/{session_id}/node_info"
+    url = f"session/{session_id}/node_info"
     params = {"session_id": session_id, "node_id": node_id}
-    resp = requests.get(url, params=params)
+    resp = await request("GET", url, params=params)
     resp.raise_for_status()
     return resp.json()
 
 
 @mcp.tool
-def make_sum(session_id: str, node_id: str, column: str, gb_col: Optional[str] = None):
+async def make_sum(
+    session_id: str, node_id: str, column: str, gb_col: Optional[str] = None
+):
     """Returns the sum(s) of the given column in the data contained in the given node_id (grouped values by gb_col if given), and creates a corresponding scalar node with an edge from the given node_id, in the session given by session_id."""
-    url = f"{BASE_URL}/tools/sum"
+    url = "tools/sum"
     params = {
         "session_id": session_id,
         "node_id": node_id,
         "column": column,
         "gb_col": gb_col,
     }
-    resp = requests.post(url, params=params)
-    resp.raise_for_status()
-    return resp.json()
+    resp = await request("POST", url, params=params)
+    return await tool_result(session_id, resp)
 
 
 @mcp.tool
-def make_mean(session_id: str, node_id: str, column: str, gb_col: Optional[str] = None):
+async def make_mean(
+    session_id: str, node_id: str, column: str, gb_col: Optional[str] = None
+):
     """Returns the mean of the given column in the data contained in the given node_id (grouped values by gb_col if given), and creates a corresponding scalar node with an edge from the given node_id, in the session given by session_id."""
-    url = f"{BASE_URL}/tools/mean"
+    url = "tools/mean"
     params = {
         "session_id": session_id,
         "node_id": node_id,
         "column": column,
         "gb_col": gb_col,
     }
-    resp = requests.post(url, params=params)
-    resp.raise_for_status()
-    return resp.json()
+    resp = await request("POST", url, params=params)
+    return await tool_result(session_id, resp)
 
 
 @mcp.tool
-def make_min(session_id: str, node_id: str, column: str, gb_col: Optional[str] = None):
+async def make_min(
+    session_id: str, node_id: str, column: str, gb_col: Optional[str] = None
+):
     """Returns the min of the given column in the data contained in the given node_id (grouped values by gb_col if given), and creates a corresponding scalar node with an edge from the given node_id, in the session given by session_id."""
-    url = f"{BASE_URL}/tools/min"
+    url = "tools/min"
     params = {
         "session_id": session_id,
         "node_id": node_id,
         "column": column,
         "gb_col": gb_col,
     }
-    resp = requests.post(url, params=params)
-    resp.raise_for_status()
-    return resp.json()
+    resp = await request("POST", url, params=params)
+    return await tool_result(session_id, resp)
 
 
 @mcp.tool
-def make_max(session_id: str, node_id: str, column: str, gb_col: Optional[str] = None):
+async def make_max(
+    session_id: str, node_id: str, column: str, gb_col: Optional[str] = None
+):
     """Returns the max of the given column in the data contained in the given node_id (grouped values by gb_col if given), and creates a corresponding scalar node with an edge from the given node_id, in the session given by session_id."""
-    url = f"{BASE_URL}/tools/max"
+    url = "tools/max"
     params = {
         "session_id": session_id,
         "node_id": node_id,
         "column": column,
         "gb_col": gb_col,
     }
-    resp = requests.post(url, params=params)
-    resp.raise_for_status()
-    return resp.json()
+    resp = await request("POST", url, params=params)
+    return await tool_result(session_id, resp)
 
 
 @mcp.tool
-def make_describe(session_id: str, node_id: str, column: str):
+async def make_aggregate(
+    session_id: str,
+    node_id: str,
+    columns: list[str],
+    funcs: list[str],
+    gb_cols: Optional[list[str]] = None,
+):
+    """Computes several aggregations at once over the given columns in the data contained in the given node_id (grouped by the gb_cols if given). funcs may contain sum, mean, min, max, count, nunique and std. Creates one node per (func, column) pair with an edge from the given node_id, in the session given by session_id, and returns the results and created node IDs keyed by "func(column)". Prefer this over several make_sum/make_mean/make_min/make_max calls on the same node."""
+    url = "tools/aggregate"
+    params = {
+        "session_id": session_id,
+        "node_id": node_id,
+        "columns": columns,
+        "funcs": funcs,
+        "gb_cols": gb_cols,
+    }
+    resp = await request("POST", url, params=params)
+    return await tool_result(session_id, resp)
+
+
+@mcp.tool
+async def make_describe(session_id: str, node_id: str, column: str):
     """Returns summary statistics on the given column in the data contained in the given node_id, and creates a corresponding data node with an edge from the given node_id, in the session given by session_id."""
-    url = f"{BASE_URL}/tools/describe"
+    url = "tools/describe"
     params = {"session_id": session_id, "node_id": node_id, "column": column}
-    resp = requests.post(url, params=params)
-    resp.raise_for_status()
-    return resp.json()
+    resp = await request("POST", url, params=params)
+    return await tool_result(session_id, resp)
 
 
 @mcp.tool
-def make_sample(session_id: str, node_id: str, n: int):
-    """Returns a random sample of n rows of the data contained in the given node_id, and creates a corresponding data node with an edge coming from the given node_id, in the given session_id."""
-    url = f"{BASE_URL}/tools/sample"
+async def make_sample(session_id: str, node_id: str, n: int):
+    """Takes a random sample of n rows of the data contained in the given node_id, and creates a corresponding data node with an edge coming from the given node_id, in the given session_id. Returns the new node_id, its row count and columns, and a preview of its first rows; use get_node_info with the node_id for the full data."""
+    url = "tools/sample"
     params = {"session_id": session_id, "node_id": node_id, "n": n}
-    resp = requests.post(url, params=params)
-    resp.raise_for_status()
-    return resp.json()
+    resp = await request("POST", url, params=params)
+    return await tool_result(session_id, resp)
 
 
 @mcp.tool
-def make_value_counts(session_id: str, node_id: str, column: str):
+async def make_value_counts(session_id: str, node_id: str, column: str):
     """Returns a list of the counts of unique values in the given column in data contained in the given node_id, and creates a corresponding data node with an edge coming from the given node_id, in the given session_id."""
-    url = f"{BASE_URL}/tools/value_counts"
+    url = "tools/value_counts"
     params = {"session_id": session_id, "node_id": node_id, "column": column}
-    resp = requests.post(url, params=params)
-    resp.raise_for_status()
-    return resp.json()
+    resp = await request("POST", url, params=params)
+    return await tool_result(session_id, resp)
+
+
+@mcp.tool
+async def make_filter(session_id: str, node_id: str, expr: dict):
+    """Keeps the rows of the data contained in the given node_id that match the boolean expression expr, and creates one corresponding data node with an edge coming from the given node_id, in the given session_id. expr is a tree of {"and": [expr, ...]}, {"or": [expr, ...]}, {"not": expr} and predicates {"column": ..., "op": ..., "value": ...}: op lt/le/gt/ge compare with a number, eq/ne with a number, string or boolean, in with a list of values, and is_null/not_null take no value. Example: {"and": [{"column": "age", "op": "gt", "value": 30}, {"column": "region", "op": "in", "value": ["NE", "NW"]}]}. Returns the new node_id, its row count and columns, and a preview of its first rows. Prefer one make_filter with "and" over several chained filters."""
+    url = "tools/filter_expr"
+    params = {"session_id": session_id, "node_id": node_id}
+    resp = await request("POST", url, params=params, json=expr)
+    return await tool_result(session_id, resp)
+
+
+class PipelineStep(BaseModel):
+    op: str
+    column: Optional[str] = None
+    filter_operator: Optional[str] = None
+    filter_value: Optional[float] = None
+    gb_col: Optional[str] = None
+    n: Optional[int] = None
+
+
+@mcp.tool
+async def run_pipeline(session_id: str, node_id: str, steps: list[PipelineStep]):
+    """Runs an ordered chain of operations starting from the data in the given node_id in one call, each step taking the previous step's output, in the session given by session_id. Each step has an op and that operation's parameters: filter (column, filter_operator one of lt/gt/eq/ne/le/ge, filter_value), sum/mean/min/max/count/nunique/std (column, optional gb_col), describe (column), value_counts (column), sample (n). An aggregation without gb_col produces a scalar, so it can only be the last step. Every step creates its node and edge as the single tools do. Returns each step's op and node_id, the final node_id, and the final step's result. Prefer this over several separate tool calls when the steps are known in advance."""
+    url = "tools/pipeline"
+    params = {"session_id": session_id, "node_id": node_id}
+    body = [step.model_dump(exclude_none=True) for step in steps]
+    resp = await request("POST", url, params=params, json=body)
+    return await tool_result(session_id, resp)
 
 
 def main():
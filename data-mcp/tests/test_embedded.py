@@ -0,0 +1,109 @@
+import asyncio
+import os
+import sys
+import threading
+
+import pytest
+from fastmcp import Client
+
+import main
+
+
+@pytest.fixture(scope="module")
+def server(tmp_path_factory):
+    """The server module, loaded in embedded mode with its storage in a
+    scratch directory."""
+    root = tmp_path_factory.mktemp("storage")
+    with pytest.MonkeyPatch.context() as patch:
+        patch.setattr(main, "EMBEDDED", True)
+        patch.setenv("SESSIONS_DIR", str(root / "sessions"))
+        patch.setenv("SESSION_ARCHIVE_DIR", str(root / "archive"))
+        main.load_server_app()
+        yield sys.modules["data_server"]
+
+
+async def new_session(rows: int) -> tuple[str, str]:
+    response = await main.request("POST", "session/init", {"session_name": "test"})
+    session_id = response.json()["session_id"]
+    csv = "a,b\n" + "".join(f"{i},{i % 3}\n" for i in range(rows))
+    response = await main._client.post(
+        f"session/{session_id}/upload",
+        files={"file": ("data.csv", csv, "text/csv")},
+    )
+    node_id = response.json()["node_id"]
+    # the upload is converted after its response
+    while True:
+        metadata = (await main.request("GET", f"session/{session_id}/metadata")).json()
+        node = next(n for n in metadata["nodes"] if n["node_id"] == node_id)
+        if node["ingest_status"] == "ready":
+            return session_id, node_id
+        await asyncio.sleep(0.05)
+
+
+def test_tools_call_the_server_in_process(monkeypatch, server):
+    cwd = os.getcwd()
+    closed = []
+
+    async def close():
+        closed.append(True)
+
+    # the server app's lifespan closes its MCP connection on the way out
+    monkeypatch.setattr(server.mcp_connection, "close", close)
+
+    async def run():
+        async with Client(main.mcp) as client:
+            session_id, node_id = await new_session(10)
+            result = await client.call_tool(
+                "make_aggregate",
+                {
+                    "session_id": session_id,
+                    "node_id": node_id,
+                    "columns": ["a"],
+                    "funcs": ["sum", "count"],
+                },
+            )
+            return session_id, result.structured_content
+
+    session_id, content = asyncio.run(run())
+    assert content["results"] == {"sum(a)": 45.0, "count(a)": 10}
+    assert closed == [True]
+    assert os.getcwd() == cwd
+    assert os.path.isdir(os.path.join(os.environ["SESSIONS_DIR"], session_id))
+
+
+def test_jobs_run_after_their_202_response(monkeypatch, server):
+    monkeypatch.setattr(server, "EXECUTOR_MIN_ROWS", 0)
+    monkeypatch.setattr(server, "ASYNC_JOB_MIN_ROWS", 0)
+    release = threading.Event()
+    complete_job = server.complete_job
+
+    def held_job(*args, **kwargs):
+        release.wait(10)
+        complete_job(*args, **kwargs)
+
+    monkeypatch.setattr(server, "complete_job", held_job)
+
+    async def run():
+        async with Client(main.mcp):
+            session_id, node_id = await new_session(10)
+            params = {"session_id": session_id, "node_id": node_id, "column": "a"}
+            # returns while the job is still held back
+            response = await asyncio.wait_for(
+                main.request("POST", "tools/sum", params), timeout=5
+            )
+            job = await main.request(
+                "GET", f"session/{session_id}/jobs/{response.json()['job_id']}"
+            )
+            release.set()
+            return (
+                response.status_code,
+                job.json()["status"],
+                await main.tool_result(session_id, response),
+            )
+
+    try:
+        status_code, job_status, result = asyncio.run(run())
+    finally:
+        release.set()
+    assert (status_code, job_status) == (202, "queued")
+    assert result == 45.0
@@ -0,0 +1,333 @@
+import json
+import math
+import os
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+import pyarrow.feather as feather
+
+from operations import Reservoir, group_key, to_json_scalar
+from sketches import HyperLogLog, KLLSketch, SpaceSaving
+from storage import _replace_atomically, _to_arrow, session_dir
+from streaming import DESCRIBE_QUANTILES, _batch_partial, _merge_partials
+
+# rows kept in a node's uniform sample for grouped estimates
+SAMPLE_ROWS = int(os.environ.get("APPROXIMATE_SAMPLE_ROWS", 10_000))
+# two-sided normal quantile of the 95% intervals around sample estimates
+Z_95 = 1.96
+MOMENTS = ("count", "max", "mean", "min", "m2", "sum")
+# grouped aggregations estimated from the sample; the others have no
+# useful bound when most rows are unseen
+SAMPLED_AGGREGATIONS = ("sum", "mean", "count")
+
+
+def _is_numeric(series: pd.Series) -> bool:
+    return pd.api.types.is_numeric_dtype(series) and not pd.api.types.is_bool_dtype(
+        series
+    )
+
+
+class SketchBuilder:
+    """Sketches of every column of a node and a uniform sample of its rows,
+    built in one pass over its batches.
+
+    Numeric columns get exact moments and a KLL quantile sketch; every column
+    gets a HyperLogLog distinct counter and space-saving top values.
+    """
+
+    def __init__(self, sample_rows: int = SAMPLE_ROWS):
+        self.num_rows = 0
+        self.columns: Dict[str, Dict[str, Any]] = {}
+        self.reservoir = Reservoir(sample_rows, 0)
+
+    def add(self, batch: pd.DataFrame):
+        self.num_rows += len(batch)
+        self.reservoir.add(batch)
+        for name in batch.columns:
+            series = batch[name]
+            column = self.columns.get(name)
+            if column is None:
+                column = self.columns[name] = {
+                    "dtype": str(series.dtype),
+                    "count": 0,
+                    "hll": HyperLogLog(),
+                    "top": SpaceSaving(),
+                }
+                if _is_numeric(series):
+                    column["kll"] = KLLSketch()
+                    column["moments"] = None
+            column["count"] += int(series.count())
+            column["hll"].add(series)
+            column["top"].add(series)
+            if "kll" in column and len(series):
+                column["kll"].add(series.to_numpy(dtype=float, na_value=np.nan))
+                column["moments"] = _merge_partials(
+                    column["moments"], _batch_partial(batch, name, None, MOMENTS)
+                )
+
+    def observe(self, batches: Iterable[pd.DataFrame]) -> Iterable[pd.DataFrame]:
+        """Passes ``batches`` through, adding each one on the way."""
+        for batch in batches:
+            self.add(batch)
+            yield batch
+
+    def sketches(self) -> Dict[str, Any]:
+        columns = {}
+        for name, column in self.columns.items():
+            entry = {
+                "dtype": column["dtype"],
+                "count": column["count"],
+                "hll": column["hll"].to_json(),
+                "top": column["top"].to_json(),
+            }
+            if "kll" in column:
+                entry["kll"] = column["kll"].to_json()
+                moments = column["moments"]
+                entry["moments"] = {
+                    stat: (
+                        to_json_scalar(moments[stat].iloc[0])
+                        if moments is not None and len(moments)
+                        else None
+                    )
+                    for stat in MOMENTS
+                }
+            columns[name] = entry
+        return {"num_rows": self.num_rows, "columns": columns}
+
+    def sample(self) -> pd.DataFrame:
+        sample = self.reservoir.rows()
+        if sample is None:
+            return pd.DataFrame(columns=list(self.columns))
+        return sample.reset_index(drop=True)
+
+
+class SketchStore:
+    """Sketches are JSON sidecars next to the node,
+    sessions/<id>/<node>.sketches.json, with the row sample in
+    <node>.sample.feather."""
+
+    def path(self, session_id: str, node_id: str) -> str:
+        return os.path.join(session_dir(session_id), f"{node_id}.sketches.json")
+
+    def sample_path(self, session_id: str, node_id: str) -> str:
+        return os.path.join(session_dir(session_id), f"{node_id}.sample.feather")
+
+    def read(
+        self, session_id: str, node_id: str
+    ) -> Optional[Tuple[Dict[str, Any], pd.DataFrame]]:
+        try:
+            with open(self.path(session_id, node_id)) as file:
+                sketches = json.load(file)
+            sample = feather.read_feather(self.sample_path(session_id, node_id))
+        except FileNotFoundError:
+            return None
+        return sketches, sample
+
+    def write(self, session_id: str, node_id: str, builder: SketchBuilder):
+        sample = _to_arrow(builder.sample())
+        sketches = builder.sketches()
+
+        def write(path):
+            with open(path, "w") as file:
+                json.dump(sketches, file, default=str)
+
+        # the sample goes first; the sidecar marks the pair complete
+        _replace_atomically(
+            self.sample_path(session_id, node_id),
+            lambda path: feather.write_feather(sample, path),
+        )
+        _replace_atomically(self.path(session_id, node_id), write)
+
+    def drop(self, session_id: str, node_id: str):
+        # the sidecar goes first, so a half-dropped pair reads as missing
+        for path in (
+            self.path(session_id, node_id),
+            self.sample_path(session_id, node_id),
+        ):
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+
+def _bounds(low, high) -> List[Any]:
+    return [to_json_scalar(low), to_json_scalar(high)]
+
+
+def _distinct(stats: Dict[str, Any]) -> Tuple[int, List[int]]:
+    top = stats["top"]
+    if top["floor"] == 0:
+        # every value has its own counter, so the count is exact
+        distinct = len(top["counters"])
+        return distinct, [distinct, distinct]
+    hll = HyperLogLog.from_json(stats["hll"])
+    # there cannot be more distinct values than non-null ones
+    count = stats["count"]
+    distinct = min(hll.count(), count)
+    error = Z_95 * 1.04 / math.sqrt(hll.m)
+    return distinct, [
+        int(distinct * (1 - error)),
+        min(int(math.ceil(distinct * (1 + error))), count),
+    ]
+
+
+def _column(sketches: Dict[str, Any], column: str) -> Dict[str, Any]:
+    try:
+        return sketches["columns"][column]
+    except KeyError:
+        raise ValueError(f"Column not found: {column}")
+
+
+def describe_estimate(sketches: Dict[str, Any], column: str) -> Dict[str, Any]:
+    """Approximate ``describe``. Count, mean, std, min and max are exact; the
+    quartiles are bounded by the KLL rank error at 99% confidence. For
+    non-numeric columns the distinct count is a HyperLogLog estimate and the
+    top value's frequency an upper bound."""
+    stats = _column(sketches, column)
+    if "kll" not in stats:
+        counters = stats["top"]["counters"]
+        unique, unique_bounds = _distinct(stats)
+        top, freq, error = counters[0] if counters else (None, None, 0)
+        return {
+            "result": {
+                "count": stats["count"],
+                "unique": unique,
+                "top": top,
+                "freq": freq,
+            },
+            "bounds": {
+                "unique": unique_bounds,
+                "freq": _bounds(None if freq is None else freq - error, freq),
+            },
+        }
+    moments = stats["moments"]
+    count = moments["count"] or 0
+    kll = KLLSketch.from_json(stats["kll"])
+    error = kll.rank_error()
+    quartiles = kll.quantiles(DESCRIBE_QUANTILES)
+    lows = kll.quantiles([max(0.0, q - error) for q in DESCRIBE_QUANTILES])
+    highs = kll.quantiles([min(1.0, q + error) for q in DESCRIBE_QUANTILES])
+    labels = ["25%", "50%", "75%"]
+    std = math.sqrt(moments["m2"] / (count - 1)) if count > 1 else None
+    result = {
+        "count": float(count),
+        "mean": moments["mean"] if count else None,
+        "std": std,
+        "min": moments["min"],
+    }
+    result.update(zip(labels, map(to_json_scalar, quartiles)))
+    result["max"] = moments["max"]
+    return {
+        "result": result,
+        "bounds": {
+            label: _bounds(low, high) for label, low, high in zip(labels, lows, highs)
+        },
+        "rank_error": error,
+    }
+
+
+def value_counts_estimate(sketches: Dict[str, Any], column: str) -> Dict[str, Any]:
+    """The most frequent values with upper-bound counts and their ranges.
+    Values not listed occur at most ``other_max`` times; when that is 0 the
+    counts are exact and complete."""
+    stats = _column(sketches, column)
+    top = stats["top"]
+    distinct, distinct_bounds = _distinct(stats)
+    return {
+        "result": {value: count for value, count, _ in top["counters"]},
+        "bounds": {
+            value: [count - error, count] for value, count, error in top["counters"]
+        },
+        "other_max": top["floor"],
+        "distinct_count": distinct,
+        "distinct_bounds": distinct_bounds,
+    }
+
+
+def _exact_aggregate(stats: Dict[str, Any], column: str, func: str):
+    if func == "count":
+        return stats["count"]
+    if func == "nunique":
+        return None
+    moments = stats.get("moments")
+    if moments is None:
+        raise ValueError(f"Column does not support approximate {func}: {column}")
+    if func == "std":
+        count = moments["count"] or 0
+        return math.sqrt(moments["m2"] / (count - 1)) if count > 1 else None
+    if func == "sum":
+        return moments["sum"] or 0
+    return moments[func]
+
+
+def _sample_estimate(
+    sample: pd.DataFrame, num_rows: int, column: str, func: str, gb_cols: List[str]
+) -> Tuple[pd.Series, pd.Series]:
+    n = len(sample)
+    # finite population correction: the interval closes as the sample
+    # approaches the whole node
+    fpc = max(0.0, 1 - n / num_rows) if num_rows else 0.0
+    values = sample[column]
+    if func == "mean":
+        partial = _batch_partial(sample, column, gb_cols, ("count", "mean", "m2"))
+        count = partial["count"]
+        # a group's M2 is 0 from its first row, but one row says nothing
+        # about the group's spread; the column's stands in for it
+        variance = (partial["m2"] / (count - 1)).where(count > 1, values.var())
+        error = Z_95 * np.sqrt(fpc * variance.fillna(0) / count)
+        return partial["mean"], error
+    keys = [sample[gb_col] for gb_col in gb_cols]
+    grouped = values.groupby(keys)
+    # a group's sum (or count) is num_rows times the sample mean of a variable
+    # that is the row's value (or 1) inside the group and 0 outside it
+    if func == "sum":
+        totals = grouped.sum()
+        squares = (values.astype(float) ** 2).groupby(keys).sum()
+    else:
+        totals = squares = grouped.count()
+    mean = totals / n
+    variance = ((squares - n * mean**2) / max(n - 1, 1)).clip(lower=0)
+    return num_rows * mean, Z_95 * num_rows * np.sqrt(fpc * variance / n)
+
+
+def aggregate_estimate(
+    sketches: Dict[str, Any],
+    sample: pd.DataFrame,
+    column: str,
+    func: str,
+    gb_cols: Optional[List[str]] = None,
+) -> Dict[str, Any]:
+    """An aggregation with its bounds. Ungrouped results come from the exact
+    moments (nunique from the distinct counter); grouped sum, mean and count
+    are estimated from the node's row sample with 95% intervals, covering
+    the groups that occur in the sample."""
+    stats = _column(sketches, column)
+    if not gb_cols:
+        if func == "nunique":
+            value, bounds = _distinct(stats)
+            return {"result": value, "bounds": bounds}
+        value = _exact_aggregate(stats, column, func)
+        return {"result": value, "bounds": [value, value]}
+    if func not in SAMPLED_AGGREGATIONS:
+        raise ValueError(
+            "Approximate grouped aggregation supports "
+            + ", ".join(SAMPLED_AGGREGATIONS)
+        )
+    for gb_col in gb_cols:
+        _column(sketches, gb_col)
+    if func != "count" and "moments" not in stats:
+        raise ValueError(f"Column does not support approximate {func}: {column}")
+    estimate, error = _sample_estimate(
+        sample, sketches["num_rows"], column, func, gb_cols
+    )
+    return {
+        "result": {
+            group_key(key): to_json_scalar(value) for key, value in estimate.items()
+        },
+        "bounds": {
+            group_key(key): _bounds(value - half, value + half)
+            for key, value, half in zip(estimate.index, estimate, error)
+        },
+        "sample_rows": len(sample),
+    }
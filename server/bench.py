@@ -0,0 +1,662 @@
+"""Benchmark and load test for the server and the MCP path.
+
+    python bench.py --rows 200000 --requests 40 --concurrency 4
+
+Starts the server, the data-mcp server and a stand-in for the Gemini API on
+local ports, in a scratch directory, so it runs offline and leaves no
+sessions behind. It uploads a generated CSV, then drives each endpoint and
+MCP tool with the given concurrency. For every endpoint it reports latency
+percentiles, throughput, and the peak resident memory of the server (with
+its worker processes) and of data-mcp while that endpoint ran. Use --json to
+keep a report for comparing runs.
+
+Memoized responses are recomputed on a hit unless --memo is given, so
+repeated calls measure the operation rather than the memo lookup.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import re
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Callable, Dict, List, Optional
+
+import httpx
+import numpy as np
+import pandas as pd
+from fastmcp import Client
+
+SERVER_DIR = os.path.dirname(os.path.abspath(__file__))
+MCP_DIR = os.path.join(SERVER_DIR, "..", "data-mcp")
+# data-mcp calls the server on this address and serves on port 9000
+SERVER_URL = "http://127.0.0.1:8000/"
+MCP_URL = "http://127.0.0.1:9000/mcp"
+STARTUP_SECONDS = 60
+POLL_SECONDS = 0.05
+
+
+def generate_csv(
+    path: str,
+    rows: int,
+    numeric_columns: int,
+    categorical_columns: int,
+    cardinality: int,
+    null_fraction: float,
+    seed: int,
+    chunk_rows: int = 100_000,
+):
+    """Writes a synthetic CSV: float columns num0.. (num0 normal, the others
+    log-normal), an integer id column and string columns cat0.. with
+    ``cardinality`` Zipf-distributed values. A ``null_fraction`` of each
+    float and string column is empty."""
+    rng = np.random.default_rng(seed)
+    categories = np.array([f"v{i}" for i in range(cardinality)], dtype=object)
+    weights = 1 / np.arange(1, cardinality + 1)
+    weights /= weights.sum()
+    with open(path, "w", newline="") as file:
+        for start in range(0, rows, chunk_rows):
+            n = min(chunk_rows, rows - start)
+            chunk = {"id": np.arange(start, start + n)}
+            for i in range(numeric_columns):
+                values = rng.normal(size=n) if i == 0 else rng.lognormal(size=n)
+                values[rng.random(n) < null_fraction] = np.nan
+                chunk[f"num{i}"] = values
+            for i in range(categorical_columns):
+                values = categories[rng.choice(cardinality, n, p=weights)]
+                values[rng.random(n) < null_fraction] = None
+                chunk[f"cat{i}"] = values
+            pd.DataFrame(chunk).to_csv(file, index=False, header=start == 0)
+
+
+class GeminiStub(ThreadingHTTPServer):
+    """Answers generateContent requests the way the model does in a tool-use
+    turn: first with a get_metadata call for the session named in the
+    prompt, then, once the call's response is in the conversation, with a
+    short text."""
+
+    def __init__(self):
+        super().__init__(("127.0.0.1", 0), GeminiHandler)
+        self.daemon_threads = True
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self.server_address[1]}"
+
+
+class GeminiHandler(BaseHTTPRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        contents = body.get("contents", [])
+        answered = any(
+            "functionResponse" in part for part in contents[-1].get("parts", [])
+        )
+        if answered:
+            part = {"text": "Done."}
+        else:
+            text = " ".join(
+                part.get("text", "") for part in contents[0].get("parts", [])
+            )
+            match = re.search(r"Session ID: (\S+)", text)
+            session_id = match.group(1) if match else ""
+            part = {
+                "functionCall": {
+                    "name": "get_metadata",
+                    "args": {"session_id": session_id},
+                }
+            }
+        response = json.dumps(
+            {
+                "candidates": [
+                    {
+                        "content": {"role": "model", "parts": [part]},
+                        "finishReason": "STOP",
+                        "index": 0,
+                    }
+                ]
+            }
+        )
+        streamed = "streamGenerateContent" in self.path
+        payload = (f"data: {response}\r\n\r\n" if streamed else response).encode()
+        self.send_response(200)
+        content_type = "text/event-stream" if streamed else "application/json"
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+
+class RssMonitor:
+    """Samples the resident memory of process trees in a background thread.
+    Reads /proc, so it reports nothing on other platforms."""
+
+    def __init__(self, roots: Dict[str, int], interval: float = 0.02):
+        self.roots = roots
+        self.interval = interval
+        self.available = os.path.exists("/proc/self/statm")
+        self._page = os.sysconf("SC_PAGE_SIZE") if self.available else 0
+        self._peaks: Dict[str, int] = dict.fromkeys(roots, 0)
+        self._trees: Dict[str, List[int]] = {name: [] for name in roots}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _children(self) -> Dict[int, List[int]]:
+        children: Dict[int, List[int]] = {}
+        for entry in os.listdir("/proc"):
+            if not entry.isdigit():
+                continue
+            try:
+                with open(f"/proc/{entry}/stat") as file:
+                    # the command name may contain spaces; fields follow ")"
+                    ppid = int(file.read().rsplit(")", 1)[1].split()[1])
+            except (OSError, IndexError, ValueError):
+                continue
+            children.setdefault(ppid, []).append(int(entry))
+        return children
+
+    def _refresh_trees(self):
+        children = self._children()
+        for name, root in self.roots.items():
+            tree, pending = [], [root]
+            while pending:
+                pid = pending.pop()
+                tree.append(pid)
+                pending += children.get(pid, [])
+            self._trees[name] = tree
+
+    def _rss(self, pid: int) -> int:
+        try:
+            with open(f"/proc/{pid}/statm") as file:
+                return int(file.read().split()[1]) * self._page
+        except (OSError, IndexError, ValueError):
+            return 0
+
+    def _run(self):
+        samples = 0
+        while not self._stop.wait(self.interval):
+            if samples % 25 == 0:
+                self._refresh_trees()
+            samples += 1
+            with self._lock:
+                for name, tree in self._trees.items():
+                    total = sum(self._rss(pid) for pid in tree)
+                    self._peaks[name] = max(self._peaks[name], total)
+
+    def start(self):
+        if self.available:
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def reset(self) -> None:
+        with self._lock:
+            self._peaks = dict.fromkeys(self.roots, 0)
+
+    def peaks_mb(self) -> Dict[str, Optional[float]]:
+        with self._lock:
+            return {
+                name: round(peak / 1024**2, 1) if self.available else None
+                for name, peak in self._peaks.items()
+            }
+
+
+async def finish_job(client: httpx.AsyncClient, session_id: str, resp):
+    """Waits for a 202 job response to complete, like the MCP client does."""
+    resp.raise_for_status()
+    if resp.status_code != 202:
+        return resp
+    job_id = resp.json()["job_id"]
+    while True:
+        job = await client.get(f"session/{session_id}/jobs/{job_id}")
+        job.raise_for_status()
+        status = job.json()["status"]
+        if status == "done":
+            return job
+        if status == "failed":
+            raise RuntimeError(job.json()["error"])
+        await asyncio.sleep(POLL_SECONDS)
+
+
+async def wait_ingested(client: httpx.AsyncClient, session_id: str, node_id: str):
+    while True:
+        metadata = (await client.get(f"session/{session_id}/metadata")).json()
+        node = next(n for n in metadata["nodes"] if n["node_id"] == node_id)
+        if node.get("ingest_status") in (None, "ready"):
+            return
+        if node.get("ingest_status") == "failed":
+            raise RuntimeError("Ingest failed")
+        await asyncio.sleep(POLL_SECONDS)
+
+
+async def upload(client: httpx.AsyncClient, csv: bytes) -> Dict[str, Any]:
+    init = await client.post("session/init", params={"session_name": "bench"})
+    session_id = init.json()["session_id"]
+    start = time.perf_counter()
+    resp = await client.post(
+        f"session/{session_id}/upload",
+        files={"file": ("bench.csv", csv, "text/csv")},
+    )
+    resp.raise_for_status()
+    uploaded = time.perf_counter()
+    node_id = resp.json()["node_id"]
+    await wait_ingested(client, session_id, node_id)
+    return {
+        "session_id": session_id,
+        "node_id": node_id,
+        "upload": uploaded - start,
+        "ingest": time.perf_counter() - uploaded,
+    }
+
+
+def summarize(
+    latencies: List[float], errors: int, elapsed: float, rss: Dict[str, Any]
+) -> Dict[str, Any]:
+    ms = np.array(latencies) * 1000
+    p50, p95, p99 = np.percentile(ms, [50, 95, 99]) if len(ms) else [np.nan] * 3
+    return {
+        "requests": len(latencies),
+        "errors": errors,
+        "p50_ms": round(float(p50), 2),
+        "p95_ms": round(float(p95), 2),
+        "p99_ms": round(float(p99), 2),
+        "throughput_rps": round(len(latencies) / elapsed, 2) if elapsed else None,
+        "peak_rss_mb": rss,
+    }
+
+
+async def drive(call: Callable[[int], Any], requests: int, concurrency: int) -> tuple:
+    """Runs ``call(i)`` for i in range(requests) on ``concurrency`` workers
+    and returns the latencies, the error count and the elapsed time."""
+    latencies: List[float] = []
+    errors = 0
+    counter = iter(range(requests))
+
+    async def worker():
+        nonlocal errors
+        for i in counter:
+            start = time.perf_counter()
+            try:
+                await call(i)
+            except Exception as e:
+                errors += 1
+                if errors == 1:
+                    print(f"    error: {e!r}"[:200], file=sys.stderr)
+                continue
+            latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    await asyncio.gather(*[worker() for _ in range(concurrency)])
+    return latencies, errors, time.perf_counter() - start
+
+
+def http_scenarios(args, session_id: str, node_id: str) -> Dict[str, Callable]:
+    """One request builder per endpoint. Filters draw a new threshold on every
+    call so each one computes a new node."""
+    rng = random.Random(args.seed)
+    numeric = [f"num{i}" for i in range(args.numeric_columns)]
+    categorical = [f"cat{i}" for i in range(args.categorical_columns)]
+    group = categorical[0] if categorical else None
+    tool = {"session_id": session_id, "node_id": node_id}
+
+    def post(path, params=None, body=None):
+        if params is not None:
+            # httpx sends None as an empty value; leave those parameters out
+            params = {key: value for key, value in params.items() if value is not None}
+
+        async def call(client):
+            resp = await client.post(path, params=params, json=body)
+            return await finish_job(client, session_id, resp)
+
+        return call
+
+    scenarios = {
+        "filter": lambda i: post(
+            "tools/filter/",
+            dict(
+                tool,
+                column=numeric[0],
+                filter_operator="gt",
+                filter_value=rng.uniform(0, 3),
+            ),
+        ),
+        "filter_expr": lambda i: post(
+            "tools/filter_expr",
+            tool,
+            {
+                "and": [{"column": numeric[0], "op": "lt", "value": rng.uniform(-1, 1)}]
+                + (
+                    [{"column": group, "op": "in", "value": ["v0", "v1", "v2"]}]
+                    if group
+                    else []
+                )
+            },
+        ),
+        "describe": lambda i: post("tools/describe", dict(tool, column=numeric[0])),
+        "describe_approximate": lambda i: post(
+            "tools/describe", dict(tool, column=numeric[0], approximate=True)
+        ),
+        "sample": lambda i: post("tools/sample", dict(tool, n=100)),
+        "node_info": lambda i: lambda client: client.get(
+            f"session/{session_id}/node_info",
+            params=dict(
+                node_id=node_id,
+                offset=rng.randrange(max(args.rows - args.page_rows, 1)),
+                limit=args.page_rows,
+            ),
+        ),
+        "export": lambda i: post(f"session/{session_id}/export/{node_id}"),
+    }
+    for func in ("sum", "mean", "min", "max"):
+        scenarios[func] = lambda i, func=func: post(
+            f"tools/{func}",
+            dict(
+                tool,
+                column=numeric[i % len(numeric)],
+                gb_col=group if i % 2 else None,
+            ),
+        )
+    scenarios["aggregate"] = lambda i: post(
+        "tools/aggregate",
+        dict(
+            tool,
+            columns=numeric[:2],
+            funcs=["sum", "mean", "std", "count"],
+            gb_cols=[group] if group else None,
+        ),
+    )
+    if group:
+        scenarios["value_counts"] = lambda i: post(
+            "tools/value_counts", dict(tool, column=group)
+        )
+        scenarios["pipeline"] = lambda i: post(
+            "tools/pipeline",
+            tool,
+            [
+                {
+                    "op": "filter",
+                    "column": numeric[0],
+                    "filter_operator": "gt",
+                    "filter_value": rng.uniform(-1, 1),
+                },
+                {"op": "mean", "column": numeric[-1], "gb_col": group},
+            ],
+        )
+    return scenarios
+
+
+def mcp_scenarios(args, session_id: str, node_id: str) -> Dict[str, tuple]:
+    """The MCP tools to call, each with a builder for its arguments."""
+    rng = random.Random(args.seed)
+    tool = {"session_id": session_id, "node_id": node_id}
+    return {
+        "mcp:get_metadata": ("get_metadata", lambda i: {"session_id": session_id}),
+        "mcp:make_sum": ("make_sum", lambda i: dict(tool, column="num0")),
+        "mcp:make_describe": ("make_describe", lambda i: dict(tool, column="num0")),
+        "mcp:make_filter": (
+            "make_filter",
+            lambda i: dict(
+                tool, expr={"column": "num0", "op": "gt", "value": rng.uniform(0, 3)}
+            ),
+        ),
+    }
+
+
+@contextmanager
+def services(args, workdir: str):
+    """Runs the Gemini stand-in, the server and data-mcp for the benchmark and
+    stops them afterwards."""
+    stub = GeminiStub()
+    threading.Thread(target=stub.serve_forever, daemon=True).start()
+    env = dict(
+        os.environ,
+        GOOGLE_API_KEY="bench",
+        GOOGLE_GEMINI_BASE_URL=stub.url,
+        MCP_URL=MCP_URL,
+    )
+    if not args.memo:
+        env["MEMO_CONTENT_MAX_BYTES"] = "0"
+    logs = open(os.path.join(workdir, "services.log"), "w")
+    server = subprocess.Popen(
+        [
+            *args.server_python.split(),
+            "-m",
+            "uvicorn",
+            "main:app",
+            "--app-dir",
+            SERVER_DIR,
+            "--port",
+            "8000",
+            "--log-level",
+            "warning",
+        ],
+        cwd=workdir,
+        env=env,
+        stdout=logs,
+        stderr=subprocess.STDOUT,
+    )
+    processes = {"server": server}
+    if not args.skip_mcp:
+        processes["mcp"] = subprocess.Popen(
+            [*args.mcp_python.split(), os.path.join(MCP_DIR, "main.py")],
+            cwd=workdir,
+            env=env,
+            stdout=logs,
+            stderr=subprocess.STDOUT,
+        )
+    try:
+        yield processes
+    finally:
+        for process in processes.values():
+            process.terminate()
+        for process in processes.values():
+            try:
+                process.wait(10)
+            except subprocess.TimeoutExpired:
+                process.kill()
+        stub.shutdown()
+        logs.close()
+
+
+async def wait_for_services(client: httpx.AsyncClient, processes):
+    deadline = time.monotonic() + STARTUP_SECONDS
+    while True:
+        for name, process in processes.items():
+            if process.poll() is not None:
+                raise RuntimeError(f"{name} exited; see services.log")
+        try:
+            if (await client.get("cache/stats")).status_code == 200:
+                break
+        except httpx.TransportError:
+            pass
+        if time.monotonic() > deadline:
+            raise RuntimeError("Server did not start")
+        await asyncio.sleep(0.2)
+    if "mcp" not in processes:
+        return
+    while True:
+        try:
+            async with Client(MCP_URL) as mcp:
+                await mcp.list_tools()
+            return
+        except Exception:
+            if time.monotonic() > deadline:
+                raise RuntimeError("MCP server did not start")
+            await asyncio.sleep(0.2)
+
+
+async def run(args, workdir: str, processes) -> Dict[str, Any]:
+    monitor = RssMonitor({name: p.pid for name, p in processes.items()})
+    monitor.start()
+    report: Dict[str, Any] = {
+        "config": {
+            key: getattr(args, key)
+            for key in (
+                "rows",
+                "numeric_columns",
+                "categorical_columns",
+                "cardinality",
+                "requests",
+                "concurrency",
+                "memo",
+                "seed",
+            )
+        },
+        "endpoints": {},
+    }
+    selected = set(args.endpoints.split(",")) if args.endpoints else None
+
+    def wanted(name: str) -> bool:
+        return selected is None or name in selected
+
+    def record(name, latencies, errors, elapsed):
+        report["endpoints"][name] = result = summarize(
+            latencies, errors, elapsed, monitor.peaks_mb()
+        )
+        print(
+            f"{name:24} n={result['requests']:<5} err={errors:<3} "
+            f"p50={result['p50_ms']:>9.2f}ms p95={result['p95_ms']:>9.2f}ms "
+            f"p99={result['p99_ms']:>9.2f}ms {result['throughput_rps']:>8} req/s "
+            f"rss={result['peak_rss_mb']}"
+        )
+
+    csv_path = os.path.join(workdir, "bench.csv")
+    generate_csv(
+        csv_path,
+        args.rows,
+        args.numeric_columns,
+        args.categorical_columns,
+        args.cardinality,
+        args.null_fraction,
+        args.seed,
+    )
+    with open(csv_path, "rb") as file:
+        csv = file.read()
+    report["config"]["csv_mb"] = round(len(csv) / 1024**2, 1)
+
+    limits = httpx.Limits(max_connections=args.concurrency)
+    async with httpx.AsyncClient(
+        base_url=SERVER_URL, timeout=args.timeout, limits=limits
+    ) as client:
+        await wait_for_services(client, processes)
+        dataset = await upload(client, csv)
+        session_id, node_id = dataset["session_id"], dataset["node_id"]
+
+        if wanted("upload"):
+            monitor.reset()
+            uploads: List[Dict[str, Any]] = []
+
+            async def upload_once(i):
+                uploads.append(await upload(client, csv))
+
+            _, errors, elapsed = await drive(
+                upload_once, args.upload_requests, min(args.concurrency, 2)
+            )
+            for stage in ("upload", "ingest"):
+                record(stage, [u[stage] for u in uploads], errors, elapsed)
+
+        for name, make_call in http_scenarios(args, session_id, node_id).items():
+            if not wanted(name):
+                continue
+            monitor.reset()
+
+            async def call(i, make_call=make_call):
+                resp = await make_call(i)(client)
+                resp.raise_for_status()
+
+            record(name, *await drive(call, args.requests, args.concurrency))
+
+        if "mcp" in processes:
+            async with Client(MCP_URL, timeout=args.timeout) as mcp:
+                for name, (tool, make_args) in mcp_scenarios(
+                    args, session_id, node_id
+                ).items():
+                    if not wanted(name):
+                        continue
+                    monitor.reset()
+
+                    async def call(i, tool=tool, make_args=make_args):
+                        await mcp.call_tool(tool, make_args(i))
+
+                    record(name, *await drive(call, args.requests, args.concurrency))
+
+            if wanted("gemini"):
+                monitor.reset()
+
+                async def ask(i):
+                    resp = await client.post(
+                        "gemini",
+                        params={
+                            "session_id": session_id,
+                            "prompt": "Summarize the data",
+                        },
+                    )
+                    resp.raise_for_status()
+                    if "TEXT::" not in resp.text:
+                        raise RuntimeError(f"Unexpected response: {resp.text[:100]}")
+
+                record(
+                    "gemini", *await drive(ask, args.gemini_requests, args.concurrency)
+                )
+    monitor.stop()
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--rows", type=int, default=100_000)
+    parser.add_argument("--numeric-columns", type=int, default=4)
+    parser.add_argument("--categorical-columns", type=int, default=2)
+    parser.add_argument("--cardinality", type=int, default=100)
+    parser.add_argument("--null-fraction", type=float, default=0.01)
+    parser.add_argument("--requests", type=int, default=20, help="per endpoint")
+    parser.add_argument("--upload-requests", type=int, default=3)
+    parser.add_argument("--gemini-requests", type=int, default=10)
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--page-rows", type=int, default=1000)
+    parser.add_argument(
+        "--endpoints", help="comma-separated subset, e.g. filter,describe,mcp:make_sum"
+    )
+    parser.add_argument("--memo", action="store_true", help="answer repeats from memo")
+    parser.add_argument("--skip-mcp", action="store_true")
+    parser.add_argument("--timeout", type=float, default=600)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--server-python", default=sys.executable)
+    parser.add_argument(
+        "--mcp-python",
+        default=sys.executable,
+        help="interpreter with data-mcp's dependencies, e.g. "
+        "'uv run --project ../data-mcp python'",
+    )
+    parser.add_argument("--json", help="write the report to this file")
+    parser.add_argument("--keep", action="store_true", help="keep the scratch dir")
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="bench-")
+    try:
+        with services(args, workdir) as processes:
+            report = asyncio.run(run(args, workdir, processes))
+        if args.json:
+            with open(args.json, "w") as file:
+                json.dump(report, file, indent=2)
+    finally:
+        if args.keep:
+            print(f"scratch directory: {workdir}")
+        else:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+import threading
+from collections import OrderedDict
+from typing import Callable, Dict, Hashable
+
+import pandas as pd
+
+
+def dataframe_nbytes(dataframe: pd.DataFrame) -> int:
+    return int(dataframe.memory_usage(index=True, deep=True).sum())
+
+
+class NodeCache:
+    """Process-wide LRU cache of node DataFrames bounded by a byte budget.
+
+    Cached frames are shared between requests, so callers must treat them as
+    read-only.
+    """
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self._entries: "OrderedDict[Hashable, tuple[pd.DataFrame, int]]" = OrderedDict()
+        self._nbytes = 0
+        self._lock = threading.Lock()
+        self._load_locks: Dict[Hashable, threading.Lock] = {}
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __contains__(self, key: Hashable) -> bool:
+        with self._lock:
+            return key in self._entries
+
+    def get(self, key: Hashable):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key: Hashable, dataframe: pd.DataFrame):
+        nbytes = dataframe_nbytes(dataframe)
+        with self._lock:
+            self._discard(key)
+            if nbytes > self.max_bytes:
+                return
+            self._entries[key] = (dataframe, nbytes)
+            self._nbytes += nbytes
+            while self._nbytes > self.max_bytes:
+                _, (_, evicted_nbytes) = self._entries.popitem(last=False)
+                self._nbytes -= evicted_nbytes
+                self.evictions += 1
+
+    def get_or_load(
+        self, key: Hashable, loader: Callable[[], pd.DataFrame]
+    ) -> pd.DataFrame:
+        dataframe = self.get(key)
+        if dataframe is not None:
+            return dataframe
+        # one loader per key so concurrent misses parse the file only once
+        with self._lock:
+            load_lock = self._load_locks.setdefault(key, threading.Lock())
+        with load_lock:
+            with self._lock:
+                entry = self._entries.get(key)
+                if entry is not None:
+                    self._entries.move_to_end(key)
+                    return entry[0]
+            dataframe = loader()
+            self.put(key, dataframe)
+        with self._lock:
+            self._load_locks.pop(key, None)
+        return dataframe
+
+    def invalidate(self, key: Hashable):
+        with self._lock:
+            self._discard(key)
+
+    def invalidate_session(self, session_id: str):
+        with self._lock:
+            for key in [k for k in self._entries if k[0] == session_id]:
+                self._discard(key)
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "bytes": self._nbytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
+
+    def _discard(self, key: Hashable):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._nbytes -= entry[1]
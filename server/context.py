@@ -0,0 +1,144 @@
+import json
+import re
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, List, Optional
+
+import pandas as pd
+
+# rough size of a token in characters, enough to keep prompts within budget
+CHARS_PER_TOKEN = 4
+
+
+def estimate_tokens(text: str) -> int:
+    return len(text) // CHARS_PER_TOKEN + 1
+
+
+def render(summary: Dict[str, Any]) -> str:
+    return json.dumps(summary, separators=(",", ":"), default=str)
+
+
+def sample_columns(sample: pd.DataFrame) -> Dict[str, List[Any]]:
+    return sample.astype(object).where(sample.notna(), None).to_dict("list")
+
+
+class SummaryCache:
+    """Rendered per-node summaries, so building a prompt doesn't read every
+    node again. Entries are dropped least recently used first beyond
+    ``max_entries``, and explicitly when a node's contents change."""
+
+    def __init__(self, max_entries: int = 4096):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[Hashable, str]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get_or_build(
+        self, key: Hashable, build: Callable[[], Optional[str]]
+    ) -> Optional[str]:
+        """The cached summary for ``key``; ``build`` may return None for a
+        summary that should not be kept."""
+        with self._lock:
+            text = self._entries.get(key)
+            if text is not None:
+                self._entries.move_to_end(key)
+                return text
+        text = build()
+        if text is None:
+            return None
+        with self._lock:
+            self._entries[key] = text
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return text
+
+    def invalidate(self, session_id: str, node_id: Optional[str] = None):
+        with self._lock:
+            for key in list(self._entries):
+                if key[0] == session_id and (node_id is None or key[1] == node_id):
+                    del self._entries[key]
+
+
+def rank_nodes(
+    prompt: str, nodes: List[Dict[str, Any]], edges: List[Dict[str, Any]]
+) -> List[Dict[str, Any]]:
+    """Nodes ordered by how relevant they look to the prompt: ones it names
+    by id first, then ones whose columns or name it mentions, then leaves
+    of the graph and recently created nodes."""
+    text = prompt.lower()
+    words = set(re.findall(r"\w+", text))
+    parents = {edge["src_id"] for edge in edges}
+
+    def score(position: int, node: Dict[str, Any]) -> float:
+        value = 0.0
+        if node["node_id"].lower() in text or node["node_id"][:8].lower() in words:
+            value += 100
+        name = re.sub(r"\W", "", node.get("node_name", "")).lower()
+        if name and name in words:
+            value += 5
+        value += sum(
+            3 for column in node.get("columns", []) if str(column).lower() in words
+        )
+        if node["node_id"] not in parents:
+            value += 2
+        return value + position / max(len(nodes), 1)
+
+    ranked = sorted(enumerate(nodes), key=lambda item: -score(*item))
+    return [node for _, node in ranked]
+
+
+def build_context(
+    session_id: str,
+    prompt: str,
+    nodes: List[Dict[str, Any]],
+    edges: List[Dict[str, Any]],
+    summary: Callable[[Dict[str, Any]], str],
+    token_budget: int,
+) -> str:
+    """The prompt text for the model. Node summaries are added in order of
+    relevance while they fit in ``token_budget``; the rest are only listed
+    by id so the model can look them up with the metadata tools."""
+    header = f"Session ID: {session_id}\nNodes:\n"
+    footer = f"Instruction: {prompt}"
+    remaining = token_budget - estimate_tokens(header) - estimate_tokens(footer)
+    # room for listing left-out nodes, given back when none are
+    label = f"Other nodes ({len(nodes)}, use get_node_info for details): "
+    remaining -= estimate_tokens(label)
+    included, omitted = [], []
+    for node in rank_nodes(prompt, nodes, edges):
+        text = summary(node)
+        cost = estimate_tokens(text)
+        if cost <= remaining:
+            included.append((node["node_id"], text))
+            remaining -= cost
+        else:
+            omitted.append(node["node_id"])
+    if omitted:
+        label = f"Other nodes ({len(omitted)}, use get_node_info for details): "
+    else:
+        remaining += estimate_tokens(label)
+    shown = {node_id for node_id, _ in included}
+    lines = []
+    edges_label = "Edges:\n"
+    for edge in edges:
+        if edge["src_id"] in shown or edge["dst_id"] in shown:
+            line = f"{edge['src_id']} -> {edge['dst_id']}: {edge['operation']}"
+            cost = estimate_tokens(line)
+            if not lines:
+                cost += estimate_tokens(edges_label)
+            if cost > remaining:
+                break
+            lines.append(line)
+            remaining -= cost
+    parts = [header, "\n".join(text for _, text in included), "\n"]
+    if lines:
+        parts += [edges_label, "\n".join(lines), "\n"]
+    if omitted:
+        listed = []
+        for node_id in omitted:
+            if estimate_tokens(node_id) + 1 > remaining:
+                break
+            listed.append(node_id)
+            remaining -= estimate_tokens(node_id) + 1
+        parts.append(f"{label}{', '.join(listed)}\n")
+    parts.append(footer)
+    return "".join(parts)
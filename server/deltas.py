@@ -0,0 +1,81 @@
+import os
+from typing import Any, List, Optional
+
+import pandas as pd
+import pyarrow.feather as feather
+
+from operations import aggregate_scalar
+from storage import _replace_atomically, _to_arrow, session_dir
+from streaming import PARTIALS, _batch_partial, _finish, _merge_partials
+
+# aggregations whose results are updated from partials when rows are
+# appended to their source; the others are recomputed
+INCREMENTAL_AGGREGATIONS = tuple(PARTIALS)
+
+
+def aggregate_partial(
+    dataset: pd.DataFrame, column: str, func: str, gb_cols: Optional[List[str]]
+) -> pd.DataFrame:
+    """Per-group partial statistics of ``func`` over ``dataset``."""
+    return _batch_partial(dataset, column, gb_cols, PARTIALS[func])
+
+
+def merge_aggregate(left: pd.DataFrame, right: pd.DataFrame) -> pd.DataFrame:
+    return _merge_partials(left, right)
+
+
+def partial_result(
+    partial: pd.DataFrame, column: str, func: str, gb_cols: Optional[List[str]]
+) -> Any:
+    """The aggregation's result as ``aggregate`` returns it: a Series by group,
+    or a scalar."""
+    values = _finish(partial, func)
+    if gb_cols:
+        return values.sort_index().rename(column)
+    return aggregate_scalar(values.iloc[0], func) if len(values) else None
+
+
+def value_counts_partial(dataset: pd.DataFrame, column: str) -> pd.DataFrame:
+    return dataset[column].value_counts().to_frame()
+
+
+def merge_value_counts(left: pd.DataFrame, right: pd.DataFrame) -> pd.DataFrame:
+    counts = left["count"].add(right["count"], fill_value=0).astype("int64")
+    return counts.to_frame()
+
+
+def value_counts_result(partial: pd.DataFrame, column: str) -> pd.DataFrame:
+    counts = partial["count"].sort_values(ascending=False, kind="stable")
+    counts.index.name = column
+    return counts.to_frame()
+
+
+class PartialStore:
+    """The partials an aggregate or value_counts node was last computed from,
+    so appended rows can be merged in without reading the source again:
+    sessions/<id>/<node>.partials.feather, the group keys as key columns."""
+
+    def path(self, session_id: str, node_id: str) -> str:
+        return os.path.join(session_dir(session_id), f"{node_id}.partials.feather")
+
+    def read(self, session_id: str, node_id: str) -> Optional[pd.DataFrame]:
+        try:
+            table = feather.read_feather(self.path(session_id, node_id))
+        except FileNotFoundError:
+            return None
+        keys = [column for column in table.columns if column.startswith("__key")]
+        return table.set_index(keys)
+
+    def write(self, session_id: str, node_id: str, partial: pd.DataFrame):
+        keys = [f"__key{i}" for i in range(partial.index.nlevels)]
+        table = _to_arrow(partial.reset_index(names=keys))
+        _replace_atomically(
+            self.path(session_id, node_id),
+            lambda path: feather.write_feather(table, path),
+        )
+
+    def drop(self, session_id: str, node_id: str):
+        try:
+            os.remove(self.path(session_id, node_id))
+        except FileNotFoundError:
+            pass
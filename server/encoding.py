@@ -0,0 +1,176 @@
+import datetime
+import json
+import math
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+from fastapi.responses import JSONResponse, Response
+
+from instrumentation import stage
+from storage import _to_arrow
+
+try:
+    import orjson
+except ImportError:  # optional; the stdlib encoder is used without it
+    orjson = None
+
+DATA_FORMATS = ("preview", "split", "columnar")
+ARROW_MEDIA_TYPE = "application/vnd.apache.arrow.stream"
+
+
+def _default(value: Any) -> Any:
+    """What orjson writes for the pandas values it doesn't know."""
+    if value is pd.NaT:
+        return None
+    if isinstance(value, pd.Timestamp):
+        return value.isoformat()
+    raise TypeError(f"Type is not JSON serializable: {type(value).__name__}")
+
+
+def _plain(value: Any) -> Any:
+    """``value`` in the types the stdlib encoder takes, converted so that it
+    writes the same JSON as orjson: non-finite floats as null, numpy values
+    as their Python equivalents and dates and times as ISO strings."""
+    if isinstance(value, float):
+        return value if math.isfinite(value) else None
+    if isinstance(value, dict):
+        return {
+            key if isinstance(key, str) else _plain(key): _plain(item)
+            for key, item in value.items()
+        }
+    if isinstance(value, (list, tuple, np.ndarray)):
+        return [_plain(item) for item in value]
+    if isinstance(value, np.datetime64):
+        value = pd.Timestamp(value)
+    elif isinstance(value, np.generic):
+        return _plain(value.item())
+    if value is pd.NaT:
+        return None
+    if isinstance(value, (datetime.date, datetime.time)):
+        return value.isoformat()
+    return value
+
+
+def _orjson_dumps(content: Any) -> bytes:
+    return orjson.dumps(
+        content,
+        default=_default,
+        option=orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS,
+    )
+
+
+class FastJSONResponse(Response):
+    """Serialises with orjson, which writes numpy arrays directly and encodes
+    NaN as null."""
+
+    media_type = "application/json"
+
+    def render(self, content: Any) -> bytes:
+        return _orjson_dumps(content)
+
+
+def dumps(content: Any) -> str:
+    with stage("encode"):
+        if orjson is not None:
+            return _orjson_dumps(content).decode()
+        return json.dumps(_plain(content), ensure_ascii=False, separators=(",", ":"))
+
+
+def json_response(content: Any, status_code: int = 200, headers=None) -> Response:
+    # responses render their body when constructed
+    with stage("encode"):
+        if orjson is not None:
+            return FastJSONResponse(content, status_code=status_code, headers=headers)
+        return JSONResponse(_plain(content), status_code=status_code, headers=headers)
+
+
+def dataframe_records(dataframe: pd.DataFrame) -> List[Dict[str, Any]]:
+    return dataframe.astype(object).where(dataframe.notna(), None).to_dict("records")
+
+
+def column_values(series: pd.Series):
+    if orjson is not None and series.dtype.kind in "biuf":
+        return series.to_numpy()
+    return series.astype(object).where(series.notna(), None).tolist()
+
+
+def encode_data(
+    dataframe: pd.DataFrame,
+    node_id: str,
+    format: str,
+    preview_rows: int,
+    num_rows: Optional[int] = None,
+) -> Dict[str, Any]:
+    """JSON body for a tool that produced a data node.
+
+    ``preview`` holds the first ``preview_rows`` rows, so its size doesn't
+    depend on the result; ``split`` and ``columnar`` hold every row, as
+    row arrays or as one array per column. ``num_rows`` is the node's row
+    count when ``dataframe`` holds only its first rows.
+    """
+    with stage("encode"):
+        content = {
+            "node_id": node_id,
+            "num_rows": len(dataframe) if num_rows is None else num_rows,
+            "columns": [str(column) for column in dataframe.columns],
+        }
+        if format == "preview":
+            content["rows"] = dataframe_records(dataframe.head(preview_rows))
+        elif format == "split":
+            content["data"] = (
+                dataframe.astype(object).where(dataframe.notna(), None).values.tolist()
+            )
+        elif format == "columnar":
+            content["data"] = {
+                str(column): column_values(dataframe[column])
+                for column in dataframe.columns
+            }
+        else:
+            raise ValueError(f"Unknown format: {format}")
+        return content
+
+
+class _ChunkSink:
+    def __init__(self):
+        self.closed = False
+        self.chunks: List[bytes] = []
+
+    def write(self, data) -> int:
+        self.chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def take(self) -> bytes:
+        data = b"".join(self.chunks)
+        self.chunks.clear()
+        return data
+
+
+def arrow_stream(
+    batches: Iterable[pd.DataFrame], empty: Callable[[], pd.DataFrame]
+) -> Iterator[bytes]:
+    """Arrow IPC stream bytes, written and yielded one record batch at a
+    time. ``empty`` supplies the schema when there are no batches."""
+    sink = _ChunkSink()
+    writer = schema = None
+    for batch in batches:
+        with stage("encode"):
+            table = _to_arrow(batch)
+            if writer is None:
+                schema = table.schema
+                writer = pa.ipc.new_stream(pa.PythonFile(sink, mode="w"), schema)
+            writer.write_table(table.cast(schema))
+        yield sink.take()
+    if writer is None:
+        writer = pa.ipc.new_stream(
+            pa.PythonFile(sink, mode="w"), _to_arrow(empty()).schema
+        )
+    writer.close()
+    yield sink.take()
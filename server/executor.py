@@ -0,0 +1,174 @@
+import multiprocessing
+import threading
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+import pandas as pd
+
+from operations import execute_plan, required_columns
+from storage import NodeStore, make_node_store
+
+
+class ExecutorBusy(Exception):
+    pass
+
+
+def node_batches(
+    node_store: NodeStore,
+    session_id: str,
+    src_id: str,
+    steps: List[Tuple[str, Dict[str, Any]]],
+    columns: Optional[List[str]],
+    ranges: Optional[List[Tuple[int, int]]],
+    batch_rows: int,
+) -> Iterator[pd.DataFrame]:
+    """The node's rows in batches of at most ``batch_rows``, read from the
+    stored ``src_id`` with ``steps`` applied batch by batch. Only row-wise
+    steps (filters) give the same rows as running them over the whole node.
+    There is always at least one batch, if only an empty one."""
+    read_columns = required_columns(steps, columns) if steps else columns
+
+    def finish(batch):
+        if steps:
+            batch = execute_plan(batch, steps)
+            if columns is not None:
+                batch = batch[columns]
+        return batch
+
+    empty = True
+    for start, end in ranges if ranges is not None else [(0, None)]:
+        limit = None if end is None else end - start
+        for batch in node_store.iter_batches(
+            session_id, src_id, read_columns, start, limit, batch_rows
+        ):
+            empty = False
+            yield finish(batch)
+    if empty:
+        # every zone was pruned, or the node has no rows: one empty batch, so
+        # that a node written from the batches still has the source's schema
+        batch = node_store.head(session_id, src_id, 0)
+        yield finish(batch if read_columns is None else batch[read_columns])
+
+
+def run_on_node(
+    store_name: str,
+    session_id: str,
+    src_id: str,
+    steps: List[Tuple[str, Dict[str, Any]]],
+    columns: Optional[List[str]],
+    ranges: Optional[List[Tuple[int, int]]],
+    batch_rows: Optional[int],
+    fn: Callable,
+    args: tuple,
+):
+    """Worker entry point: loads the input straight from the node store,
+    replaying ``steps`` when the node itself is not stored, and returns
+    ``fn(dataset, *args)``. With ``batch_rows``, ``fn`` gets an iterator of
+    batches instead of the whole input."""
+    node_store = make_node_store(store_name)
+    if batch_rows is not None:
+        batches = node_batches(
+            node_store, session_id, src_id, steps, columns, ranges, batch_rows
+        )
+        return fn(batches, *args)
+    if steps:
+        source = node_store.read(session_id, src_id, required_columns(steps, columns))
+        dataset = execute_plan(source, steps)
+        if columns is not None:
+            dataset = dataset[columns]
+    elif ranges is not None:
+        dataset = node_store.read_ranges(session_id, src_id, ranges, columns)
+    else:
+        dataset = node_store.read(session_id, src_id, columns)
+    return fn(dataset, *args)
+
+
+class NodeExecutor:
+    """Runs dataset operations in a pool of worker processes, off the GIL of
+    the process serving requests.
+
+    At most ``max_pending`` operations are queued or running; ``submit``
+    raises ExecutorBusy beyond that so callers can shed load instead of
+    queueing without bound. ``fn`` and its arguments must be picklable, so
+    operations are module-level functions.
+    """
+
+    def __init__(self, store_name: str, workers: int, max_pending: int):
+        self.store_name = store_name
+        self.workers = workers
+        self.max_pending = max_pending
+        self._slots = threading.BoundedSemaphore(max_pending)
+        self._lock = threading.Lock()
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self.pending = 0
+
+    def _get_pool(self, replace: bool = False) -> ProcessPoolExecutor:
+        with self._lock:
+            if replace and self._pool is not None:
+                # a worker died (e.g. OOM-killed) and took the pool with it
+                self._pool.shutdown(wait=False, cancel_futures=True)
+                self._pool = None
+            if self._pool is None:
+                # spawned workers don't inherit the server's threads or locks
+                self._pool = ProcessPoolExecutor(
+                    self.workers, mp_context=multiprocessing.get_context("spawn")
+                )
+            return self._pool
+
+    def submit(
+        self,
+        session_id: str,
+        src_id: str,
+        steps: List[Tuple[str, Dict[str, Any]]],
+        columns: Optional[List[str]],
+        ranges: Optional[List[Tuple[int, int]]],
+        batch_rows: Optional[int],
+        fn: Callable,
+        *args,
+    ) -> Future:
+        if not self._slots.acquire(blocking=False):
+            raise ExecutorBusy()
+        with self._lock:
+            self.pending += 1
+        task = (
+            run_on_node,
+            self.store_name,
+            session_id,
+            src_id,
+            steps,
+            columns,
+            ranges,
+            batch_rows,
+            fn,
+            args,
+        )
+        try:
+            try:
+                future = self._get_pool().submit(*task)
+            except BrokenProcessPool:
+                future = self._get_pool(replace=True).submit(*task)
+        except BaseException:
+            self._release()
+            raise
+        future.add_done_callback(lambda _: self._release())
+        return future
+
+    def _release(self):
+        with self._lock:
+            self.pending -= 1
+        self._slots.release()
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "workers": self.workers,
+                "pending": self.pending,
+                "max_pending": self.max_pending,
+            }
+
+    def shutdown(self):
+        with self._lock:
+            if self._pool is not None:
+                self._pool.shutdown(cancel_futures=True)
+                self._pool = None
@@ -0,0 +1,208 @@
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+
+try:
+    import numexpr
+except ImportError:  # optional; numeric predicates fall back to numpy
+    numexpr = None
+
+# Filter expressions are JSON trees:
+#   {"and": [expr, ...]}, {"or": [expr, ...]}, {"not": expr}
+#   {"column": c, "op": "lt" | "le" | "gt" | "ge", "value": number}
+#   {"column": c, "op": "eq" | "ne", "value": number | string | bool}
+#   {"column": c, "op": "in", "value": [number | string | bool, ...]}
+#   {"column": c, "op": "is_null" | "not_null"}
+# Nulls never match a comparison or an IN-list; like NaN, they do match ne.
+
+ORDER_OPERATORS = ("lt", "le", "gt", "ge")
+COMPARISON_SYMBOLS = {
+    "lt": "<",
+    "le": "<=",
+    "gt": ">",
+    "ge": ">=",
+    "eq": "==",
+    "ne": "!=",
+}
+PREDICATE_OPERATORS = ORDER_OPERATORS + ("eq", "ne", "in", "is_null", "not_null")
+MAX_EXPRESSION_DEPTH = 32
+
+
+class ExpressionError(ValueError):
+    pass
+
+
+def _scalar(value, path: str):
+    if isinstance(value, bool) or isinstance(value, str):
+        return value
+    if isinstance(value, (int, float)):
+        # 10 and 10.0 select the same rows, so they get the same recipe
+        return float(value)
+    raise ExpressionError(f"{path}: value must be a number, string or boolean")
+
+
+def parse_expression(
+    expr: Any, columns: List[str], path: str = "expr", depth: int = 0
+) -> Dict[str, Any]:
+    """Validates a filter expression against the node's columns and returns
+    its canonical form. Raises ExpressionError naming the offending part."""
+    if depth > MAX_EXPRESSION_DEPTH:
+        raise ExpressionError(f"{path}: expression is nested too deeply")
+    if not isinstance(expr, dict):
+        raise ExpressionError(f"{path}: expected an object")
+    for key in ("and", "or"):
+        if key in expr:
+            if len(expr) != 1:
+                raise ExpressionError(f"{path}: '{key}' takes no other keys")
+            args = expr[key]
+            if not isinstance(args, list) or not args:
+                raise ExpressionError(f"{path}.{key}: expected a non-empty list")
+            return {
+                key: [
+                    parse_expression(arg, columns, f"{path}.{key}[{i}]", depth + 1)
+                    for i, arg in enumerate(args)
+                ]
+            }
+    if "not" in expr:
+        if len(expr) != 1:
+            raise ExpressionError(f"{path}: 'not' takes no other keys")
+        return {"not": parse_expression(expr["not"], columns, f"{path}.not", depth + 1)}
+
+    column, op = expr.get("column"), expr.get("op")
+    if column not in columns:
+        raise ExpressionError(f"{path}: unknown column {column!r}")
+    if op not in PREDICATE_OPERATORS:
+        raise ExpressionError(
+            f"{path}: op must be one of {', '.join(PREDICATE_OPERATORS)}"
+        )
+    extra = set(expr) - {"column", "op", "value"}
+    if extra:
+        raise ExpressionError(f"{path}: unexpected keys {', '.join(sorted(extra))}")
+    if op in ("is_null", "not_null"):
+        if expr.get("value") is not None:
+            raise ExpressionError(f"{path}: {op} takes no value")
+        return {"column": column, "op": op}
+    if "value" not in expr:
+        raise ExpressionError(f"{path}: {op} needs a value")
+    value = expr["value"]
+    if op == "in":
+        if not isinstance(value, list):
+            raise ExpressionError(f"{path}: in needs a list of values")
+        value = [_scalar(item, f"{path}.value[{i}]") for i, item in enumerate(value)]
+    else:
+        value = _scalar(value, f"{path}.value")
+        if op in ORDER_OPERATORS and not isinstance(value, float):
+            raise ExpressionError(f"{path}: {op} needs a number")
+    return {"column": column, "op": op, "value": value}
+
+
+def expression_columns(expr: Dict[str, Any]) -> List[str]:
+    """The columns an expression reads, in first-use order."""
+    if "column" in expr:
+        return [expr["column"]]
+    columns = []
+    for arg in expr.get("and") or expr.get("or") or [expr.get("not")]:
+        columns += [c for c in expression_columns(arg) if c not in columns]
+    return columns
+
+
+def _render_value(value) -> str:
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value)
+
+
+def render_expression(expr: Dict[str, Any]) -> str:
+    """A readable form of a parsed expression for edge labels, e.g.
+    ``age > 30 and region == 'NE'``."""
+    for key in ("and", "or"):
+        if key in expr:
+            parts = [
+                (
+                    f"({render_expression(arg)})"
+                    if "and" in arg or "or" in arg
+                    else render_expression(arg)
+                )
+                for arg in expr[key]
+            ]
+            return f" {key} ".join(parts)
+    if "not" in expr:
+        return f"not ({render_expression(expr['not'])})"
+    column, op = expr["column"], expr["op"]
+    if op in ("is_null", "not_null"):
+        return f"{column} is {'null' if op == 'is_null' else 'not null'}"
+    if op == "in":
+        values = ", ".join(_render_value(value) for value in expr["value"])
+        return f"{column} in [{values}]"
+    return f"{column} {COMPARISON_SYMBOLS[op]} {_render_value(expr['value'])}"
+
+
+def _numeric(series: pd.Series) -> bool:
+    return pd.api.types.is_numeric_dtype(series) and not pd.api.types.is_bool_dtype(
+        series
+    )
+
+
+def _numexpr_source(
+    dataset: pd.DataFrame, expr: Dict[str, Any], arrays: Dict[str, np.ndarray]
+) -> Optional[str]:
+    """The expression as numexpr source over ``arrays``, or None when part of
+    it needs pandas (strings, IN-lists, nullable dtypes)."""
+    for key, joiner in (("and", " & "), ("or", " | ")):
+        if key in expr:
+            parts = [_numexpr_source(dataset, arg, arrays) for arg in expr[key]]
+            if any(part is None for part in parts):
+                return None
+            return "(" + joiner.join(parts) + ")"
+    if "not" in expr:
+        inner = _numexpr_source(dataset, expr["not"], arrays)
+        return None if inner is None else f"(~{inner})"
+    op = expr["op"]
+    values = dataset[expr["column"]].to_numpy()
+    if values.dtype.kind not in "iuf" or op not in COMPARISON_SYMBOLS:
+        return None
+    if not isinstance(expr["value"], float) or not np.isfinite(expr["value"]):
+        return None
+    name = f"c{len(arrays)}"
+    arrays[name] = values
+    return f"({name} {COMPARISON_SYMBOLS[op]} {expr['value']!r})"
+
+
+def _predicate_mask(series: pd.Series, op: str, value) -> np.ndarray:
+    if op == "is_null":
+        return series.isna().to_numpy()
+    if op == "not_null":
+        return series.notna().to_numpy()
+    if op == "in":
+        return series.isin(value).to_numpy(dtype=bool)
+    if op in ORDER_OPERATORS and not _numeric(series):
+        raise ExpressionError(f"Column is not numeric: {series.name}")
+    if op == "ne":
+        return ~_predicate_mask(series, "eq", value)
+    mask = {
+        "lt": series.lt,
+        "le": series.le,
+        "gt": series.gt,
+        "ge": series.ge,
+        "eq": series.eq,
+    }[op](value)
+    return mask.to_numpy(dtype=bool, na_value=False)
+
+
+def expression_mask(dataset: pd.DataFrame, expr: Dict[str, Any]) -> np.ndarray:
+    """Evaluates a parsed expression to one boolean mask over ``dataset``.
+    Numeric subtrees are handed to numexpr as single expressions when it is
+    installed, so they run in one pass without temporaries per predicate."""
+    if numexpr is not None and len(dataset):
+        arrays: Dict[str, np.ndarray] = {}
+        source = _numexpr_source(dataset, expr, arrays)
+        if source is not None:
+            return numexpr.evaluate(source, local_dict=arrays)
+    if "and" in expr:
+        return np.logical_and.reduce([expression_mask(dataset, e) for e in expr["and"]])
+    if "or" in expr:
+        return np.logical_or.reduce([expression_mask(dataset, e) for e in expr["or"]])
+    if "not" in expr:
+        return ~expression_mask(dataset, expr["not"])
+    return _predicate_mask(dataset[expr["column"]], expr["op"], expr.get("value"))
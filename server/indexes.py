@@ -0,0 +1,105 @@
+import hashlib
+import os
+import shutil
+from typing import Optional
+
+import numpy as np
+import pandas as pd
+
+from storage import _replace_atomically, session_dir
+
+# filters matching more than this fraction of the rows scan instead, since
+# gathering scattered rows costs more per row than a sequential pass
+INDEX_MAX_FRACTION = 0.1
+INDEX_FILES = ("values", "nulls", "positions")
+
+
+class ColumnIndex:
+    """Sorted index of one numeric column: the row positions ordered by value,
+    the values in that order, and the positions of nulls. Every comparison
+    filter matches one or two runs of ``positions`` found by binary search, so
+    a lookup costs O(log n + k) for k matches."""
+
+    def __init__(self, values: np.ndarray, positions: np.ndarray, nulls: np.ndarray):
+        self.values = values
+        self.positions = positions
+        self.nulls = nulls
+
+    def __len__(self) -> int:
+        return len(self.positions) + len(self.nulls)
+
+    @classmethod
+    def build(cls, series: pd.Series) -> Optional["ColumnIndex"]:
+        """The index of ``series``, or None when it is not numeric."""
+        if not pd.api.types.is_numeric_dtype(series) or pd.api.types.is_bool_dtype(
+            series
+        ):
+            return None
+        values = series.to_numpy(dtype=float, na_value=np.nan)
+        nulls = np.flatnonzero(np.isnan(values))
+        # NaNs sort last, so the non-null positions come first
+        positions = np.argsort(values, kind="stable")[: len(values) - len(nulls)]
+        return cls(values[positions], positions, nulls)
+
+    def lookup(
+        self, filter_operator: str, filter_value: float, max_rows: Optional[int] = None
+    ) -> Optional[np.ndarray]:
+        """Positions of the rows matching the filter, in row order, or None
+        when there are more than ``max_rows`` of them."""
+        n = len(self.values)
+        left = int(np.searchsorted(self.values, filter_value, "left"))
+        right = int(np.searchsorted(self.values, filter_value, "right"))
+        runs = {
+            "lt": [(0, left)],
+            "le": [(0, right)],
+            "gt": [(right, n)],
+            "ge": [(left, n)],
+            "eq": [(left, right)],
+            "ne": [(0, left), (right, n)],
+        }[filter_operator]
+        # NaN != value holds, so nulls match ne and nothing else
+        count = sum(end - start for start, end in runs)
+        if filter_operator == "ne":
+            count += len(self.nulls)
+        if max_rows is not None and count > max_rows:
+            return None
+        parts = [self.positions[start:end] for start, end in runs]
+        if filter_operator == "ne":
+            parts.append(self.nulls)
+        return np.sort(np.concatenate(parts))
+
+
+class IndexStore:
+    """Indexes are .npy files in a directory next to the node,
+    sessions/<id>/<node>.indexes/, memory mapped when read."""
+
+    def path(self, session_id: str, node_id: str) -> str:
+        return os.path.join(session_dir(session_id), f"{node_id}.indexes")
+
+    def _file(self, session_id: str, node_id: str, column: str, name: str) -> str:
+        key = hashlib.sha1(str(column).encode()).hexdigest()[:16]
+        return os.path.join(self.path(session_id, node_id), f"{key}.{name}.npy")
+
+    def read(self, session_id: str, node_id: str, column: str) -> Optional[ColumnIndex]:
+        arrays = {}
+        try:
+            for name in reversed(INDEX_FILES):
+                path = self._file(session_id, node_id, column, name)
+                arrays[name] = np.load(path, mmap_mode="r")
+        except FileNotFoundError:
+            return None
+        return ColumnIndex(**arrays)
+
+    def write(self, session_id: str, node_id: str, column: str, index: ColumnIndex):
+        os.makedirs(self.path(session_id, node_id), exist_ok=True)
+        # positions go last; their file marks the index complete
+        for name in INDEX_FILES:
+
+            def write(path, array=getattr(index, name)):
+                with open(path, "wb") as file:
+                    np.save(file, array)
+
+            _replace_atomically(self._file(session_id, node_id, column, name), write)
+
+    def drop(self, session_id: str, node_id: str):
+        shutil.rmtree(self.path(session_id, node_id), ignore_errors=True)
@@ -0,0 +1,361 @@
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+import pandas as pd
+from starlette.datastructures import MutableHeaders
+
+# Stages a request's time is split into. Each is timed exclusive of the
+# stages nested in it, e.g. a read while an operation consumes batches.
+#   metadata  opening, committing and closing session metadata transactions
+#   read      loading node contents from the store into pandas
+#   compute   the operation itself (or waiting on a worker process)
+#   write     writing node contents, exports and ingested uploads
+#   encode    building and serialising JSON bodies
+COUNTERS = ("bytes_read", "bytes_written", "rows_in", "rows_out")
+BUCKETS = (
+    0.0005,
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+    30.0,
+    float("inf"),
+)
+METRIC_PREFIX = "graphlytix"
+
+
+class RequestTimings:
+    """Stage times and counters of one request. Work left after the response
+    has been sent (background tasks) is recorded as it happens instead."""
+
+    def __init__(self, scope, metrics: "Metrics"):
+        self.scope = scope
+        self.metrics = metrics
+        self.start = time.perf_counter()
+        self.stages: Dict[str, float] = {}
+        self.counters: Dict[str, int] = {}
+        self.closed = False
+        self.lock = threading.Lock()
+
+    @property
+    def route(self) -> str:
+        route = self.scope.get("route")
+        return getattr(route, "path", "unmatched")
+
+    def add_stage(self, name: str, seconds: float):
+        with self.lock:
+            if not self.closed:
+                self.stages[name] = self.stages.get(name, 0.0) + seconds
+                return
+        self.metrics.observe_stage(self.route, name, "background", seconds)
+
+    def add_count(self, name: str, value: int):
+        with self.lock:
+            if not self.closed:
+                self.counters[name] = self.counters.get(name, 0) + value
+                return
+        self.metrics.add_count(self.route, name, "background", value)
+
+    def server_timing(self) -> str:
+        """The Server-Timing header value: each stage and the total in ms, and
+        the counters as descriptions."""
+        with self.lock:
+            total = (time.perf_counter() - self.start) * 1000
+            entries = [
+                f"{name};dur={seconds * 1000:.2f}"
+                for name, seconds in self.stages.items()
+            ]
+            entries.append(f"total;dur={total:.2f}")
+            entries += [
+                f'{name};desc="{value}"' for name, value in self.counters.items()
+            ]
+        return ", ".join(entries)
+
+    def close(self, status: int):
+        with self.lock:
+            if self.closed:
+                return
+            self.closed = True
+        method = self.scope.get("method", "")
+        self.metrics.observe_request(
+            method, self.route, status, time.perf_counter() - self.start
+        )
+        for name, seconds in self.stages.items():
+            self.metrics.observe_stage(self.route, name, "request", seconds)
+        for name, value in self.counters.items():
+            self.metrics.add_count(self.route, name, "request", value)
+
+
+_timings: ContextVar[Optional[RequestTimings]] = ContextVar(
+    "request_timings", default=None
+)
+_stages = threading.local()
+
+
+@contextmanager
+def stage(name: str):
+    """Times the block as ``name`` in the current request. Outside a request
+    (worker processes, the profile thread) it does nothing."""
+    timings = _timings.get()
+    if timings is None:
+        yield
+        return
+    stack = getattr(_stages, "stack", None)
+    if stack is None:
+        stack = _stages.stack = []
+    # [time spent in stages nested in this one]
+    frame = [0.0]
+    stack.append(frame)
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        stack.pop()
+        if stack:
+            stack[-1][0] += elapsed
+        timings.add_stage(name, elapsed - frame[0])
+
+
+def count(name: str, value: int):
+    timings = _timings.get()
+    if timings is not None:
+        timings.add_count(name, int(value))
+
+
+def count_read(dataframe: pd.DataFrame) -> pd.DataFrame:
+    """Counts a frame loaded from the store by its in-memory size."""
+    if _timings.get() is not None:
+        count("bytes_read", dataframe.memory_usage(index=False).sum())
+    return dataframe
+
+
+def count_written(path: str):
+    if _timings.get() is not None:
+        try:
+            count("bytes_written", os.path.getsize(path))
+        except OSError:
+            pass
+
+
+def read_batches(batches: Iterable[pd.DataFrame]) -> Iterator[pd.DataFrame]:
+    """Passes ``batches`` through, timing each one's load as a read."""
+    iterator = iter(batches)
+    while True:
+        with stage("read"):
+            batch = next(iterator, None)
+            if batch is not None:
+                count_read(batch)
+        if batch is None:
+            return
+        yield batch
+
+
+def _labels(**labels) -> Tuple[Tuple[str, str], ...]:
+    return tuple(sorted(labels.items()))
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+class Metrics:
+    """Request and stage latency histograms and counters, rendered in the
+    Prometheus text format. Each worker process keeps its own."""
+
+    HELP = {
+        "request_duration_seconds": "Time from request to the last response byte.",
+        "stage_duration_seconds": "Time per request spent in each stage.",
+        "bytes_read_total": "Bytes of node contents loaded from the store.",
+        "bytes_written_total": "Bytes of node contents written to the store.",
+        "rows_in_total": "Rows passed into operations.",
+        "rows_out_total": "Rows produced by operations.",
+    }
+
+    def __init__(self, buckets: Tuple[float, ...] = BUCKETS):
+        self.buckets = buckets
+        self.lock = threading.Lock()
+        self.histograms: Dict[Tuple[str, tuple], List[Any]] = {}
+        self.counters: Dict[Tuple[str, tuple], float] = {}
+
+    def _observe(self, name: str, labels: tuple, value: float):
+        with self.lock:
+            histogram = self.histograms.get((name, labels))
+            if histogram is None:
+                histogram = self.histograms[(name, labels)] = [
+                    [0] * len(self.buckets),
+                    0.0,
+                ]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    histogram[0][i] += 1
+            histogram[1] += value
+
+    def observe_request(self, method: str, route: str, status: int, seconds: float):
+        labels = _labels(method=method, route=route, status=str(status))
+        self._observe("request_duration_seconds", labels, seconds)
+
+    def observe_stage(self, route: str, stage: str, phase: str, seconds: float):
+        labels = _labels(route=route, stage=stage, phase=phase)
+        self._observe("stage_duration_seconds", labels, seconds)
+
+    def add_count(self, route: str, name: str, phase: str, value: int):
+        key = (f"{name}_total", _labels(route=route, phase=phase))
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def render(self) -> str:
+        lines = []
+        with self.lock:
+            histograms = sorted(self.histograms.items())
+            counters = sorted(self.counters.items())
+        described = set()
+
+        def describe(name, kind):
+            if name not in described:
+                described.add(name)
+                lines.append(f"# HELP {METRIC_PREFIX}_{name} {self.HELP[name]}")
+                lines.append(f"# TYPE {METRIC_PREFIX}_{name} {kind}")
+
+        def labelled(name, labels, suffix="", extra=()):
+            pairs = ",".join(f'{k}="{_escape(v)}"' for k, v in labels + extra)
+            return f"{METRIC_PREFIX}_{name}{suffix}{{{pairs}}}"
+
+        for (name, labels), (buckets, total) in histograms:
+            describe(name, "histogram")
+            for bound, observed in zip(self.buckets, buckets):
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                lines.append(
+                    f"{labelled(name, labels, '_bucket', (('le', le),))} {observed}"
+                )
+            lines.append(f"{labelled(name, labels, '_sum')} {total}")
+            lines.append(f"{labelled(name, labels, '_count')} {buckets[-1]}")
+        for (name, labels), value in counters:
+            describe(name, "counter")
+            lines.append(f"{labelled(name, labels)} {value}")
+        return "\n".join(lines) + "\n"
+
+
+class TimingMiddleware:
+    """Times each HTTP request: adds a Server-Timing header with the stages
+    run before the response started, and records the request and its stages
+    in ``metrics`` once the last byte has been sent."""
+
+    def __init__(self, app, metrics: Metrics):
+        self.app = app
+        self.metrics = metrics
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        timings = RequestTimings(scope, self.metrics)
+        token = _timings.set(timings)
+        status = 500
+
+        async def send_timed(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                headers = MutableHeaders(scope=message)
+                headers.append("Server-Timing", timings.server_timing())
+            await send(message)
+            if message["type"] == "http.response.body" and not message.get(
+                "more_body", False
+            ):
+                timings.close(status)
+
+        try:
+            await self.app(scope, receive, send_timed)
+        finally:
+            timings.close(status)
+            _timings.reset(token)
+
+
+class SamplingProfiler:
+    """Samples the stacks of every thread at a fixed interval while running,
+    and reports them as collapsed stacks (``frame;frame;frame count`` lines,
+    the input of flamegraph.pl and speedscope)."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.samples: Counter = Counter()
+        self.interval: Optional[float] = None
+        self.started_at: Optional[float] = None
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None
+
+    def start(self, interval: float) -> bool:
+        """Starts sampling; False when it is already running."""
+        with self.lock:
+            if self._thread is not None:
+                return False
+            self.samples = Counter()
+            self.interval = interval
+            self.started_at = time.time()
+            self._stop.clear()
+            self._thread = threading.Thread(
+                target=self._run, name="sampling-profiler", daemon=True
+            )
+            self._thread.start()
+            return True
+
+    def stop(self) -> str:
+        """Stops sampling and returns the collapsed stacks."""
+        with self.lock:
+            thread, self._thread = self._thread, None
+        if thread is not None:
+            self._stop.set()
+            thread.join()
+        return self.collapsed()
+
+    def collapsed(self) -> str:
+        with self.lock:
+            samples = self.samples.most_common()
+        return "".join(f"{stack} {n}\n" for stack, n in samples)
+
+    def stats(self) -> Dict[str, Any]:
+        with self.lock:
+            return {
+                "running": self._thread is not None,
+                "interval": self.interval,
+                "started_at": self.started_at,
+                "samples": sum(self.samples.values()),
+                "stacks": len(self.samples),
+            }
+
+    def _run(self):
+        own = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            stacks = []
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own:
+                    continue
+                names = []
+                while frame is not None:
+                    code = frame.f_code
+                    filename = os.path.basename(code.co_filename)
+                    names.append(f"{code.co_name} ({filename}:{code.co_firstlineno})")
+                    frame = frame.f_back
+                stacks.append(";".join(reversed(names)))
+            with self.lock:
+                self.samples.update(stacks)
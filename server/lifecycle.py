@@ -0,0 +1,223 @@
+import fcntl
+import os
+import shutil
+import tarfile
+import time
+from contextlib import contextmanager
+from typing import Dict, List, Optional, Set, Tuple
+from uuid import uuid4
+
+from storage import SESSIONS_DIR, _replace_atomically, session_dir
+
+ARCHIVE_DIR = "archive"
+# a session's last use is recorded as the mtime of this file, at most this
+# often; SQLite's own files change on reads and on compaction
+LAST_USED_FILE = "last_used"
+LAST_USED_RESOLUTION_SECONDS = 60
+
+
+def disk_usage(path: str) -> int:
+    """Bytes of the files under ``path``, hard-linked files counted once."""
+    seen = set()
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            try:
+                stat = os.lstat(os.path.join(root, name))
+            except FileNotFoundError:
+                continue
+            if (stat.st_dev, stat.st_ino) not in seen:
+                seen.add((stat.st_dev, stat.st_ino))
+                total += stat.st_size
+    return total
+
+
+def session_ids() -> List[str]:
+    """Sessions in hot storage. Directories being archived or restored have
+    a suffix after the id and are left out."""
+    try:
+        names = os.listdir(SESSIONS_DIR)
+    except FileNotFoundError:
+        return []
+    return sorted(
+        name for name in names if "." not in name and os.path.isdir(session_dir(name))
+    )
+
+
+def _node_id(name: str) -> Optional[str]:
+    stem = name.split(".", 1)[0]
+    if len(stem) == 36 and stem.count("-") == 4:
+        return stem
+    return None
+
+
+def _remove(path: str) -> int:
+    try:
+        if os.path.isdir(path):
+            size = disk_usage(path)
+            shutil.rmtree(path)
+            return size
+        size = os.lstat(path).st_size
+        os.remove(path)
+        return size
+    except FileNotFoundError:
+        return 0
+
+
+def remove_orphans(session_id: str, node_ids: Set[str], older_than: float) -> int:
+    """Removes files last modified before ``older_than`` that nothing refers
+    to any more: contents and sidecars of nodes not in ``node_ids``, leftovers
+    of interrupted writes and dedup objects no node links to. Returns the
+    bytes freed."""
+    directory = session_dir(session_id)
+    freed = 0
+    for entry in os.scandir(directory):
+        if entry.name == "objects" and entry.is_dir():
+            for item in os.scandir(entry.path):
+                stat = item.stat(follow_symlinks=False)
+                if stat.st_nlink == 1 and stat.st_mtime < older_than:
+                    freed += _remove(item.path)
+            continue
+        if entry.stat(follow_symlinks=False).st_mtime >= older_than:
+            # possibly written by a request that hasn't committed its node yet
+            continue
+        node_id = _node_id(entry.name)
+        if ".tmp-" in entry.name or (node_id is not None and node_id not in node_ids):
+            freed += _remove(entry.path)
+    return freed
+
+
+class AccessLog:
+    """When sessions and nodes were last used. Sessions record it on disk as
+    well, for other worker processes and restarts; nodes only in this process,
+    falling back to when their contents were written."""
+
+    def __init__(self):
+        self.sessions: Dict[str, float] = {}
+        self.nodes: Dict[Tuple[str, str], float] = {}
+
+    def touch(self, session_id: str, node_id: Optional[str] = None):
+        now = time.time()
+        previous = self.sessions.get(session_id, 0.0)
+        self.sessions[session_id] = now
+        if node_id is not None:
+            self.nodes[(session_id, node_id)] = now
+        if now - previous >= LAST_USED_RESOLUTION_SECONDS:
+            path = os.path.join(session_dir(session_id), LAST_USED_FILE)
+            try:
+                with open(path, "a"):
+                    os.utime(path)
+            except OSError:
+                pass
+
+    def node_last_used(self, session_id: str, node_id: str, *paths: str) -> float:
+        last_used = self.nodes.get((session_id, node_id), 0.0)
+        for path in paths:
+            try:
+                last_used = max(last_used, os.path.getmtime(path))
+            except OSError:
+                pass
+        return last_used
+
+    def session_last_used(self, session_id: str) -> float:
+        directory = session_dir(session_id)
+        try:
+            recorded = os.path.getmtime(os.path.join(directory, LAST_USED_FILE))
+        except FileNotFoundError:
+            # sessions from before last use was recorded
+            recorded = os.path.getmtime(directory)
+        return max(self.sessions.get(session_id, 0.0), recorded)
+
+    def forget(self, session_id: str):
+        self.sessions.pop(session_id, None)
+        for key in [key for key in self.nodes if key[0] == session_id]:
+            del self.nodes[key]
+
+
+class SessionArchive:
+    """Cold storage for idle sessions: <root>/<id>.tar.gz, restored to
+    sessions/<id>/ the next time the session is used. The session directory
+    is moved aside before it is compressed, and archiving and restoring the
+    same session hold an exclusive lock on <root>/<id>.lock, across threads
+    and worker processes, so a request that needs a session while it is
+    being archived waits and restores it."""
+
+    def __init__(self, root: str = ARCHIVE_DIR):
+        self.root = root
+
+    def path(self, session_id: str) -> str:
+        return os.path.join(self.root, f"{session_id}.tar.gz")
+
+    def lock_path(self, session_id: str) -> str:
+        return os.path.join(self.root, f"{session_id}.lock")
+
+    @contextmanager
+    def _lock(self, session_id: str):
+        os.makedirs(self.root, exist_ok=True)
+        # flock locks belong to the open file, so threads of one process
+        # exclude each other as well; closing the file releases it
+        with open(self.lock_path(session_id), "a") as file:
+            fcntl.flock(file, fcntl.LOCK_EX)
+            yield
+
+    def exists(self, session_id: str) -> bool:
+        return os.path.exists(self.path(session_id))
+
+    def session_ids(self) -> List[str]:
+        try:
+            names = os.listdir(self.root)
+        except FileNotFoundError:
+            return []
+        return sorted(
+            name[: -len(".tar.gz")] for name in names if name.endswith(".tar.gz")
+        )
+
+    def usage(self) -> int:
+        return disk_usage(self.root) if os.path.isdir(self.root) else 0
+
+    def archive(self, session_id: str) -> int:
+        """Compresses the session into the archive and removes it from hot
+        storage. Returns the archive's size."""
+        with self._lock(session_id):
+            directory = session_dir(session_id)
+            staging = f"{directory}.archiving-{uuid4().hex}"
+            os.rename(directory, staging)
+
+            def write(path):
+                with tarfile.open(path, "w:gz") as tar:
+                    for name in sorted(os.listdir(staging)):
+                        tar.add(os.path.join(staging, name), arcname=name)
+
+            try:
+                _replace_atomically(self.path(session_id), write)
+            except BaseException:
+                os.rename(staging, directory)
+                raise
+            shutil.rmtree(staging)
+            return os.path.getsize(self.path(session_id))
+
+    def restore(self, session_id: str) -> bool:
+        """Moves an archived session back into hot storage. False when there
+        is no archive for it."""
+        if not os.path.exists(self.path(session_id)) and not os.path.exists(
+            self.lock_path(session_id)
+        ):
+            # never archived; the lock file is there before archiving starts
+            return False
+        with self._lock(session_id):
+            directory = session_dir(session_id)
+            if os.path.isdir(directory):
+                return True
+            path = self.path(session_id)
+            if not os.path.exists(path):
+                return False
+            staging = f"{directory}.restoring-{uuid4().hex}"
+            try:
+                with tarfile.open(path, "r:gz") as tar:
+                    tar.extractall(staging, filter="data")
+                os.rename(staging, directory)
+            finally:
+                if os.path.exists(staging):
+                    shutil.rmtree(staging)
+            os.remove(path)
+            return True
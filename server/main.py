@@ -1,18 +1,140 @@
-import io
-from fastapi import FastAPI, UploadFile, HTTPException
-from fastapi.responses import FileResponse, JSONResponse, StreamingResponse
+from fastapi import FastAPI, UploadFile, HTTPException, Query, BackgroundTasks
+from fastapi.responses import (
+    FileResponse,
+    JSONResponse,
+    PlainTextResponse,
+    StreamingResponse,
+)
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.concurrency import run_in_threadpool
 from uuid import uuid4
-from typing import Dict, Any
+from concurrent.futures import BrokenExecutor, ThreadPoolExecutor, wait
+from typing import Callable, Dict, Any, List, Tuple
 import os
 import json
+import asyncio
+import random
+import shutil
+import threading
+import time
 import pandas as pd
-import csv
 from typing import Optional
-from fastmcp import Client
+from contextlib import asynccontextmanager
 from google import genai
+from cache import NodeCache
+from context import SummaryCache, build_context, render, sample_columns
+from mcp_session import MCPConnection
+from instrumentation import Metrics, SamplingProfiler, TimingMiddleware, count, stage
+from executor import ExecutorBusy, NodeExecutor, node_batches
+from encoding import (
+    ARROW_MEDIA_TYPE,
+    DATA_FORMATS,
+    arrow_stream,
+    dataframe_records,
+    dumps,
+    encode_data,
+    json_response,
+)
+from storage import SESSIONS_DIR, make_node_store, session_dir
+from lifecycle import (
+    ARCHIVE_DIR,
+    AccessLog,
+    SessionArchive,
+    disk_usage,
+    remove_orphans,
+    session_ids,
+)
+from indexes import INDEX_MAX_FRACTION, ColumnIndex, IndexStore
+from approximate import (
+    SketchBuilder,
+    SketchStore,
+    aggregate_estimate,
+    describe_estimate,
+    value_counts_estimate,
+)
+from streaming import (
+    StoredNode,
+    stream_aggregate,
+    stream_batch_rows,
+    stream_describe,
+    stream_filter,
+    stream_sample,
+    stream_value_counts,
+)
+from deltas import (
+    INCREMENTAL_AGGREGATIONS,
+    PartialStore,
+    aggregate_partial,
+    merge_aggregate,
+    merge_value_counts,
+    partial_result,
+    value_counts_partial,
+    value_counts_result,
+)
+from metadata import MetadataStore, SessionMetadata
+from memo import UNMEMOIZED_OPERATIONS, MemoStats, recipe_fingerprint
+from profiles import (
+    PROFILE_AGGREGATIONS,
+    ProfileStore,
+    build_profile,
+    dataframe_batches,
+    matching_zones,
+    profile_aggregate,
+)
+from pipeline import (
+    PipelineError,
+    PipelineStep,
+    pipeline_columns,
+    plan_pipeline,
+    run_pipeline,
+)
+from expressions import ExpressionError, parse_expression, render_expression
+from operations import (
+    AGGREGATIONS,
+    COUNT_AGGREGATIONS,
+    FILTER_OPERATORS,
+    MASK_OPERATIONS,
+    OPERATIONS,
+    ROW_OPERATIONS,
+    aggregate,
+    execute_plan,
+    group_key,
+    input_columns,
+    output_columns,
+    required_columns,
+    run_describe,
+    run_sample,
+    run_value_counts,
+    to_json_scalar,
+)
+
+MCP_URL = os.environ.get("MCP_URL", "http://localhost:9000/mcp")
+mcp_connection = MCPConnection(MCP_URL)
 
-app = FastAPI()
+
+async def maintenance_loop():
+    while True:
+        await asyncio.sleep(MAINTENANCE_INTERVAL_SECONDS)
+        try:
+            await run_in_threadpool(run_maintenance)
+        except Exception:
+            # the next pass tries again
+            pass
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    await run_in_threadpool(fail_interrupted_jobs, time.time())
+    maintenance = None
+    if MAINTENANCE_INTERVAL_SECONDS > 0:
+        maintenance = asyncio.create_task(maintenance_loop())
+    yield
+    if maintenance is not None:
+        maintenance.cancel()
+    await mcp_connection.close()
+
+
+app = FastAPI(lifespan=lifespan)
 
 app.add_middleware(
     CORSMiddleware,
@@ -20,420 +142,2258 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Total-Count", "X-Next-Offset", "Server-Timing"],
+)
+metrics = Metrics()
+app.add_middleware(TimingMiddleware, metrics=metrics)
+# off until switched on with POST /profiler/start
+profiler = SamplingProfiler()
+PROFILER_MIN_INTERVAL = 0.001
+
+NODE_CACHE_MAX_BYTES = int(os.environ.get("NODE_CACHE_MAX_BYTES", 512 * 1024**2))
+node_cache = NodeCache(NODE_CACHE_MAX_BYTES)
+NODE_STORAGE = os.environ.get("NODE_STORAGE", "feather")
+NODE_DEDUP = os.environ.get("NODE_DEDUP", "0") == "1"
+node_store = make_node_store(NODE_STORAGE, dedup=NODE_DEDUP)
+metadata_store = MetadataStore()
+node_profiles = ProfileStore()
+# sketches and a row sample per node, for approximate=true tool calls
+node_sketches = SketchStore()
+node_indexes = IndexStore()
+node_partials = PartialStore()
+# nodes with at least this many rows get a column index in the background
+# the first time the column is filtered
+INDEX_MIN_ROWS = int(os.environ.get("INDEX_MIN_ROWS", 100_000))
+# profiles are built off the request path, one node at a time
+profile_executor = ThreadPoolExecutor(max_workers=1)
+memo_stats = MemoStats()
+# memoized responses larger than this are recomputed on a hit; the result
+# node is still reused
+MEMO_CONTENT_MAX_BYTES = int(os.environ.get("MEMO_CONTENT_MAX_BYTES", 1024**2))
+# operations over inputs with at least this many rows run in worker
+# processes; from ASYNC_JOB_MIN_ROWS on they are also answered with a job
+EXECUTOR_MIN_ROWS = int(os.environ.get("EXECUTOR_MIN_ROWS", 250_000))
+ASYNC_JOB_MIN_ROWS = int(os.environ.get("ASYNC_JOB_MIN_ROWS", 5_000_000))
+# memory one operation may use; larger inputs are processed in batches
+MEMORY_BUDGET_BYTES = int(os.environ.get("MEMORY_BUDGET_BYTES", 1024**3))
+EXECUTOR_WORKERS = int(os.environ.get("EXECUTOR_WORKERS", os.cpu_count() or 1))
+node_executor = NodeExecutor(
+    NODE_STORAGE,
+    EXECUTOR_WORKERS,
+    int(os.environ.get("EXECUTOR_MAX_PENDING", 4 * EXECUTOR_WORKERS)),
+)
+JOB_POLL_SECONDS = 0.5
+# Storage lifecycle. Quotas are in bytes of hot storage (sessions/), 0 for
+# none; stored intermediate nodes unused for EVICTION_MIN_IDLE_SECONDS are
+# evicted first since their recipes rebuild them, then idle sessions are
+# archived. Sessions unused for SESSION_ARCHIVE_AFTER_SECONDS are archived by
+# the periodic maintenance pass regardless.
+SESSION_QUOTA_BYTES = int(os.environ.get("SESSION_QUOTA_BYTES", 0))
+STORAGE_QUOTA_BYTES = int(os.environ.get("STORAGE_QUOTA_BYTES", 0))
+EVICTION_MIN_IDLE_SECONDS = int(os.environ.get("EVICTION_MIN_IDLE_SECONDS", 600))
+SESSION_ARCHIVE_AFTER_SECONDS = int(
+    os.environ.get("SESSION_ARCHIVE_AFTER_SECONDS", 14 * 24 * 3600)
 )
-FILTER_OPERATORS = {
-    "lt": lambda x, value: x < value,
-    "gt": lambda x, value: x > value,
-    "eq": lambda x, value: x == value,
-    "ne": lambda x, value: x != value,
-    "le": lambda x, value: x <= value,
-    "ge": lambda x, value: x >= value,
-}
+JOB_RETENTION_SECONDS = int(os.environ.get("JOB_RETENTION_SECONDS", 24 * 3600))
+MAINTENANCE_INTERVAL_SECONDS = int(os.environ.get("MAINTENANCE_INTERVAL_SECONDS", 3600))
+# files younger than this may belong to a node that is still being created
+ORPHAN_MIN_AGE_SECONDS = 3600
+access_log = AccessLog()
+session_archive = SessionArchive(os.environ.get("SESSION_ARCHIVE_DIR", ARCHIVE_DIR))
+maintenance_lock = threading.RLock()
+# rows included in a filter/sample response unless a full format is requested
+PREVIEW_ROWS = int(os.environ.get("PREVIEW_ROWS", 20))
+# per-node summaries used to build /gemini prompts
+prompt_summaries = SummaryCache()
+GEMINI_CONTEXT_TOKENS = int(os.environ.get("GEMINI_CONTEXT_TOKENS", 8000))
+UPLOAD_CHUNK_BYTES = 1024**2
+INGEST_SNIFF_ROWS = 1000
+
+
+def read_node(
+    session_id: str, node_id: str, columns: Optional[List[str]] = None
+) -> pd.DataFrame:
+    key = (session_id, node_id)
+    access_log.touch(session_id, node_id)
+    if columns is not None:
+        # projected reads only touch the needed columns of the stored blob
+        cached = node_cache.get(key)
+        if cached is not None:
+            return cached[columns]
+        if node_store.exists(session_id, node_id):
+            return node_store.read(session_id, node_id, columns)
+        return read_node(session_id, node_id)[columns]
+    return node_cache.get_or_load(key, lambda: load_node_contents(session_id, node_id))
+
+
+def load_node_contents(session_id: str, node_id: str) -> pd.DataFrame:
+    if node_store.exists(session_id, node_id):
+        return node_store.read(session_id, node_id)
+    return materialize_node(session_id, node_id)
+
+
+def node_plan(
+    metadata: SessionMetadata, node_id: str, available: Callable[[str], bool]
+) -> Tuple[str, List[Tuple[str, Dict[str, Any]]]]:
+    """Walks recipes back from ``node_id`` to the nearest available ancestor
+    and returns it with the steps that rebuild the node from it."""
+    steps = []
+    while not available(node_id):
+        node = metadata.get_node(node_id)
+        if node is None or "recipe" not in node:
+            raise FileNotFoundError(f"Node has no contents: {node_id}")
+        recipe = node["recipe"]
+        steps.append((recipe["op"], recipe["params"]))
+        node_id = recipe["src_id"]
+    steps.reverse()
+    return node_id, steps
+
+
+def materialize_node(session_id: str, node_id: str) -> pd.DataFrame:
+    """Rebuilds a node that has no stored contents from its recipe. Ancestors
+    that are not available either are folded into the same plan, so a chain
+    of lazy filters runs as one fused pass over the nearest available node."""
+    with metadata_store.snapshot(session_id) as metadata:
+        src_id, steps = node_plan(
+            metadata,
+            node_id,
+            lambda src_id: (session_id, src_id) in node_cache
+            or node_store.exists(session_id, src_id),
+        )
+    return execute_plan(read_node(session_id, src_id, required_columns(steps)), steps)
+
 
+def node_head(session_id: str, node_id: str, n: int) -> pd.DataFrame:
+    cached = node_cache.get((session_id, node_id))
+    if cached is not None:
+        return cached.head(n)
+    return node_store.head(session_id, node_id, n)
+
+
+def persist_node(session_id: str, node_id: str):
+    if node_store.exists(session_id, node_id):
+        return
+    dataframe = read_node(session_id, node_id)
+    node_store.write(session_id, node_id, dataframe)
+    schedule_profile(session_id, node_id, dataframe)
+    with metadata_store.transaction(session_id) as metadata:
+        metadata.update_node(node_id, materialized=True, num_rows=len(dataframe))
+    schedule_quotas(session_id)
+
+
+def profile_node(
+    session_id: str, node_id: str, dataframe: Optional[pd.DataFrame] = None
+):
+    if dataframe is None:
+        batches = node_store.iter_batches(session_id, node_id)
+    else:
+        batches = dataframe_batches(dataframe)
+    sketches = SketchBuilder()
+    node_profiles.write(session_id, node_id, build_profile(sketches.observe(batches)))
+    node_sketches.write(session_id, node_id, sketches)
+
+
+def schedule_profile(session_id: str, node_id: str, dataframe: pd.DataFrame):
+    if node_profiles.read(session_id, node_id) is None:
+        profile_executor.submit(profile_node, session_id, node_id, dataframe)
+
+
+def schedule_quotas(session_id: str):
+    """Makes room after a write that can be recomputed, off the request path."""
+    if SESSION_QUOTA_BYTES or STORAGE_QUOTA_BYTES:
+        profile_executor.submit(enforce_quotas, [session_id])
+
+
+def profiled_aggregates(
+    session_id: str, node_id: str, pairs: List[Tuple[str, str]]
+) -> Dict[Tuple[str, str], Any]:
+    """The ungrouped (column, func) pairs that the node's profile answers."""
+    profile = node_profiles.read(session_id, node_id)
+    results = {}
+    if profile is None:
+        return results
+    for column, func in pairs:
+        if func in PROFILE_AGGREGATIONS:
+            try:
+                results[(column, func)] = profile_aggregate(profile, column, func)
+            except KeyError:
+                pass
+    return results
+
+
+def node_sketch(session_id: str, node_id: str) -> Tuple[Dict[str, Any], pd.DataFrame]:
+    """The node's sketches and row sample. They are built alongside its
+    profile; nodes without them yet get them here in one pass."""
+    stored = node_sketches.read(session_id, node_id)
+    if stored is not None:
+        return stored
+    if (session_id, node_id) not in node_cache and node_store.exists(
+        session_id, node_id
+    ):
+        batches = node_store.iter_batches(session_id, node_id)
+    else:
+        batches = dataframe_batches(read_node(session_id, node_id))
+    sketches = SketchBuilder()
+    for batch in batches:
+        sketches.add(batch)
+    node_sketches.write(session_id, node_id, sketches)
+    return sketches.sketches(), sketches.sample()
+
+
+def approximate_response(
+    session_id: str,
+    node_id: str,
+    estimate: Callable[[Dict[str, Any], pd.DataFrame], Dict[str, Any]],
+):
+    """Answers a tool call from the node's sketches with
+    ``estimate(sketches, sample)``. Estimates are not recorded in the graph;
+    the exact call creates the node."""
+    try:
+        sketches, sample = node_sketch(session_id, node_id)
+    except (FileNotFoundError, OSError):
+        raise HTTPException(status_code=404, detail="File not found")
+    try:
+        content = estimate(sketches, sample)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return json_response({"approximate": True, **content})
+
+
+def has_contents(session_id: str, node_id: str) -> bool:
+    return (session_id, node_id) in node_cache or node_store.exists(session_id, node_id)
+
+
+def index_node(session_id: str, node_id: str, column: str) -> Optional[ColumnIndex]:
+    cached = node_cache.get((session_id, node_id))
+    if cached is not None:
+        series = cached[column]
+    else:
+        series = node_store.read(session_id, node_id, [column])[column]
+    index = ColumnIndex.build(series)
+    if index is not None:
+        node_indexes.write(session_id, node_id, column, index)
+    return index
+
+
+def schedule_index(session_id: str, node: Dict[str, Any], column: str):
+    node_id = node["node_id"]
+    if (
+        (node.get("num_rows") or 0) >= INDEX_MIN_ROWS
+        and column in node.get("columns", [])
+        and has_contents(session_id, node_id)
+        and node_indexes.read(session_id, node_id, column) is None
+    ):
+        profile_executor.submit(index_node, session_id, node_id, column)
+
+
+def indexed_rows(
+    session_id: str, node_id: str, params: Dict[str, Any]
+) -> Optional[pd.DataFrame]:
+    """The rows matching a filter, looked up in the node's index on its
+    column. None without an index, or when the filter matches too much of
+    the node for gathering rows to beat a scan."""
+    if not has_contents(session_id, node_id):
+        return None
+    index = node_indexes.read(session_id, node_id, params["column"])
+    if index is None:
+        return None
+    positions = index.lookup(
+        params["filter_operator"],
+        params["filter_value"],
+        max_rows=int(len(index) * INDEX_MAX_FRACTION),
+    )
+    if positions is None:
+        return None
+    cached = node_cache.get((session_id, node_id))
+    if cached is not None:
+        return cached.iloc[positions]
+    return node_store.take(session_id, node_id, positions)
+
+
+def filter_input(session_id: str, node_id: str, params: Dict[str, Any]) -> pd.DataFrame:
+    """The node's rows that may satisfy the filter. When the node is only on
+    disk, zones whose min/max rule out the predicate are not read at all."""
+    if (session_id, node_id) in node_cache or not node_store.exists(
+        session_id, node_id
+    ):
+        return read_node(session_id, node_id)
+    profile = node_profiles.read(session_id, node_id)
+    if profile is None:
+        return read_node(session_id, node_id)
+    ranges = matching_zones(profile, **params)
+    if ranges is None or len(ranges) == len(
+        profile["columns"][params["column"]]["zones"]
+    ):
+        return read_node(session_id, node_id)
+    return node_store.read_ranges(session_id, node_id, ranges)
+
+
+def session_exists(session_id: str) -> bool:
+    """Whether the session exists, restoring it first if it was archived."""
+    if not metadata_store.exists(session_id) and not (
+        session_archive.restore(session_id) and metadata_store.exists(session_id)
+    ):
+        return False
+    access_log.touch(session_id)
+    return True
+
+
+def load_node(session_id: str, node_id: str) -> Dict[str, Any]:
+    if not session_exists(session_id):
+        raise HTTPException(status_code=404, detail="Session not found")
+    with metadata_store.snapshot(session_id) as metadata:
+        node = metadata.get_node(node_id)
+    if node is None:
+        raise HTTPException(status_code=404, detail="Node not found")
+    access_log.touch(session_id, node_id)
+    return node
+
+
+def require_columns(node, columns):
+    missing = [c for c in columns if c not in node.get("columns", [])]
+    if missing:
+        raise HTTPException(
+            status_code=400, detail=f"Column not found: {', '.join(missing)}"
+        )
 
-def load_metadata(session_id):
-    with open(os.path.join("sessions", session_id, "metadata.json")) as file:
-        metadata = json.loads(file.read())
-    return metadata
 
+def make_recipe(op: str, src_id: str, params: Dict[str, Any]) -> Dict[str, Any]:
+    return {"op": op, "src_id": src_id, "params": params}
 
-def dump_metadata(metadata, session_id):
-    with open(os.path.join("sessions", session_id, "metadata.json"), "w") as file:
-        json.dump(metadata, file)
-        file.flush()
-        os.fsync(file.fileno())
+
+def lookup_memo(session_id: str, recipe: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    if recipe["op"] in UNMEMOIZED_OPERATIONS:
+        return None
+    fingerprint = recipe_fingerprint(recipe)
+    with metadata_store.snapshot(session_id) as metadata:
+        memo = metadata.get_memo(fingerprint)
+    memo_stats.record(recipe["op"], memo is not None)
+    if memo is not None:
+        with metadata_store.transaction(session_id) as metadata:
+            metadata.record_memo_hit(fingerprint)
+    return memo
+
+
+def memo_response(
+    session_id: str,
+    recipe: Dict[str, Any],
+    lazy: bool = False,
+    wrap=lambda content: content,
+    from_node: Optional[Callable[[str], Any]] = None,
+):
+    """The earlier response to the same operation on the same node, or None
+    when it has to be computed. Responses that were not stored are rebuilt
+    from the result node with ``from_node`` when given."""
+    memo = lookup_memo(session_id, recipe)
+    if memo is None:
+        return None
+    if lazy:
+        return JSONResponse(content={"node_id": memo["node_id"]}, status_code=200)
+    if memo["content"] is not None:
+        return json_response(wrap(memo["content"]))
+    if from_node is not None:
+        try:
+            return json_response(from_node(memo["node_id"]))
+        except FileNotFoundError:
+            return None
+    return None
+
+
+def group_results(result: pd.Series) -> Dict[str, Any]:
+    return {group_key(key): to_json_scalar(value) for key, value in result.items()}
+
+
+def scalar_content(result, func: str):
+    """An ungrouped aggregate as the tools return it: counts are ints and
+    everything else a float."""
+    if result is None:
+        return None
+    if func in COUNT_AGGREGATIONS:
+        return int(result)
+    try:
+        return float(result)
+    except (TypeError, ValueError):
+        # e.g. the sum of a text column concatenates it
+        raise HTTPException(
+            status_code=400, detail="Column does not support aggregation"
+        )
+
+
+def remember(metadata: SessionMetadata, recipe: Dict[str, Any], node_id: str, content):
+    if recipe["op"] in UNMEMOIZED_OPERATIONS:
+        return
+    encoded = None
+    if content is not None:
+        encoded = dumps(content)
+        if len(encoded) > MEMO_CONTENT_MAX_BYTES:
+            encoded = None
+    metadata.set_memo(recipe_fingerprint(recipe), node_id, encoded)
+
+
+def memoized_node(metadata: SessionMetadata, recipe: Dict[str, Any]) -> Optional[str]:
+    if recipe["op"] in UNMEMOIZED_OPERATIONS:
+        return None
+    memo = metadata.get_memo(recipe_fingerprint(recipe))
+    return None if memo is None else memo["node_id"]
+
+
+def record_result(
+    session_id: str,
+    metadata: SessionMetadata,
+    recipe: Dict[str, Any],
+    dataframe: pd.DataFrame,
+    node_name: str,
+    operation: str,
+    content,
+) -> str:
+    """Adds the result node and its edge, or fills in the node an identical
+    earlier (possibly lazy) call already created."""
+    dst_node_id = memoized_node(metadata, recipe)
+    if dst_node_id is None:
+        dst_node_id = create_data_node(
+            session_id, dataframe, metadata, node_name, recipe
+        )
+        create_edge(metadata, recipe["src_id"], dst_node_id, operation)
+    else:
+        if isinstance(dataframe, pd.Series):
+            dataframe = dataframe.to_frame()
+        dataframe = dataframe.reset_index(drop=True)
+        node_cache.put((session_id, dst_node_id), dataframe)
+        prompt_summaries.invalidate(session_id, dst_node_id)
+        metadata.update_node(dst_node_id, num_rows=len(dataframe))
+        schedule_profile(session_id, dst_node_id, dataframe)
+    remember(metadata, recipe, dst_node_id, content)
+    return dst_node_id
+
+
+def record_stored(
+    session_id: str,
+    metadata: SessionMetadata,
+    recipe: Dict[str, Any],
+    stored: StoredNode,
+    node_name: str,
+    operation: str,
+) -> str:
+    """Records a result that a streamed operation wrote straight to the node
+    store, filling in the node an identical earlier lazy call created."""
+    node_id = stored.node_id
+    if metadata.get_node(node_id) is None:
+        src_node = metadata.get_node(recipe["src_id"])
+        metadata.add_node(
+            {
+                "node_id": node_id,
+                "node_name": node_name,
+                "type": "data",
+                "columns": output_columns(
+                    recipe["op"], recipe["params"], src_node["columns"]
+                ),
+                "num_rows": stored.num_rows,
+                "recipe": recipe,
+                "materialized": True,
+            }
+        )
+        create_edge(metadata, recipe["src_id"], node_id, operation)
+    else:
+        metadata.update_node(node_id, num_rows=stored.num_rows, materialized=True)
+        prompt_summaries.invalidate(session_id, node_id)
+    remember(metadata, recipe, node_id, None)
+    profile_executor.submit(profile_node, session_id, node_id)
+    schedule_quotas(session_id)
+    return node_id
+
+
+def node_data(session_id: str, node_id: str, format: str, preview_rows: int):
+    """A data tool's response for a node that already exists. Previews only
+    read the rows they show."""
+    if format != "preview":
+        return encode_data(read_node(session_id, node_id), node_id, format, 0)
+    num_rows = load_node(session_id, node_id).get("num_rows")
+    if num_rows is None:
+        return encode_data(
+            read_node(session_id, node_id), node_id, format, preview_rows
+        )
+    head = node_head(session_id, node_id, preview_rows)
+    return encode_data(head, node_id, format, preview_rows, num_rows)
+
+
+def record_scalar(
+    metadata: SessionMetadata, recipe: Dict[str, Any], scalar, node_name: str
+) -> str:
+    dst_node_id = memoized_node(metadata, recipe)
+    if dst_node_id is None:
+        dst_node_id = create_scalar_node(metadata, scalar, node_name, recipe)
+        create_edge(metadata, recipe["src_id"], dst_node_id, node_name)
+    elif (metadata.get_node(dst_node_id) or {}).get("stale"):
+        # recomputed after rows were appended to its source
+        metadata.set_scalar(dst_node_id, scalar)
+        metadata.update_node(dst_node_id, stale=False)
+    remember(metadata, recipe, dst_node_id, scalar)
+    return dst_node_id
 
 
 def create_data_node(
-    session_id: str, dataframe: pd.DataFrame, metadata: Dict[str, Any], node_name: str
+    session_id: str,
+    dataframe: pd.DataFrame,
+    metadata: SessionMetadata,
+    node_name: str,
+    recipe: Optional[Dict[str, Any]] = None,
 ) -> str:
+    if isinstance(dataframe, pd.Series):
+        dataframe = dataframe.to_frame()
     new_node_id = str(uuid4())
-    metadata["nodes"].append(
+    dataframe = dataframe.reset_index(drop=True)
+    node = {
+        "node_id": new_node_id,
+        "node_name": node_name,
+        "type": "data",
+        "columns": list(dataframe.columns),
+        "num_rows": len(dataframe),
+    }
+    if recipe is None:
+        node_store.write(session_id, new_node_id, dataframe)
+    else:
+        # recomputable from its recipe, so it is only written out once
+        # something reads it after it has left the cache
+        node.update(recipe=recipe, materialized=False)
+    node_cache.put((session_id, new_node_id), dataframe)
+    schedule_profile(session_id, new_node_id, dataframe)
+    metadata.add_node(node)
+    return new_node_id
+
+
+def create_lazy_node(
+    metadata: SessionMetadata,
+    node_name: str,
+    columns: List[str],
+    recipe: Dict[str, Any],
+) -> str:
+    new_node_id = str(uuid4())
+    metadata.add_node(
         {
             "node_id": new_node_id,
             "node_name": node_name,
             "type": "data",
-            "columns": list(dataframe.columns),
+            "columns": columns,
+            "num_rows": None,
+            "recipe": recipe,
+            "materialized": False,
         }
     )
-    dataframe.to_csv(
-        os.path.join("sessions", session_id, f"{new_node_id}.csv"), index=False
-    )
     return new_node_id
 
 
-def create_scalar_node(metadata, scalar, node_name) -> str:
+def lazy_result(
+    session_id: str,
+    src_node: Dict[str, Any],
+    node_name: str,
+    operation: str,
+    recipe: Dict[str, Any],
+):
+    columns = output_columns(recipe["op"], recipe["params"], src_node["columns"])
+    with metadata_store.transaction(session_id) as metadata:
+        dst_node_id = memoized_node(metadata, recipe)
+        if dst_node_id is None:
+            dst_node_id = create_lazy_node(metadata, node_name, columns, recipe)
+            create_edge(metadata, src_node["node_id"], dst_node_id, operation)
+            remember(metadata, recipe, dst_node_id, None)
+    return JSONResponse(content={"node_id": dst_node_id}, status_code=200)
+
+
+def create_scalar_node(metadata, scalar, node_name, recipe=None) -> str:
     new_node_id = str(uuid4())
-    metadata["nodes"].append(
-        {"node_id": new_node_id, "node_name": node_name, "type": "scalar"}
-    )
-    metadata["scalar_map"][new_node_id] = scalar
+    node = {"node_id": new_node_id, "node_name": node_name, "type": "scalar"}
+    if recipe is not None:
+        # kept so the value can be updated when its source changes
+        node["recipe"] = recipe
+    metadata.add_node(node)
+    metadata.set_scalar(new_node_id, scalar)
     return new_node_id
 
 
 def create_edge(metadata, src_id: str, dst_id: str, operation: str):
-    metadata["edges"].append(
-        {"src_id": src_id, "dst_id": dst_id, "operation": operation}
-    )
+    metadata.add_edge(src_id, dst_id, operation)
 
 
 @app.post("/session/init")
 def init(session_name: str):
     session_id = str(uuid4())
-    os.makedirs(f"sessions/{session_id}", exist_ok=True)
-
-    with open(os.path.join("sessions", session_id, "metadata.json"), "w") as f:
-        json.dump(
-            {"session_name": session_name, "nodes": [], "edges": [], "scalar_map": {}},
-            f,
-        )
+    metadata_store.create(session_id, session_name)
 
     return {"session_id": session_id}
 
 
 @app.get("/session/{session_id}/metadata")
 def get_metadata(session_id: str):
-    file_path = f"sessions/{session_id}/metadata.json"
-
-    if not os.path.exists(file_path):
+    if not session_exists(session_id):
         raise HTTPException(status_code=404, detail="Metadata file not found")
 
-    with open(os.path.join("sessions", session_id, "metadata.json"), "r") as file:
-        try:
-            metadata = json.load(file)
-        except json.JSONDecodeError:
-            raise HTTPException(status_code=500, detail="Error decoding JSON from file")
+    with metadata_store.snapshot(session_id) as metadata:
+        content = metadata.to_dict()
 
-    return JSONResponse(content=metadata)
+    return JSONResponse(content=content)
 
 
 @app.get("/session/{session_id}/node_info")
-def get_node_info(session_id: str, node_id: str):
-    node_file_path = os.path.join("sessions", session_id, f"{node_id}.csv")
-    if not os.path.exists(node_file_path):
+def get_node_info(
+    session_id: str,
+    node_id: str,
+    offset: int = Query(0, ge=0),
+    limit: Optional[int] = Query(None, ge=0),
+    columns: Optional[List[str]] = Query(None),
+    format: str = "json",
+):
+    if format not in ("json", "ndjson", "arrow"):
+        raise HTTPException(status_code=400, detail="Invalid format")
+    node = load_node(session_id, node_id)
+    if columns is not None:
+        require_columns(node, columns)
+    try:
+        persist_node(session_id, node_id)
+    except Exception:
         raise HTTPException(status_code=404, detail="File not found")
-    data = []
-    with open(node_file_path, mode="r", newline="", encoding="utf-8") as csv_file:
-        csv_reader = csv.DictReader(csv_file)
-        for row in csv_reader:
-            data.append(row)
-    return JSONResponse(data, status_code=200)
+
+    num_rows = node.get("num_rows")
+    if num_rows is None:
+        num_rows = node_store.num_rows(session_id, node_id)
+    end = num_rows if limit is None else min(offset + limit, num_rows)
+    headers = {"X-Total-Count": str(num_rows)}
+    if end < num_rows:
+        headers["X-Next-Offset"] = str(end)
+
+    batches = node_store.iter_batches(
+        session_id, node_id, columns, offset, max(end - offset, 0)
+    )
+
+    def ndjson_rows():
+        for batch in batches:
+            with stage("encode"):
+                lines = "".join(dumps(row) + "\n" for row in dataframe_records(batch))
+            yield lines
+
+    def json_rows():
+        # a JSON array written batch by batch so rows go out before the read ends
+        yield "["
+        separator = ""
+        for batch in batches:
+            if not len(batch):
+                continue
+            with stage("encode"):
+                # the batch's rows without the brackets around them
+                rows = dumps(dataframe_records(batch))[1:-1]
+            yield separator + rows
+            separator = ","
+        yield "]"
+
+    if format == "ndjson":
+        return StreamingResponse(
+            ndjson_rows(), media_type="application/x-ndjson", headers=headers
+        )
+    if format == "arrow":
+        return StreamingResponse(
+            arrow_stream(batches, lambda: node_head(session_id, node_id, 0)),
+            media_type=ARROW_MEDIA_TYPE,
+            headers=headers,
+        )
+    return StreamingResponse(
+        json_rows(), media_type="application/json", headers=headers
+    )
+
+
+def ingest_node(session_id: str, node_id: str):
+    try:
+        num_rows = node_store.ingest_csv(session_id, node_id)
+        updates = {"ingest_status": "ready", "num_rows": num_rows}
+    except Exception as e:
+        updates = {"ingest_status": "failed", "ingest_error": str(e)}
+    with metadata_store.transaction(session_id) as metadata:
+        metadata.update_node(node_id, **updates)
+    # a prompt built while the node was pending summarised it without rows
+    prompt_summaries.invalidate(session_id, node_id)
+    if updates["ingest_status"] == "ready":
+        # queued like the re-profile after an append, so whichever of them
+        # runs last profiles the current contents
+        profile_executor.submit(profile_node, session_id, node_id)
 
 
 @app.post("/session/{session_id}/upload")
-async def upload(session_id: str, file: UploadFile):
+async def upload(session_id: str, file: UploadFile, background_tasks: BackgroundTasks):
     if file.content_type != "text/csv":
         raise HTTPException(status_code=400, detail="File is not csv")
-    # todo - check session id is valid
-
-    contents = await file.read()
-    dataframe = pd.read_csv(io.StringIO(contents.decode("utf-8")))
+    if not await run_in_threadpool(session_exists, session_id):
+        raise HTTPException(status_code=404, detail="Session not found")
 
     node_id = str(uuid4())
+    csv_path = node_store.csv_path(session_id, node_id)
+
+    def copy_upload():
+        with open(csv_path, "wb") as f:
+            shutil.copyfileobj(file.file, f, UPLOAD_CHUNK_BYTES)
 
     try:
-        with open(os.path.join("sessions", session_id, f"{node_id}.csv"), "wb") as f:
-            f.write(contents)
-
-        with open(os.path.join("sessions", session_id, "metadata.json")) as f:
-            metadata = json.loads(f.read())
-            if "nodes" not in metadata:
-                metadata["nodes"] = []
-            metadata["nodes"].append(
+        await run_in_threadpool(copy_upload)
+        await run_in_threadpool(check_quotas, session_id)
+        # only a bounded prefix is parsed here; the full conversion runs after
+        # the response has been sent
+        with stage("read"):
+            prefix = pd.read_csv(csv_path, nrows=INGEST_SNIFF_ROWS)
+    except Exception as e:
+        if os.path.exists(csv_path):
+            os.remove(csv_path)
+        if isinstance(e, HTTPException):
+            raise
+        raise HTTPException(status_code=500, detail="Failed to upload file")
+
+    def add_upload_node():
+        with metadata_store.transaction(session_id) as metadata:
+            metadata.add_node(
                 {
                     "node_id": node_id,
                     "node_name": file.filename,
                     "type": "data",
-                    "columns": list(dataframe.columns),
+                    "columns": list(prefix.columns),
+                    "num_rows": None,
+                    "ingest_status": "pending",
                 }
             )
 
-        with open(os.path.join("sessions", session_id, "metadata.json"), "w") as f:
-            json.dump(metadata, f)
-
-        return {"node_id": node_id}
+    try:
+        await run_in_threadpool(add_upload_node)
     except Exception:
         raise HTTPException(status_code=500, detail="Failed to upload file")
 
+    background_tasks.add_task(ingest_node, session_id, node_id)
+    return {"node_id": node_id}
+
+
+def drop_derived(session_id: str, node_id: str):
+    node_profiles.drop(session_id, node_id)
+    node_sketches.drop(session_id, node_id)
+    node_indexes.drop(session_id, node_id)
+
+
+def contents_changed(session_id: str, node_id: str):
+    """Forgets what was built from a node's earlier contents. Builds queued
+    before the change are dropped again behind them, and stored nodes are
+    profiled afresh."""
+    prompt_summaries.invalidate(session_id, node_id)
+    drop_derived(session_id, node_id)
+    profile_executor.submit(drop_derived, session_id, node_id)
+    if node_store.exists(session_id, node_id):
+        profile_executor.submit(profile_node, session_id, node_id)
+
+
+def append_contents(
+    session_id: str,
+    metadata: SessionMetadata,
+    node: Dict[str, Any],
+    rows: pd.DataFrame,
+):
+    node_id = node["node_id"]
+    if node_store.exists(session_id, node_id):
+        node_store.append(session_id, node_id, rows)
+    cached = node_cache.get((session_id, node_id))
+    if cached is not None:
+        node_cache.put(
+            (session_id, node_id), pd.concat([cached, rows], ignore_index=True)
+        )
+    if node.get("num_rows") is not None:
+        metadata.update_node(node_id, num_rows=node["num_rows"] + len(rows))
+    contents_changed(session_id, node_id)
+
+
+def replace_contents(
+    session_id: str,
+    metadata: SessionMetadata,
+    node_id: str,
+    dataframe: pd.DataFrame,
+):
+    dataframe = dataframe.reset_index(drop=True)
+    if node_store.exists(session_id, node_id):
+        node_store.delete(session_id, node_id)
+        node_store.write(session_id, node_id, dataframe)
+    node_cache.put((session_id, node_id), dataframe)
+    metadata.update_node(node_id, num_rows=len(dataframe))
+    contents_changed(session_id, node_id)
+
+
+def incremental(session_id: str, node: Dict[str, Any]) -> bool:
+    """Whether rows appended to the node's source can be applied to the node
+    without recomputing it."""
+    recipe = node.get("recipe")
+    if recipe is None:
+        return False
+    if recipe["op"] in MASK_OPERATIONS:
+        return True
+    if node["type"] == "data" and not has_contents(session_id, node["node_id"]):
+        # never computed or evicted; it is rebuilt from the source on demand
+        return False
+    if recipe["op"] == "aggregate":
+        return recipe["params"]["func"] in INCREMENTAL_AGGREGATIONS
+    return recipe["op"] == "value_counts"
+
+
+def apply_delta(
+    session_id: str,
+    metadata: SessionMetadata,
+    node: Dict[str, Any],
+    delta: pd.DataFrame,
+) -> pd.DataFrame:
+    """Updates an incremental node for rows appended to its source and returns
+    the rows the node gained."""
+    node_id = node["node_id"]
+    recipe = node["recipe"]
+    op, params = recipe["op"], recipe["params"]
+    if op in MASK_OPERATIONS:
+        rows = OPERATIONS[op](delta, params).reset_index(drop=True)
+        if len(rows):
+            append_contents(session_id, metadata, node, rows)
+        return rows
+
+    # the first append starts from the whole source, which already holds the
+    # delta; later ones merge it into the stored partials
+    partial = node_partials.read(session_id, node_id)
+    if op == "value_counts":
+        column = params["column"]
+        if partial is None:
+            source = read_node(session_id, recipe["src_id"], [column])
+            partial = value_counts_partial(source, column)
+        else:
+            partial = merge_value_counts(partial, value_counts_partial(delta, column))
+        result = value_counts_result(partial, column)
+        replace_contents(session_id, metadata, node_id, result)
+        content = result["count"].to_dict()
+    else:
+        column, func, gb_cols = params["column"], params["func"], params["gb_cols"]
+        if partial is None:
+            source = read_node(session_id, recipe["src_id"], input_columns(op, params))
+            partial = aggregate_partial(source, column, func, gb_cols)
+        else:
+            partial = merge_aggregate(
+                partial, aggregate_partial(delta, column, func, gb_cols)
+            )
+        result = partial_result(partial, column, func, gb_cols)
+        if gb_cols:
+            replace_contents(session_id, metadata, node_id, pd.DataFrame(result))
+            content = group_results(result)
+        else:
+            content = scalar_content(result, func)
+            metadata.set_scalar(node_id, content)
+    node_partials.write(session_id, node_id, partial)
+    remember(metadata, recipe, node_id, content)
+    return delta.iloc[:0]
+
+
+def invalidate_node(
+    session_id: str,
+    metadata: SessionMetadata,
+    node: Dict[str, Any],
+    changes: Dict[str, List[str]],
+):
+    """Drops a node's contents so they are recomputed from its recipe, with
+    those of every node derived from it. Scalars are marked stale instead."""
+    node_id = node["node_id"]
+    if node_id in changes["invalidated"]:
+        return
+    recipe = node.get("recipe")
+    if recipe is not None and recipe["op"] not in UNMEMOIZED_OPERATIONS:
+        fingerprint = recipe_fingerprint(recipe)
+        memo = metadata.get_memo(fingerprint)
+        if memo is not None and memo["node_id"] == node_id:
+            metadata.set_memo(fingerprint, node_id, None)
+    node_partials.drop(session_id, node_id)
+    if node["type"] == "scalar" or recipe is None:
+        metadata.update_node(node_id, stale=True)
+    else:
+        node_cache.invalidate((session_id, node_id))
+        node_store.delete(session_id, node_id)
+        metadata.update_node(node_id, materialized=False, num_rows=None)
+        contents_changed(session_id, node_id)
+    changes["invalidated"].append(node_id)
+    for child in metadata.children(node_id):
+        invalidate_node(session_id, metadata, child, changes)
+
+
+def propagate_delta(
+    session_id: str,
+    metadata: SessionMetadata,
+    src_id: str,
+    delta: pd.DataFrame,
+    changes: Dict[str, List[str]],
+):
+    """Applies rows appended to ``src_id`` to the nodes derived from it:
+    filters gain the matching rows, sum/count/min/max/mean/std and
+    value_counts results are merged from partials, and everything else is
+    invalidated."""
+    if delta.empty:
+        return
+    for child in metadata.children(src_id):
+        child_id = child["node_id"]
+        if not incremental(session_id, child):
+            invalidate_node(session_id, metadata, child, changes)
+            continue
+        try:
+            rows = apply_delta(session_id, metadata, child, delta)
+        except Exception:
+            # e.g. a sum over a column the delta holds text in
+            invalidate_node(session_id, metadata, child, changes)
+            continue
+        changes["updated"].append(child_id)
+        if child["recipe"]["op"] in MASK_OPERATIONS:
+            propagate_delta(session_id, metadata, child_id, rows, changes)
+        else:
+            # results of aggregates change in place rather than grow
+            for grandchild in metadata.children(child_id):
+                invalidate_node(session_id, metadata, grandchild, changes)
+
+
+@app.post("/session/{session_id}/append/{node_id}")
+def append_rows(session_id: str, node_id: str, file: UploadFile):
+    """Appends the rows of a CSV to an uploaded node and brings the nodes
+    derived from it up to date."""
+    if file.content_type != "text/csv":
+        raise HTTPException(status_code=400, detail="File is not csv")
+    node = load_node(session_id, node_id)
+    if node["type"] != "data" or "recipe" in node:
+        raise HTTPException(
+            status_code=400, detail="Bad request (can only append to uploaded nodes)"
+        )
+    if node.get("ingest_status") == "pending":
+        raise HTTPException(status_code=409, detail="Node is still being ingested")
+    try:
+        with stage("read"):
+            delta = pd.read_csv(file.file)
+    except Exception:
+        raise HTTPException(status_code=400, detail="Failed to parse file")
+    if len(delta.columns) != len(node["columns"]) or set(delta.columns) != set(
+        node["columns"]
+    ):
+        raise HTTPException(
+            status_code=400,
+            detail=f"Columns do not match the node: {', '.join(node['columns'])}",
+        )
+    delta = delta[node["columns"]]
+    check_quotas(session_id)
+
+    changes = {"updated": [], "invalidated": []}
+    with metadata_store.transaction(session_id) as metadata:
+        try:
+            with stage("write"):
+                num_rows = node_store.append(session_id, node_id, delta)
+        except FileNotFoundError:
+            raise HTTPException(status_code=404, detail="File not found")
+        except ValueError:
+            raise HTTPException(
+                status_code=400, detail="Appended rows do not match the node's types"
+            )
+        node_cache.invalidate((session_id, node_id))
+        metadata.update_node(node_id, num_rows=num_rows)
+        contents_changed(session_id, node_id)
+        with stage("compute"):
+            propagate_delta(session_id, metadata, node_id, delta, changes)
+    return {
+        "node_id": node_id,
+        "num_rows": num_rows,
+        "appended_rows": len(delta),
+        **changes,
+    }
+
+
+def stored_bytes(session_id: str, node_id: str) -> int:
+    total = 0
+    for path in (
+        node_store.blob_path(session_id, node_id),
+        node_store.csv_path(session_id, node_id),
+    ):
+        try:
+            total += os.path.getsize(path)
+        except FileNotFoundError:
+            pass
+    return total
+
+
+def cold_nodes(
+    session_id: str, min_idle: float = EVICTION_MIN_IDLE_SECONDS
+) -> List[Tuple[float, str, str, int]]:
+    """(last used, session, node, bytes) of the session's stored nodes that
+    their recipes can rebuild and that have not been used for ``min_idle``
+    seconds, least recently used first."""
+    with metadata_store.snapshot(session_id) as metadata:
+        nodes = metadata.nodes()
+    now = time.time()
+    cold = []
+    for node in nodes:
+        node_id = node["node_id"]
+        if "recipe" not in node or not node_store.exists(session_id, node_id):
+            continue
+        last_used = access_log.node_last_used(
+            session_id,
+            node_id,
+            node_store.blob_path(session_id, node_id),
+            node_store.csv_path(session_id, node_id),
+        )
+        if now - last_used >= min_idle:
+            cold.append(
+                (last_used, session_id, node_id, stored_bytes(session_id, node_id))
+            )
+    cold.sort()
+    return cold
+
+
+def evict_node(session_id: str, node_id: str) -> int:
+    """Deletes a node's stored contents, which its recipe rebuilds when the
+    node is next read. Returns the bytes freed."""
+    freed = stored_bytes(session_id, node_id)
+    with metadata_store.transaction(session_id) as metadata:
+        node_store.delete(session_id, node_id)
+        metadata.update_node(node_id, materialized=False)
+    drop_derived(session_id, node_id)
+    return freed
+
+
+def evict_cold_nodes(cold: List[Tuple[float, str, str, int]], excess: int) -> int:
+    freed = 0
+    for _, session_id, node_id, _ in cold:
+        if freed >= excess:
+            break
+        try:
+            freed += evict_node(session_id, node_id)
+        except FileNotFoundError:
+            # the session was archived in the meantime
+            pass
+    return freed
+
+
+def archive_session(session_id: str) -> int:
+    """Moves a session to cold storage. Its intermediate nodes are evicted
+    first, so the archive holds the uploads, the metadata and the sidecars.
+    Returns the archive's size."""
+    for _, _, node_id, _ in cold_nodes(session_id, min_idle=0):
+        evict_node(session_id, node_id)
+    metadata_store.compact(session_id)
+    node_cache.invalidate_session(session_id)
+    access_log.forget(session_id)
+    return session_archive.archive(session_id)
+
+
+def idle_sessions(min_idle: float) -> List[str]:
+    """Sessions without running jobs that have not been used for
+    ``min_idle`` seconds, least recently used first."""
+    now = time.time()
+    idle = []
+    for session_id in session_ids():
+        try:
+            last_used = access_log.session_last_used(session_id)
+            if now - last_used < min_idle:
+                continue
+            with metadata_store.snapshot(session_id) as metadata:
+                if metadata.active_jobs():
+                    continue
+        except FileNotFoundError:
+            continue
+        idle.append((last_used, session_id))
+    return [session_id for _, session_id in sorted(idle)]
+
+
+def enforce_quotas(sessions: List[str]) -> Dict[str, int]:
+    """Brings ``sessions`` within the session quota and hot storage within
+    the global one: cold intermediate nodes are evicted, then idle sessions
+    are archived."""
+    report = {"evicted_bytes": 0, "archived_sessions": 0}
+    with maintenance_lock:
+        if SESSION_QUOTA_BYTES:
+            for session_id in sessions:
+                try:
+                    excess = disk_usage(session_dir(session_id)) - SESSION_QUOTA_BYTES
+                    if excess > 0:
+                        report["evicted_bytes"] += evict_cold_nodes(
+                            cold_nodes(session_id), excess
+                        )
+                except FileNotFoundError:
+                    continue
+        if not STORAGE_QUOTA_BYTES:
+            return report
+        excess = disk_usage(SESSIONS_DIR) - STORAGE_QUOTA_BYTES
+        if excess > 0:
+            cold = sorted(c for s in session_ids() for c in cold_nodes(s))
+            freed = evict_cold_nodes(cold, excess)
+            report["evicted_bytes"] += freed
+            excess -= freed
+        for session_id in idle_sessions(EVICTION_MIN_IDLE_SECONDS):
+            if excess <= 0:
+                break
+            size = disk_usage(session_dir(session_id))
+            archive_session(session_id)
+            report["archived_sessions"] += 1
+            excess -= size
+    return report
+
+
+def check_quotas(session_id: str):
+    """Makes room before a write that cannot be recomputed, and refuses it
+    when the quotas are still exceeded."""
+    if not (SESSION_QUOTA_BYTES or STORAGE_QUOTA_BYTES):
+        return
+    enforce_quotas([session_id])
+    if (
+        SESSION_QUOTA_BYTES
+        and disk_usage(session_dir(session_id)) > SESSION_QUOTA_BYTES
+    ):
+        raise HTTPException(status_code=413, detail="Session storage quota exceeded")
+    if STORAGE_QUOTA_BYTES and disk_usage(SESSIONS_DIR) > STORAGE_QUOTA_BYTES:
+        raise HTTPException(status_code=507, detail="Storage quota exceeded")
+
+
+def fail_interrupted_jobs(started_at: float) -> int:
+    """Fails the jobs an earlier process left queued or running: their
+    futures went with it, so nothing would ever finish them, and the session
+    would count as busy for good."""
+    failed = 0
+    for session_id in session_ids():
+        try:
+            with metadata_store.transaction(session_id) as metadata:
+                failed += metadata.fail_unfinished_jobs(
+                    started_at, "Server restarted before the job finished"
+                )
+        except FileNotFoundError:
+            continue
+    return failed
+
+
+def run_maintenance() -> Dict[str, int]:
+    """Prunes finished jobs, removes orphaned files, compacts session
+    metadata, archives idle sessions and enforces the quotas."""
+    report = {"pruned_jobs": 0, "orphan_bytes": 0, "vacuumed": 0}
+    with maintenance_lock:
+        now = time.time()
+        for session_id in session_ids():
+            try:
+                with metadata_store.transaction(session_id) as metadata:
+                    report["pruned_jobs"] += metadata.prune_jobs(
+                        now - JOB_RETENTION_SECONDS
+                    )
+                    node_ids = {node["node_id"] for node in metadata.nodes()}
+                report["orphan_bytes"] += remove_orphans(
+                    session_id, node_ids, now - ORPHAN_MIN_AGE_SECONDS
+                )
+                report["vacuumed"] += metadata_store.compact(session_id)
+            except FileNotFoundError:
+                continue
+        archived = 0
+        if SESSION_ARCHIVE_AFTER_SECONDS > 0:
+            for session_id in idle_sessions(SESSION_ARCHIVE_AFTER_SECONDS):
+                archive_session(session_id)
+                archived += 1
+        report.update(enforce_quotas(session_ids()))
+        report["archived_sessions"] += archived
+    return report
+
+
+@app.get("/storage/stats")
+def storage_stats(session_id: Optional[str] = None):
+    stats = {
+        "sessions": len(session_ids()),
+        "session_bytes": disk_usage(SESSIONS_DIR),
+        "archived_sessions": len(session_archive.session_ids()),
+        "archive_bytes": session_archive.usage(),
+        "session_quota_bytes": SESSION_QUOTA_BYTES,
+        "storage_quota_bytes": STORAGE_QUOTA_BYTES,
+    }
+    if session_id is not None:
+        if not session_exists(session_id):
+            raise HTTPException(status_code=404, detail="Session not found")
+        cold = cold_nodes(session_id)
+        stats["session"] = {
+            "bytes": disk_usage(session_dir(session_id)),
+            "cold_nodes": len(cold),
+            "cold_bytes": sum(size for *_, size in cold),
+        }
+    return stats
+
+
+@app.post("/storage/maintenance")
+def storage_maintenance():
+    """Runs the periodic maintenance pass now."""
+    return run_maintenance()
+
+
+@app.post("/session/{session_id}/archive")
+def archive(session_id: str):
+    """Moves the session to cold storage now; it is restored on next use."""
+    if not session_exists(session_id):
+        raise HTTPException(status_code=404, detail="Session not found")
+    with maintenance_lock:
+        with metadata_store.snapshot(session_id) as metadata:
+            if metadata.active_jobs():
+                raise HTTPException(status_code=409, detail="Session has running jobs")
+        return {"session_id": session_id, "archive_bytes": archive_session(session_id)}
+
+
+@app.get("/cache/stats")
+def cache_stats():
+    return node_cache.stats()
+
+
+@app.get("/metrics")
+def get_metrics():
+    return PlainTextResponse(
+        metrics.render(), media_type="text/plain; version=0.0.4; charset=utf-8"
+    )
+
+
+@app.get("/profiler")
+def profiler_stats():
+    return profiler.stats()
+
+
+@app.post("/profiler/start")
+def start_profiler(interval: float = Query(0.005, ge=PROFILER_MIN_INTERVAL)):
+    """Starts sampling every thread's stack each ``interval`` seconds."""
+    if not profiler.start(interval):
+        raise HTTPException(status_code=409, detail="Profiler already running")
+    return profiler.stats()
+
+
+@app.post("/profiler/stop")
+def stop_profiler():
+    """Stops sampling and returns the samples as collapsed stacks."""
+    if not profiler.running:
+        raise HTTPException(status_code=409, detail="Profiler not running")
+    return PlainTextResponse(profiler.stop())
+
+
+@app.get("/memo/stats")
+def get_memo_stats(session_id: Optional[str] = None):
+    stats = memo_stats.stats()
+    if session_id is not None:
+        if not session_exists(session_id):
+            raise HTTPException(status_code=404, detail="Session not found")
+        with metadata_store.snapshot(session_id) as metadata:
+            stats["session"] = metadata.memo_stats()
+    return stats
+
 
 @app.post("/session/{session_id}/export/{node_id}")
 def export(session_id: str, node_id: str):
-    file_path = os.path.join("sessions", session_id, f"{node_id}.csv")
+    load_node(session_id, node_id)
+    try:
+        persist_node(session_id, node_id)
+    except Exception:
+        raise HTTPException(status_code=404, detail="File not found")
+
+    return FileResponse(node_store.export_csv(session_id, node_id))
 
-    if not os.path.exists(file_path):
+
+@app.post("/session/{session_id}/index/{node_id}")
+def build_index(session_id: str, node_id: str, column: str):
+    """Indexes a numeric column now rather than after its first filter."""
+    node = load_node(session_id, node_id)
+    if node["type"] != "data":
+        raise HTTPException(status_code=400, detail="Bad request (cannot index scalar)")
+    require_columns(node, [column])
+    try:
+        persist_node(session_id, node_id)
+        index = index_node(session_id, node_id, column)
+    except (FileNotFoundError, OSError):
         raise HTTPException(status_code=404, detail="File not found")
+    if index is None:
+        raise HTTPException(status_code=400, detail="Column is not numeric")
+    return {
+        "node_id": node_id,
+        "column": column,
+        "num_rows": len(index),
+        "null_count": len(index.nulls),
+    }
 
-    return FileResponse(file_path)
+
+def tool_result(compute: Callable[[], Any], error_detail: Optional[str] = None):
+    try:
+        with stage("compute"):
+            result = compute()
+        if isinstance(result, (pd.DataFrame, pd.Series)):
+            count("rows_out", len(result))
+        elif isinstance(result, StoredNode):
+            count("rows_out", result.num_rows)
+        return result
+    except BrokenExecutor:
+        raise HTTPException(status_code=503, detail="Worker process failed")
+    except (FileNotFoundError, OSError):
+        raise HTTPException(status_code=404, detail="File not found")
+    except Exception:
+        if error_detail is None:
+            raise
+        raise HTTPException(status_code=400, detail=error_detail)
+
+
+def run_tool(
+    session_id: str,
+    node: Dict[str, Any],
+    operation: str,
+    background_tasks: BackgroundTasks,
+    fn: Callable,
+    args: tuple,
+    finish: Callable[[Any], Any],
+    columns: Optional[List[str]] = None,
+    filter_params: Optional[Dict[str, Any]] = None,
+    error_detail: Optional[str] = None,
+    stream_fn: Optional[Callable] = None,
+    stream_args: Optional[tuple] = None,
+):
+    """Runs ``fn(dataset, *args)`` over the node's ``columns`` and hands the
+    result to ``finish``, which records lineage and returns the response.
+
+    Small inputs are computed in this thread. Larger ones go to the worker
+    processes so they don't hold this process's GIL; past
+    ASYNC_JOB_MIN_ROWS the request returns a job to poll instead of waiting.
+    Inputs that would not fit in MEMORY_BUDGET_BYTES are passed to
+    ``stream_fn(batches, *stream_args)`` as bounded batches instead.
+    Selective filters on an indexed column only read the matching rows.
+    """
+    node_id = node["node_id"]
+    if filter_params is not None:
+        try:
+            dataset = indexed_rows(session_id, node_id, filter_params)
+        except (FileNotFoundError, OSError):
+            dataset = None
+        if dataset is not None:
+            count("rows_in", len(dataset))
+            result = tool_result(lambda: fn(dataset, *args), error_detail)
+            return json_response(finish(result))
+        schedule_index(session_id, node, filter_params["column"])
+    with metadata_store.snapshot(session_id) as metadata:
+        try:
+            src_id, steps = node_plan(
+                metadata, node_id, lambda src_id: node_store.exists(session_id, src_id)
+            )
+        except FileNotFoundError:
+            src_id, steps = node_id, []
+        src_node = metadata.get_node(src_id) or {}
+    num_rows = src_node.get("num_rows") or 0
+
+    batch_rows = None
+    if stream_fn is not None and all(op in MASK_OPERATIONS for op, _ in steps):
+        try:
+            stored_bytes = node_store.blob_size(session_id, src_id)
+        except OSError:
+            stored_bytes = 0
+        read_columns = required_columns(steps, columns) if steps else columns
+        if read_columns is not None and src_node.get("columns"):
+            stored_bytes *= len(read_columns) / len(src_node["columns"])
+        batch_rows = stream_batch_rows(stored_bytes, num_rows, MEMORY_BUDGET_BYTES)
+    if batch_rows is not None:
+        fn, args = stream_fn, args if stream_args is None else stream_args
+
+    if num_rows < EXECUTOR_MIN_ROWS and batch_rows is None:
+        try:
+            if filter_params is not None:
+                dataset = filter_input(session_id, node_id, filter_params)
+            else:
+                dataset = read_node(session_id, node_id, columns)
+        except Exception:
+            raise HTTPException(status_code=404, detail="File not found")
+        count("rows_in", len(dataset))
+        result = tool_result(lambda: fn(dataset, *args), error_detail)
+        return json_response(finish(result))
+
+    # batches and worker processes see the whole stored source node
+    count("rows_in", num_rows)
+    ranges = None
+    if filter_params is not None and not steps:
+        profile = node_profiles.read(session_id, src_id)
+        if profile is not None:
+            ranges = matching_zones(profile, **filter_params)
+    if num_rows < EXECUTOR_MIN_ROWS:
+        batches = node_batches(
+            node_store, session_id, src_id, steps, columns, ranges, batch_rows
+        )
+        result = tool_result(lambda: fn(batches, *args), error_detail)
+        return json_response(finish(result))
+    try:
+        future = node_executor.submit(
+            session_id, src_id, steps, columns, ranges, batch_rows, fn, *args
+        )
+    except ExecutorBusy:
+        raise HTTPException(
+            status_code=503, detail="Server busy", headers={"Retry-After": "1"}
+        )
+    if num_rows < ASYNC_JOB_MIN_ROWS:
+        return json_response(finish(tool_result(future.result, error_detail)))
+
+    job_id = str(uuid4())
+    with metadata_store.transaction(session_id) as metadata:
+        metadata.add_job(job_id, operation, node_id)
+    background_tasks.add_task(
+        complete_job, session_id, job_id, future, finish, error_detail
+    )
+    return JSONResponse(content={"job_id": job_id, "status": "queued"}, status_code=202)
+
+
+def complete_job(session_id, job_id, future, finish, error_detail=None):
+    running = False
+    while not wait([future], timeout=JOB_POLL_SECONDS).done:
+        if not running and future.running():
+            running = True
+            with metadata_store.transaction(session_id) as metadata:
+                metadata.update_job(job_id, "running")
+    try:
+        result = finish(tool_result(future.result, error_detail))
+        updates = {"status": "done", "result": dumps(result)}
+    except HTTPException as e:
+        updates = {"status": "failed", "error": e.detail}
+    except Exception as e:
+        updates = {"status": "failed", "error": str(e)}
+    with metadata_store.transaction(session_id) as metadata:
+        metadata.update_job(job_id, **updates)
+
+
+def read_job(session_id: str, job_id: str) -> Dict[str, Any]:
+    if not session_exists(session_id):
+        raise HTTPException(status_code=404, detail="Session not found")
+    with metadata_store.snapshot(session_id) as metadata:
+        job = metadata.get_job(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
+
+@app.get("/session/{session_id}/jobs/{job_id}")
+def get_job(session_id: str, job_id: str):
+    return read_job(session_id, job_id)
+
+
+@app.get("/session/{session_id}/jobs/{job_id}/stream")
+async def stream_job(session_id: str, job_id: str):
+    job = await run_in_threadpool(read_job, session_id, job_id)
+
+    async def job_updates():
+        nonlocal job
+        status = None
+        while True:
+            if job["status"] != status:
+                status = job["status"]
+                yield json.dumps(job) + "\n"
+            if status in ("done", "failed"):
+                return
+            await asyncio.sleep(JOB_POLL_SECONDS)
+            job = await run_in_threadpool(read_job, session_id, job_id)
+
+    return StreamingResponse(job_updates(), media_type="application/x-ndjson")
+
+
+@app.get("/executor/stats")
+def executor_stats():
+    return node_executor.stats()
+
+
+def filter_tool(
+    session_id: str,
+    node: Dict[str, Any],
+    recipe: Dict[str, Any],
+    background_tasks: BackgroundTasks,
+    lazy: bool,
+    format: str,
+    preview_rows: int,
+    error_detail: str,
+):
+    op, params = recipe["op"], recipe["params"]
+    operation = (
+        "filter" if op == "filter" else f"filter({render_expression(params['expr'])})"
+    )
+    memoized = memo_response(
+        session_id,
+        recipe,
+        lazy,
+        from_node=lambda dst_node_id: node_data(
+            session_id, dst_node_id, format, preview_rows
+        ),
+    )
+    if memoized is not None:
+        return memoized
+    if lazy:
+        require_columns(node, input_columns(op, params))
+        return lazy_result(session_id, node, "filter()", operation, recipe)
+
+    def finish(filtered):
+        with metadata_store.transaction(session_id) as metadata:
+            if isinstance(filtered, StoredNode):
+                dst_node_id = record_stored(
+                    session_id, metadata, recipe, filtered, "filter()", operation
+                )
+            else:
+                dst_node_id = record_result(
+                    session_id,
+                    metadata,
+                    recipe,
+                    filtered,
+                    "filter()",
+                    operation,
+                    None,
+                )
+        if isinstance(filtered, StoredNode):
+            return node_data(session_id, dst_node_id, format, preview_rows)
+        return encode_data(filtered, dst_node_id, format, preview_rows)
+
+    stream_fn = stream_args = None
+    if format == "preview":
+        # a streamed filter writes its result to the store as it goes; the
+        # full formats need the whole result in memory anyway
+        with metadata_store.snapshot(session_id) as metadata:
+            dst_node_id = memoized_node(metadata, recipe) or str(uuid4())
+        stream_fn = stream_filter
+        stream_args = (
+            params,
+            NODE_STORAGE,
+            NODE_DEDUP,
+            session_id,
+            dst_node_id,
+            op,
+        )
+
+    return run_tool(
+        session_id,
+        node,
+        op,
+        background_tasks,
+        OPERATIONS[op],
+        (params,),
+        finish,
+        filter_params=params if op == "filter" else None,
+        error_detail=error_detail,
+        stream_fn=stream_fn,
+        stream_args=stream_args,
+    )
 
 
 @app.post("/tools/filter/")
 def tools_filter(
-    session_id: str, node_id: str, column, filter_operator: str, filter_value: float
+    session_id: str,
+    node_id: str,
+    column,
+    filter_operator: str,
+    filter_value: float,
+    background_tasks: BackgroundTasks,
+    lazy: bool = False,
+    format: str = "preview",
+    preview_rows: int = Query(PREVIEW_ROWS, ge=0),
 ):
-    metadata = load_metadata(session_id)
-    node = next(n for n in metadata["nodes"] if n["node_id"] == node_id)
+    node = load_node(session_id, node_id)
     if node["type"] != "data":
         raise HTTPException(status_code=400, detail="Bad request (cannot sum scalar)")
-    try:
-        filepath = os.path.join("sessions", session_id, f"{node_id}.csv")
-        dataset = pd.read_csv(filepath)
-    except Exception:
-        raise HTTPException(status_code=404, detail="File not found")
     if filter_operator not in FILTER_OPERATORS:
         raise HTTPException(status_code=400, detail="Invalid operator")
-    # trust
-    try:
-        filtered = dataset[
-            FILTER_OPERATORS[filter_operator](dataset[column], filter_value)
-        ]
-    except Exception:
-        raise HTTPException(status_code=400, detail="Column is not a float")
-
-    metadata = load_metadata(session_id)
-    dst_node_id = create_data_node(
-        session_id=session_id,
-        dataframe=filtered,
-        metadata=metadata,
-        node_name="filter()",
+    if format not in DATA_FORMATS:
+        raise HTTPException(status_code=400, detail="Invalid format")
+    recipe = make_recipe(
+        "filter",
+        node_id,
+        {
+            "column": column,
+            "filter_operator": filter_operator,
+            "filter_value": filter_value,
+        },
+    )
+    return filter_tool(
+        session_id,
+        node,
+        recipe,
+        background_tasks,
+        lazy,
+        format,
+        preview_rows,
+        "Column is not a float",
     )
-    create_edge(metadata, node_id, dst_node_id, "filter")
-    dump_metadata(metadata, session_id)
-
-    return JSONResponse(content=filtered.to_dict(), status_code=200)
 
 
-@app.post("/tools/sum")
-def tools_sum(session_id: str, node_id: str, column: str, gb_col: Optional[str] = None):
-    metadata = load_metadata(session_id)
-    node = next(n for n in metadata["nodes"] if n["node_id"] == node_id)
+@app.post("/tools/filter_expr")
+def tools_filter_expr(
+    session_id: str,
+    node_id: str,
+    expr: Dict[str, Any],
+    background_tasks: BackgroundTasks,
+    lazy: bool = False,
+    format: str = "preview",
+    preview_rows: int = Query(PREVIEW_ROWS, ge=0),
+):
+    """Filters by a boolean expression over several columns (see
+    expressions.py), evaluated as one mask and recorded as one node."""
+    node = load_node(session_id, node_id)
     if node["type"] != "data":
-        raise HTTPException(status_code=400, detail="Bad request (cannot sum scalar)")
+        raise HTTPException(
+            status_code=400, detail="Bad request (cannot filter scalar)"
+        )
+    if format not in DATA_FORMATS:
+        raise HTTPException(status_code=400, detail="Invalid format")
     try:
-        filepath = os.path.join("sessions", session_id, f"{node_id}.csv")
-        dataset = pd.read_csv(filepath)
-    except Exception:
-        raise HTTPException(status_code=404, detail="File not found")
+        expr = parse_expression(expr, node.get("columns", []))
+    except ExpressionError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    recipe = make_recipe("filter_expr", node_id, {"expr": expr})
+    return filter_tool(
+        session_id,
+        node,
+        recipe,
+        background_tasks,
+        lazy,
+        format,
+        preview_rows,
+        "Filter does not match the column types",
+    )
+
+
+def aggregate_tool(
+    session_id: str,
+    node_id: str,
+    column: str,
+    func: str,
+    gb_col: Optional[str],
+    background_tasks: BackgroundTasks,
+    lazy: bool = False,
+    approximate: bool = False,
+):
+    node = load_node(session_id, node_id)
+    if node["type"] != "data":
+        raise HTTPException(
+            status_code=400, detail=f"Bad request (cannot {func} scalar)"
+        )
+    columns = [column] if gb_col is None else [gb_col, column]
+    require_columns(node, columns)
+    gb_cols = None if gb_col is None else [gb_col]
+    if approximate:
+
+        def estimate(sketches, sample):
+            content = aggregate_estimate(sketches, sample, column, func, gb_cols)
+            if gb_col is not None:
+                content["result"] = {column: content["result"]}
+                content["bounds"] = {column: content["bounds"]}
+            return content
+
+        return approximate_response(session_id, node_id, estimate)
+    recipe = make_recipe(
+        "aggregate", node_id, {"column": column, "func": func, "gb_cols": gb_cols}
+    )
+    memoized = memo_response(
+        session_id,
+        recipe,
+        lazy and gb_col is not None,
+        wrap=lambda content: content if gb_col is None else {column: content},
+    )
+    if memoized is not None:
+        return memoized
+    if lazy and gb_col is not None:
+        return lazy_result(session_id, node, f"{func}()", f"{func}({column})", recipe)
+
+    def finish(results):
+        result = results[(column, func)]
+        if gb_col is None:
+            result = scalar_content(result, func)
+        with metadata_store.transaction(session_id) as metadata:
+            if gb_col is not None:
+                groups = group_results(result)
+                record_result(
+                    session_id,
+                    metadata,
+                    recipe,
+                    pd.DataFrame(result),
+                    f"{func}()",
+                    f"{func}({column})",
+                    groups,
+                )
+                return {column: groups}
+            content = result
+            record_scalar(metadata, recipe, content, f"{func}({column})")
+            return content
+
+    profiled = (
+        {} if gb_col else profiled_aggregates(session_id, node_id, [(column, func)])
+    )
+    if profiled:
+        return json_response(finish(profiled))
+    return run_tool(
+        session_id,
+        node,
+        f"{func}({column})",
+        background_tasks,
+        aggregate,
+        ([column], [func], gb_cols),
+        finish,
+        columns=columns,
+        error_detail="Column does not support aggregation",
+        stream_fn=stream_aggregate,
+    )
 
-    if gb_col is not None:
-        gb_sum = pd.DataFrame(dataset.groupby(gb_col)[column].sum())
-        dst_node_id = create_data_node(session_id, gb_sum, metadata, "sum()")
-        content = gb_sum.to_dict()
-    else:
-        content = float(dataset[column].sum())
-        dst_node_id = create_scalar_node(metadata, content, f"sum({column})")
-    create_edge(metadata, node_id, dst_node_id, f"sum({column})")
-    dump_metadata(metadata, session_id)
 
-    return JSONResponse(content=content, status_code=200)
+@app.post("/tools/sum")
+def tools_sum(
+    session_id: str,
+    node_id: str,
+    column: str,
+    background_tasks: BackgroundTasks,
+    gb_col: Optional[str] = None,
+    lazy: bool = False,
+    approximate: bool = False,
+):
+    return aggregate_tool(
+        session_id,
+        node_id,
+        column,
+        "sum",
+        gb_col,
+        background_tasks,
+        lazy,
+        approximate,
+    )
 
 
 @app.post("/tools/mean")
 def tools_mean(
-    session_id: str, node_id: str, column: str, gb_col: Optional[str] = None
+    session_id: str,
+    node_id: str,
+    column: str,
+    background_tasks: BackgroundTasks,
+    gb_col: Optional[str] = None,
+    lazy: bool = False,
+    approximate: bool = False,
 ):
-    metadata = load_metadata(session_id)
-    node = next(n for n in metadata["nodes"] if n["node_id"] == node_id)
-    if node["type"] != "data":
-        raise HTTPException(status_code=400, detail="Bad request (cannot mean scalar)")
-    try:
-        filepath = os.path.join("sessions", session_id, f"{node_id}.csv")
-        dataset = pd.read_csv(filepath)
-    except Exception:
-        raise HTTPException(status_code=404, detail="File not found")
-
-    if gb_col is not None:
-        gb_mean = pd.DataFrame(dataset.groupby(gb_col)[column].mean())
-        dst_node_id = create_data_node(session_id, gb_mean, metadata, "mean()")
-        content = gb_mean.to_dict()
-    else:
-        content = float(dataset[column].mean())
-        dst_node_id = create_scalar_node(metadata, content, f"mean({column})")
-    create_edge(metadata, node_id, dst_node_id, f"mean({column})")
-    dump_metadata(metadata, session_id)
-
-    return JSONResponse(content=content, status_code=200)
+    return aggregate_tool(
+        session_id,
+        node_id,
+        column,
+        "mean",
+        gb_col,
+        background_tasks,
+        lazy,
+        approximate,
+    )
 
 
 @app.post("/tools/min")
-def tools_min(session_id: str, node_id: str, column: str, gb_col: Optional[str] = None):
-    metadata = load_metadata(session_id)
-    node = next(n for n in metadata["nodes"] if n["node_id"] == node_id)
-    if node["type"] != "data":
-        raise HTTPException(status_code=400, detail="Bad request (cannot min scalar)")
-    try:
-        filepath = os.path.join("sessions", session_id, f"{node_id}.csv")
-        dataset = pd.read_csv(filepath)
-    except Exception:
-        raise HTTPException(status_code=404, detail="File not found")
+def tools_min(
+    session_id: str,
+    node_id: str,
+    column: str,
+    background_tasks: BackgroundTasks,
+    gb_col: Optional[str] = None,
+    lazy: bool = False,
+    approximate: bool = False,
+):
+    return aggregate_tool(
+        session_id,
+        node_id,
+        column,
+        "min",
+        gb_col,
+        background_tasks,
+        lazy,
+        approximate,
+    )
 
-    if gb_col is not None:
-        gb_min = pd.DataFrame(dataset.groupby(gb_col)[column].min())
-        dst_node_id = create_data_node(session_id, gb_min, metadata, "min()")
-        content = gb_min.to_dict()
-    else:
-        content = float(dataset[column].min())
-        dst_node_id = create_scalar_node(metadata, content, f"min({column})")
-    create_edge(metadata, node_id, dst_node_id, f"min({column})")
-    dump_metadata(metadata, session_id)
 
-    return JSONResponse(content=content, status_code=200)
+@app.post("/tools/max")
+def tools_max(
+    session_id: str,
+    node_id: str,
+    column: str,
+    background_tasks: BackgroundTasks,
+    gb_col: Optional[str] = None,
+    lazy: bool = False,
+    approximate: bool = False,
+):
+    return aggregate_tool(
+        session_id,
+        node_id,
+        column,
+        "max",
+        gb_col,
+        background_tasks,
+        lazy,
+        approximate,
+    )
 
 
-@app.post("/tools/max")
-def tools_max(session_id: str, node_id: str, column: str, gb_col: Optional[str] = None):
-    metadata = load_metadata(session_id)
-    node = next(n for n in metadata["nodes"] if n["node_id"] == node_id)
+@app.post("/tools/aggregate")
+def tools_aggregate(
+    session_id: str,
+    node_id: str,
+    background_tasks: BackgroundTasks,
+    columns: List[str] = Query(...),
+    funcs: List[str] = Query(...),
+    gb_cols: Optional[List[str]] = Query(None),
+    lazy: bool = False,
+    approximate: bool = False,
+):
+    node = load_node(session_id, node_id)
     if node["type"] != "data":
-        raise HTTPException(status_code=400, detail="Bad request (cannot max scalar)")
-    try:
-        filepath = os.path.join("sessions", session_id, f"{node_id}.csv")
-        dataset = pd.read_csv(filepath)
-    except Exception:
-        raise HTTPException(status_code=404, detail="File not found")
-
-    if gb_col is not None:
-        gb_max = pd.DataFrame(dataset.groupby(gb_col)[column].max())
-        dst_node_id = create_data_node(session_id, gb_max, metadata, "max()")
-        content = gb_max.to_dict()
-    else:
-        content = float(dataset[column].max())
-        dst_node_id = create_scalar_node(metadata, content, f"max({column})")
-    create_edge(metadata, node_id, dst_node_id, f"max({column})")
-    dump_metadata(metadata, session_id)
+        raise HTTPException(
+            status_code=400, detail="Bad request (cannot aggregate scalar)"
+        )
+    invalid = [func for func in funcs if func not in AGGREGATIONS]
+    if invalid:
+        raise HTTPException(
+            status_code=400, detail=f"Invalid aggregation: {', '.join(invalid)}"
+        )
+    require_columns(node, list(gb_cols or []) + columns)
+    if approximate:
+
+        def estimate(sketches, sample):
+            results, bounds = {}, {}
+            for column in columns:
+                for func in funcs:
+                    content = aggregate_estimate(
+                        sketches, sample, column, func, gb_cols
+                    )
+                    results[f"{func}({column})"] = content["result"]
+                    bounds[f"{func}({column})"] = content["bounds"]
+            content = {"results": results, "bounds": bounds}
+            if gb_cols:
+                content["sample_rows"] = len(sample)
+            return content
+
+        return approximate_response(session_id, node_id, estimate)
+    recipes = {
+        f"{func}({column})": make_recipe(
+            "aggregate",
+            node_id,
+            {"column": column, "func": func, "gb_cols": gb_cols or None},
+        )
+        for column in columns
+        for func in funcs
+    }
+    if lazy and gb_cols:
+        node_ids = {}
+        with metadata_store.transaction(session_id) as metadata:
+            for name, recipe in recipes.items():
+                dst_node_id = memoized_node(metadata, recipe)
+                if dst_node_id is None:
+                    params = recipe["params"]
+                    dst_node_id = create_lazy_node(
+                        metadata, f"{params['func']}()", [params["column"]], recipe
+                    )
+                    create_edge(metadata, node_id, dst_node_id, name)
+                    remember(metadata, recipe, dst_node_id, None)
+                node_ids[name] = dst_node_id
+        return JSONResponse(content={"node_ids": node_ids}, status_code=200)
+
+    content = {}
+    node_ids = {}
+    for name, recipe in recipes.items():
+        memo = lookup_memo(session_id, recipe)
+        if memo is not None and memo["content"] is not None:
+            content[name] = memo["content"]
+            node_ids[name] = memo["node_id"]
+    pairs = [
+        (recipe["params"]["column"], recipe["params"]["func"])
+        for name, recipe in recipes.items()
+        if name not in content
+    ]
+    profiled = {} if gb_cols else profiled_aggregates(session_id, node_id, pairs)
+    missing = [pair for pair in pairs if pair not in profiled]
+
+    def finish(computed):
+        results = dict(profiled)
+        results.update({pair: computed[pair] for pair in missing})
+        if not gb_cols:
+            results = {
+                (column, func): scalar_content(result, func)
+                for (column, func), result in results.items()
+            }
+        with metadata_store.transaction(session_id) as metadata:
+            for (column, func), result in results.items():
+                name = f"{func}({column})"
+                if gb_cols:
+                    content[name] = group_results(result)
+                    node_ids[name] = record_result(
+                        session_id,
+                        metadata,
+                        recipes[name],
+                        pd.DataFrame(result),
+                        f"{func}()",
+                        name,
+                        content[name],
+                    )
+                else:
+                    content[name] = result
+                    node_ids[name] = record_scalar(
+                        metadata, recipes[name], result, name
+                    )
+        # keep the requested (column, func) order
+        return {
+            "results": {name: content[name] for name in recipes},
+            "node_ids": {name: node_ids[name] for name in recipes},
+        }
 
-    return JSONResponse(content=content, status_code=200)
+    if not missing:
+        return json_response(finish({}))
+    # only the columns and funcs with a pair that missed are computed
+    missing_columns = [c for c in columns if any(m[0] == c for m in missing)]
+    missing_funcs = [f for f in funcs if any(m[1] == f for m in missing)]
+    return run_tool(
+        session_id,
+        node,
+        "aggregate",
+        background_tasks,
+        aggregate,
+        (missing_columns, missing_funcs, gb_cols),
+        finish,
+        columns=list(gb_cols or []) + missing_columns,
+        error_detail="Column does not support aggregation",
+        stream_fn=stream_aggregate,
+    )
 
 
 @app.post("/tools/describe")
-def tools_describe(session_id: str, node_id: str, column: str):
-    metadata = load_metadata(session_id)
-    node = next(n for n in metadata["nodes"] if n["node_id"] == node_id)
+def tools_describe(
+    session_id: str,
+    node_id: str,
+    column: str,
+    background_tasks: BackgroundTasks,
+    lazy: bool = False,
+    approximate: bool = False,
+):
+    node = load_node(session_id, node_id)
     if node["type"] != "data":
         raise HTTPException(
             status_code=400, detail="Bad request (cannot describe scalar)"
         )
-    try:
-        filepath = os.path.join("sessions", session_id, f"{node_id}.csv")
-        dataset = pd.read_csv(filepath)
-    except Exception:
-        raise HTTPException(status_code=404, detail="File not found")
-    description = dataset[column].describe()
-
-    dst_node_id = create_data_node(
-        session_id, pd.DataFrame(description), metadata, "describe()"
+    require_columns(node, [column])
+    if approximate:
+        return approximate_response(
+            session_id,
+            node_id,
+            lambda sketches, sample: describe_estimate(sketches, column),
+        )
+    recipe = make_recipe("describe", node_id, {"column": column})
+    # streamed inputs too large for the quantile sketch get approximate
+    # quartiles; those results are remembered under their own recipe, so
+    # they never answer for an exact one
+    approximate_recipe = make_recipe(
+        "describe", node_id, {"column": column, "quantiles": "approximate"}
+    )
+    memoized = memo_response(session_id, recipe, lazy)
+    if memoized is None:
+        memoized = memo_response(session_id, approximate_recipe, lazy)
+    if memoized is not None:
+        return memoized
+    if lazy:
+        return lazy_result(session_id, node, "describe()", "description", recipe)
+
+    def finish(description):
+        content = {
+            stat: to_json_scalar(value) for stat, value in description[column].items()
+        }
+        used = recipe
+        if description.attrs.get("approximate"):
+            content["approximate"] = True
+            used = approximate_recipe
+        with metadata_store.transaction(session_id) as metadata:
+            record_result(
+                session_id,
+                metadata,
+                used,
+                description,
+                "describe()",
+                "description",
+                content,
+            )
+        return content
+
+    return run_tool(
+        session_id,
+        node,
+        "describe",
+        background_tasks,
+        run_describe,
+        (recipe["params"],),
+        finish,
+        columns=[column],
+        stream_fn=stream_describe,
     )
-    create_edge(metadata, node_id, dst_node_id, "description")
-    dump_metadata(metadata, session_id)
-
-    return JSONResponse(content=description.to_dict(), status_code=200)
 
 
 @app.post("/tools/sample")
-def tools_sample(session_id: str, node_id: str, n: int):
-    metadata = load_metadata(session_id)
-    node = next(n for n in metadata["nodes"] if n["node_id"] == node_id)
+def tools_sample(
+    session_id: str,
+    node_id: str,
+    background_tasks: BackgroundTasks,
+    n: int = Query(..., ge=0),
+    lazy: bool = False,
+    format: str = "preview",
+    preview_rows: int = Query(PREVIEW_ROWS, ge=0),
+):
+    node = load_node(session_id, node_id)
     if node["type"] != "data":
         raise HTTPException(
             status_code=400, detail="Bad request (cannot sample scalar)"
         )
-    try:
-        filepath = os.path.join("sessions", session_id, f"{node_id}.csv")
-        dataset = pd.read_csv(filepath)
-    except Exception:
-        raise HTTPException(status_code=404, detail="File not found")
+    if format not in DATA_FORMATS:
+        raise HTTPException(status_code=400, detail="Invalid format")
+    if node.get("num_rows") is not None and n > node["num_rows"]:
+        raise HTTPException(status_code=400, detail="Sample larger than node")
+    # a fixed seed keeps the sample reproducible when it is rebuilt from lineage
+    recipe = make_recipe(
+        "sample",
+        node_id,
+        {"n": n, "random_state": random.randrange(2**32), "method": "reservoir"},
+    )
+    if lazy:
+        return lazy_result(session_id, node, "sample()", "sample", recipe)
 
-    sample = dataset.sample(n)
+    def finish(sample):
+        with metadata_store.transaction(session_id) as metadata:
+            dst_node_id = record_result(
+                session_id, metadata, recipe, sample, "sample()", "sample", None
+            )
+        return encode_data(sample, dst_node_id, format, preview_rows)
+
+    return run_tool(
+        session_id,
+        node,
+        "sample",
+        background_tasks,
+        run_sample,
+        (recipe["params"],),
+        finish,
+        stream_fn=stream_sample,
+    )
 
-    metadata = load_metadata(session_id)
-    dst_node_id = create_data_node(session_id, sample, metadata, "sample()")
 
-    create_edge(metadata, node_id, dst_node_id, "sample")
-    dump_metadata(metadata, session_id)
+@app.post("/tools/value_counts")
+def tools_value_counts(
+    session_id: str,
+    node_id: str,
+    column: str,
+    background_tasks: BackgroundTasks,
+    lazy: bool = False,
+    approximate: bool = False,
+):
+    node = load_node(session_id, node_id)
+    if node["type"] != "data":
+        raise HTTPException(
+            status_code=400, detail="Bad request (cannot value count scalar)"
+        )
+    require_columns(node, [column])
+    if approximate:
+        return approximate_response(
+            session_id,
+            node_id,
+            lambda sketches, sample: value_counts_estimate(sketches, column),
+        )
+    recipe = make_recipe("value_counts", node_id, {"column": column})
+    memoized = memo_response(session_id, recipe, lazy)
+    if memoized is not None:
+        return memoized
+    if lazy:
+        return lazy_result(session_id, node, "value_counts()", "description", recipe)
+
+    def finish(value_counts):
+        content = value_counts["count"].to_dict()
+        with metadata_store.transaction(session_id) as metadata:
+            record_result(
+                session_id,
+                metadata,
+                recipe,
+                value_counts,
+                "value_counts()",
+                "description",
+                content,
+            )
+        return content
+
+    return run_tool(
+        session_id,
+        node,
+        "value_counts",
+        background_tasks,
+        run_value_counts,
+        (recipe["params"],),
+        finish,
+        columns=[column],
+        stream_fn=stream_value_counts,
+    )
 
-    return JSONResponse(content=sample.to_dict(), status_code=200)
 
+def record_step(
+    session_id: str, metadata: SessionMetadata, recipe: Dict[str, Any], output
+) -> Tuple[str, Any]:
+    """Records one pipeline step the way its single tool would and returns the
+    step's node with the response that tool gives."""
+    op, params = recipe["op"], recipe["params"]
+    if op in ROW_OPERATIONS:
+        node_id = record_result(
+            session_id, metadata, recipe, output, f"{op}()", op, None
+        )
+        return node_id, None
+    if op == "aggregate":
+        column, func = params["column"], params["func"]
+        name = f"{func}({column})"
+        if not params["gb_cols"]:
+            return record_scalar(metadata, recipe, output, name), output
+        groups = group_results(output)
+        node_id = record_result(
+            session_id,
+            metadata,
+            recipe,
+            pd.DataFrame(output),
+            f"{func}()",
+            name,
+            groups,
+        )
+        return node_id, {column: groups}
+    if op == "describe":
+        content = {
+            stat: to_json_scalar(value)
+            for stat, value in output[params["column"]].items()
+        }
+    else:
+        content = output["count"].to_dict()
+    node_id = record_result(
+        session_id, metadata, recipe, output, f"{op}()", "description", content
+    )
+    return node_id, content
 
-@app.post("/tools/value_counts")
-def tools_value_counts(session_id: str, node_id: str, column: str):
-    metadata = load_metadata(session_id)
-    node = next(n for n in metadata["nodes"] if n["node_id"] == node_id)
+
+@app.post("/tools/pipeline")
+def tools_pipeline(
+    session_id: str,
+    node_id: str,
+    steps: List[PipelineStep],
+    background_tasks: BackgroundTasks,
+    format: str = "preview",
+    preview_rows: int = Query(PREVIEW_ROWS, ge=0),
+):
+    node = load_node(session_id, node_id)
     if node["type"] != "data":
         raise HTTPException(
-            status_code=400, detail="Bad request (cannot value count scalar)"
+            status_code=400, detail="Bad request (cannot run pipeline on scalar)"
         )
+    if format not in DATA_FORMATS:
+        raise HTTPException(status_code=400, detail="Invalid format")
     try:
-        filepath = os.path.join("sessions", session_id, f"{node_id}.csv")
-        dataset = pd.read_csv(filepath)
-    except Exception:
-        raise HTTPException(status_code=404, detail="File not found")
-    value_counts = dataset[column].value_counts()
+        plan = plan_pipeline(steps, node["columns"], node.get("num_rows"))
+    except PipelineError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    def finish(outputs):
+        last_op, last_params = plan[-1]
+        if last_op == "aggregate" and not last_params["gb_cols"]:
+            outputs = outputs[:-1] + [scalar_content(outputs[-1], last_params["func"])]
+        src_id = node_id
+        recorded = []
+        with metadata_store.transaction(session_id) as metadata:
+            for step, (op, params), output in zip(steps, plan, outputs):
+                src_id, result = record_step(
+                    session_id, metadata, make_recipe(op, src_id, params), output
+                )
+                recorded.append({"op": step.op, "node_id": src_id})
+        if plan[-1][0] in ROW_OPERATIONS:
+            result = encode_data(outputs[-1], src_id, format, preview_rows)
+        return {"steps": recorded, "node_id": src_id, "result": result}
+
+    first_op, first_params = plan[0]
+    return run_tool(
+        session_id,
+        node,
+        "pipeline",
+        background_tasks,
+        run_pipeline,
+        (plan,),
+        finish,
+        columns=pipeline_columns(plan),
+        filter_params=first_params if first_op == "filter" else None,
+        error_detail="Pipeline step failed",
+    )
 
-    metadata = load_metadata(session_id)
-    dst_node_id = create_data_node(session_id, value_counts, metadata, "value_counts()")
-    create_edge(metadata, node_id, dst_node_id, "description")
-    dump_metadata(metadata, session_id)
 
-    return JSONResponse(content=value_counts.to_dict(), status_code=200)
+# created on first use, so the app can be imported without GOOGLE_API_KEY
+gemini_client: Optional[genai.Client] = None
 
 
-mcp_client = Client("http://localhost:9000/mcp")
-gemini_client = genai.Client()
+def get_gemini_client() -> genai.Client:
+    global gemini_client
+    if gemini_client is None:
+        gemini_client = genai.Client()
+    return gemini_client
 
 
-@app.post("/gemini")
-async def call_gemini(session_id: str, prompt: str, sample_rows: int = 5):
-    metadata = load_metadata(session_id)
+def node_summary(
+    session_id: str,
+    node: Dict[str, Any],
+    scalar_map: Dict[str, Any],
+    sample_rows: int,
+) -> str:
+    node_id = node["node_id"]
+    summary = {"node_id": node_id, "node_name": node.get("node_name")}
+    if node["type"] == "scalar":
+        summary["scalar_value"] = scalar_map.get(node_id)
+        return render(summary)
+    summary.update(columns=node["columns"], num_rows=node.get("num_rows"))
+    if not (
+        (session_id, node_id) in node_cache or node_store.exists(session_id, node_id)
+    ):
+        # not computed yet; don't materialize it just to build a prompt
+        summary["lazy"] = True
+        return render(summary)
+
+    def build():
+        try:
+            sample = node_head(session_id, node_id, sample_rows)
+        except Exception:
+            return None
+        return render(dict(summary, sample_data=sample_columns(sample)))
 
-    node_summaries = []
+    text = prompt_summaries.get_or_build((session_id, node_id, sample_rows), build)
+    if text is None:
+        text = render(dict(summary, error="Could not read node"))
+    return text
 
-    for node in metadata.get("nodes", []):
-        node_id = node["node_id"]
-        node_type = node["type"]
 
-        if node_type == "data":
-            filepath = os.path.join("sessions", session_id, f"{node_id}.csv")
-            if os.path.exists(filepath):
-                try:
-                    df = pd.read_csv(filepath, nrows=sample_rows)
-                    node_summaries.append(
-                        {
-                            "node_id": node_id,
-                            "columns": df.columns.tolist(),
-                            "sample_data": df.head(sample_rows).to_dict(orient="list"),
-                            "num_rows": len(df),
-                        }
-                    )
-                except Exception:
-                    node_summaries.append(
-                        {"node_id": node_id, "error": "Could not read CSV"}
-                    )
-        elif node_type == "scalar":
-            scalar_value = metadata.get("scalar_map", {}).get(node_id, None)
-            node_summaries.append({"node_id": node_id, "scalar_value": scalar_value})
-
-    prompt_text = (
-        f"Session ID: {session_id}\n"
-        f"Node summaries: {node_summaries}\n"
-        f"Instruction: {prompt}"
-    )
+@app.post("/gemini")
+async def call_gemini(
+    session_id: str,
+    prompt: str,
+    sample_rows: int = 5,
+    context_tokens: int = Query(GEMINI_CONTEXT_TOKENS, ge=256),
+):
+    if not await run_in_threadpool(session_exists, session_id):
+        raise HTTPException(status_code=404, detail="Session not found")
+
+    def build_prompt():
+        with metadata_store.snapshot(session_id) as session_metadata:
+            metadata = session_metadata.to_dict()
+        scalar_map = metadata["scalar_map"]
+        return build_context(
+            session_id,
+            prompt,
+            metadata["nodes"],
+            metadata["edges"],
+            lambda node: node_summary(session_id, node, scalar_map, sample_rows),
+            context_tokens,
+        )
+
+    try:
+        gemini = get_gemini_client()
+    except ValueError:
+        raise HTTPException(status_code=503, detail="Gemini API key not configured")
+    prompt_text = await run_in_threadpool(build_prompt)
+    try:
+        mcp_session = await mcp_connection.session()
+    except Exception:
+        raise HTTPException(status_code=503, detail="MCP server unavailable")
 
     async def gemini_stream():
-        async with mcp_client:
-            async for event in await gemini_client.aio.models.generate_content_stream(
-                model="gemini-2.0-flash-lite",
-                contents=prompt_text,
-                config=genai.types.GenerateContentConfig(
-                    temperature=0,
-                    tools=[mcp_client.session],
-                ),
-            ):
-                if event.candidates:
-                    for part in event.candidates[0].content.parts:
-                        if part.text:
-                            yield f"TEXT::{part.text}"
-                        elif getattr(part, "function_call", None):
-                            yield f"MCP_CALL::{part.function_call.name}"
-                        elif getattr(part, "function_response", None):
-                            yield f"MCP_RESULT::{part.function_response}"
+        async for event in await gemini.aio.models.generate_content_stream(
+            model="gemini-2.0-flash-lite",
+            contents=prompt_text,
+            config=genai.types.GenerateContentConfig(
+                temperature=0,
+                tools=[mcp_session],
+            ),
+        ):
+            if event.candidates:
+                for part in event.candidates[0].content.parts:
+                    if part.text:
+                        yield f"TEXT::{part.text}"
+                    elif getattr(part, "function_call", None):
+                        yield f"MCP_CALL::{part.function_call.name}"
+                    elif getattr(part, "function_response", None):
+                        yield f"MCP_RESULT::{part.function_response}"
 
     return StreamingResponse(gemini_stream(), media_type="text/plain")
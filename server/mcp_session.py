@@ -0,0 +1,67 @@
+import asyncio
+import time
+from typing import Optional
+
+from fastmcp import Client
+
+
+class MCPConnection:
+    """One MCP client session shared by every request.
+
+    It connects on first use rather than at startup, since the MCP server may
+    come up after this one. Once it has been idle for ``ping_interval``
+    seconds it is pinged before being handed out again, and replaced when the
+    ping fails. ``connect_timeout`` bounds connecting and pinging only; tool
+    calls take as long as the tool does.
+    """
+
+    def __init__(
+        self, url: str, ping_interval: float = 30.0, connect_timeout: float = 5.0
+    ):
+        self.url = url
+        self.ping_interval = ping_interval
+        self.connect_timeout = connect_timeout
+        self._client: Optional[Client] = None
+        self._lock: Optional[asyncio.Lock] = None
+        self._last_used = 0.0
+        self.connects = 0
+
+    async def _healthy(self) -> bool:
+        if self._client is None or not self._client.is_connected():
+            return False
+        if time.monotonic() - self._last_used < self.ping_interval:
+            return True
+        try:
+            await asyncio.wait_for(self._client.ping(), self.connect_timeout)
+            return True
+        except Exception:
+            return False
+
+    async def session(self):
+        """The connected MCP session, connecting or reconnecting as needed."""
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        async with self._lock:
+            if not await self._healthy():
+                await self._disconnect()
+                client = Client(self.url, init_timeout=self.connect_timeout)
+                await asyncio.wait_for(client.__aenter__(), self.connect_timeout)
+                self._client = client
+                self.connects += 1
+            self._last_used = time.monotonic()
+            return self._client.session
+
+    async def _disconnect(self):
+        client, self._client = self._client, None
+        if client is not None:
+            try:
+                await client.__aexit__(None, None, None)
+            except Exception:
+                # the connection is already gone; nothing left to close
+                pass
+
+    async def close(self):
+        if self._lock is None:
+            return
+        async with self._lock:
+            await self._disconnect()
@@ -0,0 +1,56 @@
+import hashlib
+import json
+import threading
+from collections import Counter
+from typing import Any, Dict
+
+# operations whose output is not a pure function of their input
+UNMEMOIZED_OPERATIONS = ("sample",)
+
+
+def recipe_fingerprint(recipe: Dict[str, Any]) -> str:
+    """Content address of an operation: its source node plus canonical JSON
+    of the op name and parameters."""
+    # 10 and 10.0 select the same rows, so they share a fingerprint
+    params = {
+        key: (
+            float(value)
+            if isinstance(value, int) and not isinstance(value, bool)
+            else value
+        )
+        for key, value in recipe["params"].items()
+    }
+    canonical = json.dumps(
+        [recipe["src_id"], recipe["op"], params],
+        sort_keys=True,
+        separators=(",", ":"),
+        default=str,
+    )
+    return hashlib.sha256(canonical.encode()).hexdigest()
+
+
+class MemoStats:
+    """Process-wide memo hit/miss counters, broken down by operation."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.hits: Counter = Counter()
+        self.misses: Counter = Counter()
+
+    def record(self, op: str, hit: bool):
+        with self._lock:
+            (self.hits if hit else self.misses)[op] += 1
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            hits = sum(self.hits.values())
+            misses = sum(self.misses.values())
+            return {
+                "hits": hits,
+                "misses": misses,
+                "hit_rate": hits / (hits + misses) if hits + misses else None,
+                "by_op": {
+                    op: {"hits": self.hits[op], "misses": self.misses[op]}
+                    for op in sorted(set(self.hits) | set(self.misses))
+                },
+            }
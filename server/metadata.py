@@ -0,0 +1,380 @@
+import json
+import os
+import sqlite3
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional, Set
+
+from instrumentation import stage
+from storage import session_dir
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS session (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS nodes (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    node_id TEXT NOT NULL UNIQUE,
+    body TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS edges (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    src_id TEXT NOT NULL,
+    dst_id TEXT NOT NULL,
+    operation TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS edges_src_id ON edges (src_id);
+CREATE TABLE IF NOT EXISTS scalars (
+    node_id TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS memo (
+    fingerprint TEXT PRIMARY KEY,
+    node_id TEXT NOT NULL,
+    content TEXT,
+    hits INTEGER NOT NULL DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS jobs (
+    job_id TEXT PRIMARY KEY,
+    operation TEXT NOT NULL,
+    node_id TEXT NOT NULL,
+    status TEXT NOT NULL,
+    result TEXT,
+    error TEXT,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL
+);
+"""
+# stored in PRAGMA user_version once the schema has been created
+SCHEMA_VERSION = 1
+
+
+class SessionMetadata:
+    """A session's node/edge graph, read and written inside one SQLite
+    transaction. Nodes are looked up by primary key and new nodes and edges
+    are inserted as rows, so no operation rewrites the whole graph."""
+
+    def __init__(self, conn: sqlite3.Connection):
+        self.conn = conn
+
+    @property
+    def session_name(self) -> Optional[str]:
+        row = self.conn.execute(
+            "SELECT value FROM session WHERE key = 'session_name'"
+        ).fetchone()
+        return None if row is None else json.loads(row[0])
+
+    def get_node(self, node_id: str) -> Optional[Dict[str, Any]]:
+        row = self.conn.execute(
+            "SELECT body FROM nodes WHERE node_id = ?", (node_id,)
+        ).fetchone()
+        return None if row is None else json.loads(row[0])
+
+    def nodes(self) -> List[Dict[str, Any]]:
+        rows = self.conn.execute("SELECT body FROM nodes ORDER BY seq")
+        return [json.loads(body) for (body,) in rows]
+
+    def edges(self) -> List[Dict[str, str]]:
+        rows = self.conn.execute(
+            "SELECT src_id, dst_id, operation FROM edges ORDER BY seq"
+        )
+        return [
+            {"src_id": src_id, "dst_id": dst_id, "operation": operation}
+            for src_id, dst_id, operation in rows
+        ]
+
+    def children(self, node_id: str) -> List[Dict[str, Any]]:
+        """The nodes with an edge from ``node_id``, in creation order."""
+        rows = self.conn.execute(
+            "SELECT DISTINCT nodes.body, nodes.seq FROM edges "
+            "JOIN nodes ON nodes.node_id = edges.dst_id "
+            "WHERE edges.src_id = ? ORDER BY nodes.seq",
+            (node_id,),
+        )
+        return [json.loads(body) for body, _ in rows]
+
+    def scalar_map(self) -> Dict[str, Any]:
+        rows = self.conn.execute("SELECT node_id, value FROM scalars")
+        return {node_id: json.loads(value) for node_id, value in rows}
+
+    def add_node(self, node: Dict[str, Any]):
+        self.conn.execute(
+            "INSERT INTO nodes (node_id, body) VALUES (?, ?)",
+            (node["node_id"], json.dumps(node)),
+        )
+
+    def update_node(self, node_id: str, **fields):
+        node = self.get_node(node_id)
+        if node is None:
+            raise KeyError(node_id)
+        node.update(fields)
+        self.conn.execute(
+            "UPDATE nodes SET body = ? WHERE node_id = ?", (json.dumps(node), node_id)
+        )
+
+    def add_edge(self, src_id: str, dst_id: str, operation: str):
+        self.conn.execute(
+            "INSERT INTO edges (src_id, dst_id, operation) VALUES (?, ?, ?)",
+            (src_id, dst_id, operation),
+        )
+
+    def set_scalar(self, node_id: str, value: Any):
+        self.conn.execute(
+            "INSERT OR REPLACE INTO scalars (node_id, value) VALUES (?, ?)",
+            (node_id, json.dumps(value)),
+        )
+
+    def get_memo(self, fingerprint: str) -> Optional[Dict[str, Any]]:
+        row = self.conn.execute(
+            "SELECT node_id, content FROM memo WHERE fingerprint = ?", (fingerprint,)
+        ).fetchone()
+        if row is None:
+            return None
+        node_id, content = row
+        return {
+            "node_id": node_id,
+            "content": None if content is None else json.loads(content),
+        }
+
+    def set_memo(self, fingerprint: str, node_id: str, content: Optional[str] = None):
+        """Points ``fingerprint`` at ``node_id``. ``content`` is the already
+        serialised response, or None when it is too large to keep."""
+        self.conn.execute(
+            "INSERT INTO memo (fingerprint, node_id, content) VALUES (?, ?, ?) "
+            "ON CONFLICT (fingerprint) DO UPDATE SET "
+            "node_id = excluded.node_id, content = excluded.content",
+            (fingerprint, node_id, content),
+        )
+
+    def record_memo_hit(self, fingerprint: str):
+        self.conn.execute(
+            "UPDATE memo SET hits = hits + 1 WHERE fingerprint = ?", (fingerprint,)
+        )
+
+    def memo_stats(self) -> Dict[str, int]:
+        entries, hits = self.conn.execute(
+            "SELECT COUNT(*), COALESCE(SUM(hits), 0) FROM memo"
+        ).fetchone()
+        return {"entries": entries, "hits": hits}
+
+    def add_job(self, job_id: str, operation: str, node_id: str):
+        now = time.time()
+        self.conn.execute(
+            "INSERT INTO jobs (job_id, operation, node_id, status, created_at, "
+            "updated_at) VALUES (?, ?, ?, 'queued', ?, ?)",
+            (job_id, operation, node_id, now, now),
+        )
+
+    def update_job(
+        self,
+        job_id: str,
+        status: str,
+        result: Optional[str] = None,
+        error: Optional[str] = None,
+    ):
+        """``result`` is the already serialised response."""
+        self.conn.execute(
+            "UPDATE jobs SET status = ?, result = ?, error = ?, updated_at = ? "
+            "WHERE job_id = ?",
+            (status, result, error, time.time(), job_id),
+        )
+
+    def get_job(self, job_id: str) -> Optional[Dict[str, Any]]:
+        row = self.conn.execute(
+            "SELECT job_id, operation, node_id, status, result, error, created_at, "
+            "updated_at FROM jobs WHERE job_id = ?",
+            (job_id,),
+        ).fetchone()
+        if row is None:
+            return None
+        keys = (
+            "job_id",
+            "operation",
+            "node_id",
+            "status",
+            "result",
+            "error",
+            "created_at",
+            "updated_at",
+        )
+        job = dict(zip(keys, row))
+        if job["result"] is not None:
+            job["result"] = json.loads(job["result"])
+        return job
+
+    def active_jobs(self) -> int:
+        return self.conn.execute(
+            "SELECT COUNT(*) FROM jobs WHERE status IN ('queued', 'running')"
+        ).fetchone()[0]
+
+    def fail_unfinished_jobs(self, created_before: float, error: str) -> int:
+        """Marks queued and running jobs created before ``created_before`` as
+        failed with ``error`` and returns how many there were."""
+        cursor = self.conn.execute(
+            "UPDATE jobs SET status = 'failed', error = ?, updated_at = ? "
+            "WHERE status IN ('queued', 'running') AND created_at < ?",
+            (error, time.time(), created_before),
+        )
+        return cursor.rowcount
+
+    def prune_jobs(self, finished_before: float) -> int:
+        """Deletes done and failed jobs last updated before ``finished_before``
+        and returns how many there were."""
+        cursor = self.conn.execute(
+            "DELETE FROM jobs WHERE status IN ('done', 'failed') AND updated_at < ?",
+            (finished_before,),
+        )
+        return cursor.rowcount
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "session_name": self.session_name,
+            "nodes": self.nodes(),
+            "edges": self.edges(),
+            "scalar_map": self.scalar_map(),
+        }
+
+
+class MetadataStore:
+    """Per-session SQLite databases (sessions/<id>/metadata.db) in WAL mode.
+
+    Writers take the database's reserved lock with BEGIN IMMEDIATE, which
+    serialises writes to a session across threads and across uvicorn worker
+    processes while readers keep going against the last committed state.
+    Sessions that still have a metadata.json are imported on first access.
+
+    The schema and WAL mode persist in the database file, so they are set up
+    when it is created, or the first time this process opens an older file;
+    connections only set their own pragmas.
+    """
+
+    def __init__(self, busy_timeout: float = 30.0):
+        self.busy_timeout = busy_timeout
+        self._prepared: Set[str] = set()
+
+    def db_path(self, session_id: str) -> str:
+        return os.path.join(session_dir(session_id), "metadata.db")
+
+    def json_path(self, session_id: str) -> str:
+        return os.path.join(session_dir(session_id), "metadata.json")
+
+    def exists(self, session_id: str) -> bool:
+        return os.path.exists(self.db_path(session_id)) or os.path.exists(
+            self.json_path(session_id)
+        )
+
+    def create(self, session_id: str, session_name: str):
+        os.makedirs(session_dir(session_id), exist_ok=True)
+        conn = self._connect(session_id, create=True)
+        try:
+            conn.execute(
+                "INSERT OR REPLACE INTO session (key, value) VALUES (?, ?)",
+                ("session_name", json.dumps(session_name)),
+            )
+        finally:
+            conn.close()
+
+    @contextmanager
+    def snapshot(self, session_id: str) -> Iterator[SessionMetadata]:
+        with stage("metadata"):
+            conn = self._connect(session_id)
+        try:
+            with stage("metadata"):
+                conn.execute("BEGIN")
+            yield SessionMetadata(conn)
+        finally:
+            with stage("metadata"):
+                conn.rollback()
+                conn.close()
+
+    @contextmanager
+    def transaction(self, session_id: str) -> Iterator[SessionMetadata]:
+        with stage("metadata"):
+            conn = self._connect(session_id)
+        try:
+            with stage("metadata"):
+                conn.execute("BEGIN IMMEDIATE")
+            yield SessionMetadata(conn)
+            with stage("metadata"):
+                conn.commit()
+        except BaseException:
+            conn.rollback()
+            raise
+        finally:
+            conn.close()
+
+    def compact(self, session_id: str, min_free_fraction: float = 0.25) -> bool:
+        """Folds the WAL back into the database and truncates it, rebuilding the
+        database first when at least ``min_free_fraction`` of its pages are
+        free. Returns whether it was rebuilt."""
+        conn = self._connect(session_id)
+        try:
+            free = conn.execute("PRAGMA freelist_count").fetchone()[0]
+            pages = conn.execute("PRAGMA page_count").fetchone()[0]
+            vacuum = pages > 0 and free / pages >= min_free_fraction
+            if vacuum:
+                conn.execute("VACUUM")
+            conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+        finally:
+            conn.close()
+        return vacuum
+
+    def _connect(self, session_id: str, create: bool = False) -> sqlite3.Connection:
+        if not create and not self.exists(session_id):
+            raise FileNotFoundError(f"Session not found: {session_id}")
+        db_path = self.db_path(session_id)
+        conn = sqlite3.connect(
+            db_path,
+            timeout=self.busy_timeout,
+            isolation_level=None,
+            check_same_thread=False,
+        )
+        conn.execute("PRAGMA synchronous=NORMAL")
+        if create or db_path not in self._prepared:
+            try:
+                self._prepare(conn, session_id)
+            except BaseException:
+                conn.close()
+                raise
+            self._prepared.add(db_path)
+        return conn
+
+    def _prepare(self, conn: sqlite3.Connection, session_id: str):
+        if conn.execute("PRAGMA user_version").fetchone()[0] < SCHEMA_VERSION:
+            conn.execute("PRAGMA journal_mode=WAL")
+            # executescript commits; CREATE IF NOT EXISTS makes a race with
+            # another process harmless
+            conn.executescript(SCHEMA)
+            conn.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+        if os.path.exists(self.json_path(session_id)):
+            self._import_json(conn, session_id)
+
+    def _import_json(self, conn: sqlite3.Connection, session_id: str):
+        json_path = self.json_path(session_id)
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            imported = conn.execute("SELECT 1 FROM session").fetchone()
+            if imported is None and os.path.exists(json_path):
+                with open(json_path) as file:
+                    legacy = json.load(file)
+                metadata = SessionMetadata(conn)
+                conn.execute(
+                    "INSERT INTO session (key, value) VALUES (?, ?)",
+                    ("session_name", json.dumps(legacy.get("session_name"))),
+                )
+                for node in legacy.get("nodes", []):
+                    metadata.add_node(node)
+                for edge in legacy.get("edges", []):
+                    metadata.add_edge(edge["src_id"], edge["dst_id"], edge["operation"])
+                for node_id, value in legacy.get("scalar_map", {}).items():
+                    metadata.set_scalar(node_id, value)
+            conn.commit()
+        except BaseException:
+            conn.rollback()
+            raise
+        try:
+            os.replace(json_path, f"{json_path}.migrated")
+        except FileNotFoundError:
+            # another worker finished the import first
+            pass
@@ -0,0 +1,225 @@
+import math
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from expressions import expression_columns, expression_mask
+
+AGGREGATIONS = ("sum", "mean", "min", "max", "count", "nunique", "std")
+COUNT_AGGREGATIONS = ("count", "nunique")
+
+FILTER_OPERATORS = {
+    "lt": lambda x, value: x < value,
+    "gt": lambda x, value: x > value,
+    "eq": lambda x, value: x == value,
+    "ne": lambda x, value: x != value,
+    "le": lambda x, value: x <= value,
+    "ge": lambda x, value: x >= value,
+}
+
+
+def aggregate(
+    dataset: pd.DataFrame,
+    columns: List[str],
+    funcs: List[str],
+    gb_cols: Optional[List[str]] = None,
+) -> Dict[Tuple[str, str], Any]:
+    """Computes every (column, func) pair in a single vectorized pass.
+
+    Grouped results are Series named after their column and indexed by the
+    group keys; ungrouped results are scalars.
+    """
+    if gb_cols:
+        result = dataset.groupby(gb_cols)[columns].agg(funcs)
+        return {
+            (column, func): result[(column, func)].rename(column)
+            for column in columns
+            for func in funcs
+        }
+    result = dataset[columns].agg(funcs)
+    return {
+        (column, func): aggregate_scalar(result.at[func, column], func)
+        for column in columns
+        for func in funcs
+    }
+
+
+def to_json_scalar(value) -> Any:
+    if hasattr(value, "item"):
+        value = value.item()
+    if isinstance(value, float) and math.isnan(value):
+        return None
+    return value
+
+
+def aggregate_scalar(value, func: str) -> Any:
+    """An ungrouped result as JSON. Counts are ints even when ``agg`` shares
+    a float column between them and the other functions."""
+    value = to_json_scalar(value)
+    if func in COUNT_AGGREGATIONS and value is not None:
+        return int(value)
+    return value
+
+
+def group_key(key) -> str:
+    if isinstance(key, tuple):
+        return ", ".join(str(part) for part in key)
+    return str(key)
+
+
+# Data-producing operations that can be replayed from a node's recipe:
+# {"op": <name>, "src_id": <source node>, "params": {...}}.
+
+
+def filter_mask(dataset, column, filter_operator, filter_value) -> pd.Series:
+    return FILTER_OPERATORS[filter_operator](dataset[column], filter_value)
+
+
+def run_filter(dataset, params):
+    return dataset[filter_mask(dataset, **params)]
+
+
+def run_filter_expr(dataset, params):
+    return dataset[expression_mask(dataset, params["expr"])]
+
+
+class Reservoir:
+    """A uniform sample of ``n`` rows from a stream of batches, holding at most
+    ``n`` rows besides the current batch. Every row draws a random key and the
+    rows with the ``n`` smallest keys are kept, so the sample does not depend
+    on how the rows are split into batches."""
+
+    def __init__(self, n: int, random_state: int):
+        self.n = n
+        self._rng = np.random.default_rng(random_state)
+        self._kept = None
+        self._keys = np.empty(0)
+
+    def add(self, batch: pd.DataFrame):
+        n = self.n
+        keys = self._rng.random(len(batch))
+        if n > 0 and len(self._keys) >= n:
+            chosen = np.flatnonzero(keys < self._keys.max())
+            batch, keys = batch.iloc[chosen], keys[chosen]
+        self._kept = batch if self._kept is None else pd.concat([self._kept, batch])
+        self._keys = np.concatenate([self._keys, keys])
+        if len(self._keys) > n:
+            keep = np.argpartition(self._keys, n)[:n]
+            self._kept, self._keys = self._kept.iloc[keep], self._keys[keep]
+
+    def rows(self) -> Optional[pd.DataFrame]:
+        """The sampled rows in key order, or None before the first batch."""
+        if self._kept is None:
+            return None
+        return self._kept.iloc[np.argsort(self._keys, kind="stable")]
+
+
+def reservoir_sample(
+    batches: Iterable[pd.DataFrame], n: int, random_state: int
+) -> pd.DataFrame:
+    reservoir = Reservoir(n, random_state)
+    for batch in batches:
+        reservoir.add(batch)
+    sample = reservoir.rows()
+    if sample is None or len(sample) < n:
+        raise ValueError("Cannot take a larger sample than population")
+    return sample
+
+
+def run_sample(dataset, params):
+    if params.get("method") == "reservoir":
+        return reservoir_sample([dataset], params["n"], params["random_state"])
+    # recipes recorded before reservoir sampling
+    return dataset.sample(params["n"], random_state=params["random_state"])
+
+
+def run_describe(dataset, params):
+    return pd.DataFrame(dataset[params["column"]].describe())
+
+
+def run_value_counts(dataset, params):
+    return dataset[params["column"]].value_counts().to_frame()
+
+
+def run_aggregate(dataset, params):
+    column, func = params["column"], params["func"]
+    return pd.DataFrame(
+        aggregate(dataset, [column], [func], params["gb_cols"])[(column, func)]
+    )
+
+
+OPERATIONS = {
+    "filter": run_filter,
+    "filter_expr": run_filter_expr,
+    "sample": run_sample,
+    "describe": run_describe,
+    "value_counts": run_value_counts,
+    "aggregate": run_aggregate,
+}
+
+# operations whose output keeps the input's columns and only drops rows
+ROW_OPERATIONS = ("filter", "filter_expr", "sample")
+# row operations that keep or drop each row on its own, given as a mask
+MASK_OPERATIONS = {
+    "filter": lambda dataset, params: filter_mask(dataset, **params),
+    "filter_expr": lambda dataset, params: expression_mask(dataset, params["expr"]),
+}
+
+
+def input_columns(op: str, params: Dict[str, Any]) -> List[str]:
+    if op == "filter":
+        return [params["column"]]
+    if op == "filter_expr":
+        return expression_columns(params["expr"])
+    if op == "sample":
+        return []
+    if op == "aggregate":
+        return list(params["gb_cols"] or []) + [params["column"]]
+    return [params["column"]]
+
+
+def output_columns(
+    op: str, params: Dict[str, Any], src_columns: List[str]
+) -> List[str]:
+    if op in ROW_OPERATIONS:
+        return list(src_columns)
+    if op == "value_counts":
+        return ["count"]
+    return [params["column"]]
+
+
+def required_columns(
+    steps: List[Tuple[str, Dict[str, Any]]], columns: Optional[List[str]] = None
+) -> Optional[List[str]]:
+    """Columns of the plan's input that the steps actually read when only
+    ``columns`` of its output are used, or None when every column is needed."""
+    required = None if columns is None else list(columns)
+    for op, params in reversed(steps):
+        if op in ROW_OPERATIONS:
+            if required is not None:
+                required = required + [
+                    c for c in input_columns(op, params) if c not in required
+                ]
+        else:
+            required = input_columns(op, params)
+    return required
+
+
+def execute_plan(
+    dataset: pd.DataFrame, steps: List[Tuple[str, Dict[str, Any]]]
+) -> pd.DataFrame:
+    """Runs a chain of operations as one plan. Consecutive filters are fused
+    into a single boolean mask so intermediate frames are never built."""
+    mask = None
+    for op, params in steps:
+        if op in MASK_OPERATIONS:
+            step_mask = MASK_OPERATIONS[op](dataset, params)
+            mask = step_mask if mask is None else mask & step_mask
+            continue
+        if mask is not None:
+            dataset, mask = dataset[mask], None
+        dataset = OPERATIONS[op](dataset, params)
+    if mask is not None:
+        dataset = dataset[mask]
+    return dataset.reset_index(drop=True)
@@ -0,0 +1,135 @@
+import random
+from typing import Any, Dict, List, Optional, Tuple
+
+import pandas as pd
+from pydantic import BaseModel
+
+from operations import (
+    AGGREGATIONS,
+    FILTER_OPERATORS,
+    OPERATIONS,
+    ROW_OPERATIONS,
+    aggregate,
+    output_columns,
+    required_columns,
+)
+
+PIPELINE_OPERATIONS = ("filter", "sample", "describe", "value_counts") + AGGREGATIONS
+
+
+class PipelineStep(BaseModel):
+    op: str
+    column: Optional[str] = None
+    filter_operator: Optional[str] = None
+    filter_value: Optional[float] = None
+    gb_col: Optional[str] = None
+    n: Optional[int] = None
+
+
+class PipelineError(ValueError):
+    pass
+
+
+def _require(step: PipelineStep, index: int, *fields: str):
+    missing = [field for field in fields if getattr(step, field) is None]
+    if missing:
+        raise PipelineError(
+            f"Step {index} ({step.op}) is missing: {', '.join(missing)}"
+        )
+
+
+def plan_pipeline(
+    steps: List[PipelineStep], columns: List[str], num_rows: Optional[int]
+) -> List[Tuple[str, Dict[str, Any]]]:
+    """Checks the whole chain against the input node's columns before anything
+    runs and returns it as recipe steps, with the same params the single
+    tools record so the two share memoized results.
+
+    An ungrouped aggregation produces a scalar and can only be the last step.
+    """
+    if not steps:
+        raise PipelineError("Pipeline has no steps")
+    plan = []
+    for index, step in enumerate(steps):
+        if plan and plan[-1][0] == "aggregate" and not plan[-1][1]["gb_cols"]:
+            raise PipelineError(f"Step {index - 1} produces a scalar and must be last")
+        if step.op not in PIPELINE_OPERATIONS:
+            raise PipelineError(f"Step {index} has invalid operation: {step.op}")
+        if step.op == "sample":
+            _require(step, index, "n")
+            if step.n < 0 or (num_rows is not None and step.n > num_rows):
+                raise PipelineError(f"Step {index} samples more rows than it has")
+            op = "sample"
+            params = {
+                "n": step.n,
+                "random_state": random.randrange(2**32),
+                "method": "reservoir",
+            }
+        elif step.op == "filter":
+            _require(step, index, "column", "filter_operator", "filter_value")
+            if step.filter_operator not in FILTER_OPERATORS:
+                raise PipelineError(f"Step {index} has invalid operator")
+            op = "filter"
+            params = {
+                "column": step.column,
+                "filter_operator": step.filter_operator,
+                "filter_value": step.filter_value,
+            }
+        elif step.op in AGGREGATIONS:
+            _require(step, index, "column")
+            op = "aggregate"
+            params = {
+                "column": step.column,
+                "func": step.op,
+                "gb_cols": None if step.gb_col is None else [step.gb_col],
+            }
+        else:
+            _require(step, index, "column")
+            op = step.op
+            params = {"column": step.column}
+        missing = [
+            column
+            for column in (step.column, step.gb_col)
+            if column is not None and column not in columns
+        ]
+        if missing:
+            raise PipelineError(f"Step {index} column not found: {', '.join(missing)}")
+        if op != "aggregate" or params["gb_cols"]:
+            columns = output_columns(op, params, columns)
+        num_rows = params["n"] if op == "sample" else None
+        plan.append((op, params))
+    return plan
+
+
+def run_pipeline(
+    dataset: pd.DataFrame, steps: List[Tuple[str, Dict[str, Any]]]
+) -> List[Any]:
+    """Runs the steps in order, each on the previous step's output, and returns
+    every output: a DataFrame, a grouped Series, or a final scalar."""
+    outputs = []
+    for op, params in steps:
+        if op == "aggregate":
+            column, func = params["column"], params["func"]
+            result = aggregate(dataset, [column], [func], params["gb_cols"])[
+                (column, func)
+            ]
+        else:
+            result = OPERATIONS[op](dataset, params)
+        outputs.append(result)
+        if isinstance(result, pd.Series):
+            dataset = result.to_frame()
+        elif isinstance(result, pd.DataFrame):
+            dataset = result
+        # the next step sees what the recorded node holds
+        dataset = dataset.reset_index(drop=True)
+    return outputs
+
+
+def pipeline_columns(
+    steps: List[Tuple[str, Dict[str, Any]]],
+) -> Optional[List[str]]:
+    """Columns of the input the pipeline reads. Row operations at the start
+    record nodes with every input column, so those read all of them."""
+    if steps[0][0] in ROW_OPERATIONS:
+        return None
+    return required_columns(steps)
@@ -0,0 +1,159 @@
+import json
+import os
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+import pandas as pd
+
+from operations import to_json_scalar
+from sketches import HyperLogLog
+from storage import BATCH_ROWS, _replace_atomically, session_dir
+
+# aggregations a profile answers exactly without reading the node
+PROFILE_AGGREGATIONS = ("min", "max", "count")
+
+
+def _merge_bound(current, value, pick):
+    if value is None:
+        return current
+    return value if current is None else pick(current, value)
+
+
+def _column_stats(series: pd.Series) -> Tuple[Any, Any, int]:
+    nulls = int(series.isna().sum())
+    if not pd.api.types.is_numeric_dtype(series) or nulls == len(series):
+        return None, None, nulls
+    return to_json_scalar(series.min()), to_json_scalar(series.max()), nulls
+
+
+def build_profile(
+    batches: Iterable[pd.DataFrame], batch_rows: int = BATCH_ROWS
+) -> Dict[str, Any]:
+    """Summarises a node in one pass over its batches.
+
+    Per column: dtype, null count, min/max (numeric columns only), an
+    approximate distinct count, and zone maps holding min/max/nulls for each
+    block of ``batch_rows`` rows. Zones follow row positions, so they line
+    up with the stored record batches whatever size the input batches are.
+    """
+    columns: Dict[str, Dict[str, Any]] = {}
+    sketches: Dict[str, HyperLogLog] = {}
+    num_rows = 0
+    for batch in batches:
+        for name in batch.columns:
+            if name not in columns:
+                columns[name] = {
+                    "dtype": str(batch[name].dtype),
+                    "null_count": 0,
+                    "min": None,
+                    "max": None,
+                    "zones": [],
+                }
+                sketches[name] = HyperLogLog()
+            sketches[name].add(batch[name])
+        start = 0
+        while start < len(batch):
+            zone, offset = divmod(num_rows + start, batch_rows)
+            end = min(len(batch), start + batch_rows - offset)
+            for name in batch.columns:
+                profile = columns[name]
+                low, high, nulls = _column_stats(batch[name].iloc[start:end])
+                if zone == len(profile["zones"]):
+                    profile["zones"].append([None, None, 0])
+                bounds = profile["zones"][zone]
+                bounds[0] = _merge_bound(bounds[0], low, min)
+                bounds[1] = _merge_bound(bounds[1], high, max)
+                bounds[2] += nulls
+                profile["min"] = _merge_bound(profile["min"], low, min)
+                profile["max"] = _merge_bound(profile["max"], high, max)
+                profile["null_count"] += nulls
+            start = end
+        num_rows += len(batch)
+    for name, profile in columns.items():
+        profile["distinct_count"] = sketches[name].count()
+        profile["hll"] = sketches[name].to_json()
+    return {"num_rows": num_rows, "batch_rows": batch_rows, "columns": columns}
+
+
+def dataframe_batches(
+    dataframe: pd.DataFrame, batch_rows: int = BATCH_ROWS
+) -> Iterable[pd.DataFrame]:
+    if len(dataframe) == 0:
+        yield dataframe
+    for start in range(0, len(dataframe), batch_rows):
+        yield dataframe.iloc[start : start + batch_rows]
+
+
+def profile_aggregate(profile: Dict[str, Any], column: str, func: str):
+    """The exact value of an ungrouped aggregation read off the profile.
+    Raises KeyError when the profile cannot answer it."""
+    stats = profile["columns"][column]
+    if func == "count":
+        return profile["num_rows"] - stats["null_count"]
+    if func in ("min", "max"):
+        if stats["min"] is None and stats["null_count"] < profile["num_rows"]:
+            # non-numeric column; min/max were not recorded
+            raise KeyError(column)
+        return stats[func]
+    raise KeyError(func)
+
+
+def _zone_may_match(low, high, nulls, filter_operator, value) -> bool:
+    if filter_operator == "ne":
+        # NaN != value holds, so zones with nulls always have matches
+        return nulls > 0 or low is not None and not (low == high == value)
+    if low is None:
+        return False
+    if filter_operator == "lt":
+        return low < value
+    if filter_operator == "le":
+        return low <= value
+    if filter_operator == "gt":
+        return high > value
+    if filter_operator == "ge":
+        return high >= value
+    if filter_operator == "eq":
+        return low <= value <= high
+    return True
+
+
+def matching_zones(
+    profile: Dict[str, Any], column: str, filter_operator: str, filter_value
+) -> Optional[List[Tuple[int, int]]]:
+    """Row ranges whose zone maps do not rule out the predicate, or None when
+    the profile has no zone maps for the column."""
+    stats = profile["columns"].get(column)
+    if stats is None or not pd.api.types.is_numeric_dtype(stats["dtype"]):
+        return None
+    batch_rows, num_rows = profile["batch_rows"], profile["num_rows"]
+    return [
+        (i * batch_rows, min((i + 1) * batch_rows, num_rows))
+        for i, (low, high, nulls) in enumerate(stats["zones"])
+        if _zone_may_match(low, high, nulls, filter_operator, filter_value)
+    ]
+
+
+class ProfileStore:
+    """Profiles are JSON sidecars next to the node: sessions/<id>/<node>.profile.json."""
+
+    def path(self, session_id: str, node_id: str) -> str:
+        return os.path.join(session_dir(session_id), f"{node_id}.profile.json")
+
+    def read(self, session_id: str, node_id: str) -> Optional[Dict[str, Any]]:
+        try:
+            with open(self.path(session_id, node_id)) as file:
+                return json.load(file)
+        except FileNotFoundError:
+            return None
+
+    def write(self, session_id: str, node_id: str, profile: Dict[str, Any]):
+        def write(path):
+            with open(path, "w") as file:
+                json.dump(profile, file)
+
+        _replace_atomically(self.path(session_id, node_id), write)
+
+    def drop(self, session_id: str, node_id: str):
+        try:
+            os.remove(self.path(session_id, node_id))
+        except FileNotFoundError:
+            pass
@@ -0,0 +1,241 @@
+import base64
+import math
+
+import numpy as np
+import pandas as pd
+
+
+def hash_values(series: pd.Series) -> np.ndarray:
+    """64-bit hashes of the non-null values of ``series``."""
+    return pd.util.hash_pandas_object(series.dropna(), index=False).to_numpy()
+
+
+def _bit_length(values: np.ndarray) -> np.ndarray:
+    lengths = np.zeros(len(values), dtype=np.int64)
+    for shift in (32, 16, 8, 4, 2, 1):
+        high = values >> np.uint64(shift)
+        has_high = high > 0
+        lengths += has_high * shift
+        values = np.where(has_high, high, values)
+    return lengths + (values > 0)
+
+
+class HyperLogLog:
+    """Approximate distinct counter (Flajolet et al.) with 2**p one-byte
+    registers; the relative error is about 1.04 / sqrt(2**p). Sketches with
+    the same ``p`` merge by taking the register-wise maximum."""
+
+    def __init__(self, p: int = 12, registers: np.ndarray = None):
+        self.p = p
+        self.m = 1 << p
+        if registers is None:
+            registers = np.zeros(self.m, dtype=np.uint8)
+        self.registers = registers
+
+    def add_hashes(self, hashes: np.ndarray):
+        if len(hashes) == 0:
+            return
+        hashes = hashes.astype(np.uint64, copy=False)
+        index = (hashes >> np.uint64(64 - self.p)).astype(np.int64)
+        rest = hashes << np.uint64(self.p)
+        # position of the first set bit in the remaining 64 - p bits
+        rank = np.minimum(64 - _bit_length(rest), 64 - self.p) + 1
+        np.maximum.at(self.registers, index, rank.astype(np.uint8))
+
+    def add(self, series: pd.Series):
+        self.add_hashes(hash_values(series))
+
+    def merge(self, other: "HyperLogLog"):
+        if other.p != self.p:
+            raise ValueError("Cannot merge sketches of different precision")
+        np.maximum(self.registers, other.registers, out=self.registers)
+
+    def count(self) -> int:
+        alpha = 0.7213 / (1 + 1.079 / self.m)
+        estimate = alpha * self.m**2 / np.sum(np.exp2(-self.registers.astype(float)))
+        zeros = int(np.count_nonzero(self.registers == 0))
+        if estimate <= 2.5 * self.m and zeros:
+            # small-range correction (linear counting)
+            estimate = self.m * math.log(self.m / zeros)
+        return int(round(estimate))
+
+    def to_json(self) -> dict:
+        return {
+            "p": self.p,
+            "registers": base64.b64encode(self.registers.tobytes()).decode(),
+        }
+
+    @classmethod
+    def from_json(cls, data: dict) -> "HyperLogLog":
+        registers = np.frombuffer(base64.b64decode(data["registers"]), np.uint8)
+        return cls(data["p"], registers.copy())
+
+
+class KLLSketch:
+    """Mergeable quantile sketch (Karnin, Lang & Liberty). Items at level h
+    stand for 2**h inputs; a level that outgrows its capacity is sorted and
+    every other item moves up a level. Keeps O(k) values; the rank error is
+    about 1.7% of the count at the default k and shrinks in proportion to
+    1 / k."""
+
+    def __init__(self, k: int = 200, seed: int = 0):
+        self.k = k
+        self.count = 0
+        self.levels = [np.empty(0)]
+        self._rng = np.random.default_rng(seed)
+
+    def rank_error(self) -> float:
+        """Bound on the normalized rank error of ``quantiles`` at 99%
+        confidence (the DataSketches fit for KLL); 0 while nothing has been
+        compacted."""
+        if len(self.levels) == 1:
+            return 0.0
+        return min(1.0, 2.296 / self.k**0.9723)
+
+    def _capacity(self, level: int) -> int:
+        depth = len(self.levels) - level - 1
+        return max(2, int(math.ceil(self.k * (2 / 3) ** depth)))
+
+    def _compress(self):
+        level = 0
+        while level < len(self.levels):
+            items = self.levels[level]
+            if len(items) >= self._capacity(level):
+                if level + 1 == len(self.levels):
+                    self.levels.append(np.empty(0))
+                items = np.sort(items)
+                # with an odd count, one item stays behind
+                kept, items = items[: len(items) % 2], items[len(items) % 2 :]
+                promoted = items[self._rng.integers(2) :: 2]
+                self.levels[level] = kept
+                self.levels[level + 1] = np.concatenate(
+                    [self.levels[level + 1], promoted]
+                )
+            level += 1
+
+    def add(self, values: np.ndarray):
+        values = np.asarray(values, dtype=float)
+        values = values[~np.isnan(values)]
+        if len(values) == 0:
+            return
+        self.levels[0] = np.concatenate([self.levels[0], values])
+        self.count += len(values)
+        self._compress()
+
+    def merge(self, other: "KLLSketch"):
+        while len(self.levels) < len(other.levels):
+            self.levels.append(np.empty(0))
+        for level, items in enumerate(other.levels):
+            self.levels[level] = np.concatenate([self.levels[level], items])
+        self.count += other.count
+        self._compress()
+
+    def quantiles(self, qs) -> list:
+        if self.count == 0:
+            return [float("nan")] * len(qs)
+        if len(self.levels) == 1:
+            # nothing compacted yet: interpolate like pandas
+            return np.quantile(self.levels[0], qs).tolist()
+        items = np.concatenate(self.levels)
+        weights = np.concatenate(
+            [np.full(len(level), 2.0**h) for h, level in enumerate(self.levels)]
+        )
+        order = np.argsort(items, kind="stable")
+        items, ranks = items[order], np.cumsum(weights[order])
+        positions = np.searchsorted(ranks, np.asarray(qs) * ranks[-1], side="left")
+        return items[np.minimum(positions, len(items) - 1)].tolist()
+
+    def to_json(self) -> dict:
+        return {
+            "k": self.k,
+            "count": self.count,
+            "levels": [
+                base64.b64encode(level.astype(np.float64).tobytes()).decode()
+                for level in self.levels
+            ],
+        }
+
+    @classmethod
+    def from_json(cls, data: dict) -> "KLLSketch":
+        sketch = cls(data["k"])
+        sketch.count = data["count"]
+        sketch.levels = [
+            np.frombuffer(base64.b64decode(level), np.float64).copy()
+            for level in data["levels"]
+        ]
+        return sketch
+
+
+class SpaceSaving:
+    """Mergeable heavy-hitters summary (Metwally et al.) of at most
+    ``capacity`` counters. A counter's count over-estimates its value's
+    count by at most its error, and a value without a counter occurs at most
+    ``floor`` times. Columns with no more than ``capacity`` distinct values
+    are counted exactly."""
+
+    def __init__(
+        self,
+        capacity: int = 1024,
+        counts: pd.Series = None,
+        errors: pd.Series = None,
+        floor: int = 0,
+    ):
+        self.capacity = capacity
+        if counts is None:
+            counts = pd.Series([], dtype="int64")
+        if errors is None:
+            errors = pd.Series(0, index=counts.index, dtype="int64")
+        self.counts = counts
+        self.errors = errors
+        self.floor = floor
+
+    def add_counts(self, counts: pd.Series, errors: pd.Series = None, floor: int = 0):
+        """Adds the value counts of a batch, or the counters of another
+        summary along with their errors and floor."""
+        if errors is None:
+            errors = pd.Series(0, index=counts.index, dtype="int64")
+        index = self.counts.index.union(counts.index)
+        # a value without a counter on one side may have occurred up to that
+        # side's floor times there
+        merged = self.counts.reindex(index).fillna(self.floor) + counts.reindex(
+            index
+        ).fillna(floor)
+        merged_errors = self.errors.reindex(index).fillna(self.floor) + errors.reindex(
+            index
+        ).fillna(floor)
+        order = np.argsort(-merged.to_numpy(), kind="stable")
+        merged, merged_errors = merged.iloc[order], merged_errors.iloc[order]
+        floor += self.floor
+        if len(merged) > self.capacity:
+            floor = max(floor, int(merged.iloc[self.capacity]))
+            merged = merged.iloc[: self.capacity]
+            merged_errors = merged_errors.iloc[: self.capacity]
+        self.counts = merged.astype("int64")
+        self.errors = merged_errors.astype("int64")
+        self.floor = floor
+
+    def add(self, series: pd.Series):
+        self.add_counts(series.value_counts())
+
+    def merge(self, other: "SpaceSaving"):
+        self.add_counts(other.counts, other.errors, other.floor)
+
+    def to_json(self) -> dict:
+        return {
+            "capacity": self.capacity,
+            "floor": self.floor,
+            "counters": [
+                [value, int(count), int(error)]
+                for value, count, error in zip(
+                    self.counts.index.tolist(), self.counts, self.errors
+                )
+            ],
+        }
+
+    @classmethod
+    def from_json(cls, data: dict) -> "SpaceSaving":
+        values = [value for value, _, _ in data["counters"]]
+        index = pd.Index(values, dtype=object)
+        counts = pd.Series([c for _, c, _ in data["counters"]], index, dtype="int64")
+        errors = pd.Series([e for _, _, e in data["counters"]], index, dtype="int64")
+        return cls(data["capacity"], counts, errors, data["floor"])
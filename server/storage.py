@@ -0,0 +1,511 @@
+import csv
+import hashlib
+import os
+import shutil
+from typing import Iterable, Iterator, List, Optional, Tuple
+from uuid import uuid4
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.feather as feather
+import pyarrow.ipc as ipc
+
+from instrumentation import count_read, count_written, read_batches, stage
+
+SESSIONS_DIR = os.environ.get("SESSIONS_DIR", "sessions")
+# rows per Arrow record batch; reads and exports stream at this granularity
+BATCH_ROWS = 64 * 1024
+
+
+def session_dir(session_id: str) -> str:
+    return os.path.join(SESSIONS_DIR, session_id)
+
+
+def _replace_atomically(path: str, write, publish=os.replace) -> None:
+    tmp_path = f"{path}.tmp-{uuid4().hex}"
+    try:
+        write(tmp_path)
+        publish(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+def _file_digest(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as file:
+        for block in iter(lambda: file.read(1024**2), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class NodeStore:
+    """Persists data node contents under sessions/<session_id>/.
+
+    ``<node_id>.csv`` is always a valid CSV rendering of the node when it
+    exists, so it doubles as the upload copy and the /export file.
+
+    With ``dedup`` enabled, written blobs are hard links into a per-session
+    ``objects/`` directory keyed by their SHA-256, so nodes with identical
+    contents share one file on disk. Blobs are only ever replaced, never
+    modified in place, so a shared file is never changed under another node.
+    """
+
+    def __init__(self, dedup: bool = False):
+        self.dedup = dedup
+
+    def _publish(self, tmp_path: str, path: str):
+        if not self.dedup:
+            os.replace(tmp_path, path)
+            return
+        objects_dir = os.path.join(os.path.dirname(path), "objects")
+        os.makedirs(objects_dir, exist_ok=True)
+        extension = os.path.splitext(path)[1]
+        object_path = os.path.join(objects_dir, _file_digest(tmp_path) + extension)
+        try:
+            os.link(tmp_path, object_path)
+        except FileExistsError:
+            # identical contents are already stored; link to them instead
+            link_path = f"{tmp_path}.link"
+            os.link(object_path, link_path)
+            os.replace(link_path, tmp_path)
+        os.replace(tmp_path, path)
+
+    def csv_path(self, session_id: str, node_id: str) -> str:
+        return os.path.join(session_dir(session_id), f"{node_id}.csv")
+
+    def blob_path(self, session_id: str, node_id: str) -> str:
+        raise NotImplementedError
+
+    def exists(self, session_id: str, node_id: str) -> bool:
+        return os.path.exists(self.blob_path(session_id, node_id)) or os.path.exists(
+            self.csv_path(session_id, node_id)
+        )
+
+    def blob_size(self, session_id: str, node_id: str) -> int:
+        path = self.blob_path(session_id, node_id)
+        if not os.path.exists(path):
+            path = self.csv_path(session_id, node_id)
+        return os.path.getsize(path)
+
+    def read(
+        self, session_id: str, node_id: str, columns: Optional[List[str]] = None
+    ) -> pd.DataFrame:
+        raise NotImplementedError
+
+    def head(self, session_id: str, node_id: str, n: int) -> pd.DataFrame:
+        raise NotImplementedError
+
+    def read_ranges(
+        self,
+        session_id: str,
+        node_id: str,
+        ranges: List[Tuple[int, int]],
+        columns: Optional[List[str]] = None,
+    ) -> pd.DataFrame:
+        """Rows ``[start, end)`` of each range, indexed by their row position."""
+        dataframe = self.read(session_id, node_id, columns)
+        return pd.concat(
+            [dataframe.iloc[start:end] for start, end in ranges] or [dataframe.iloc[:0]]
+        )
+
+    def take(
+        self,
+        session_id: str,
+        node_id: str,
+        positions: np.ndarray,
+        columns: Optional[List[str]] = None,
+    ) -> pd.DataFrame:
+        """The rows at ``positions``, indexed by their row position."""
+        return self.read(session_id, node_id, columns).iloc[positions]
+
+    def num_rows(self, session_id: str, node_id: str) -> int:
+        raise NotImplementedError
+
+    def iter_batches(
+        self,
+        session_id: str,
+        node_id: str,
+        columns: Optional[List[str]] = None,
+        offset: int = 0,
+        limit: Optional[int] = None,
+        batch_rows: int = BATCH_ROWS,
+    ) -> Iterator[pd.DataFrame]:
+        """Yields rows ``offset`` to ``offset + limit`` in bounded batches."""
+        raise NotImplementedError
+
+    def write(self, session_id: str, node_id: str, dataframe: pd.DataFrame) -> None:
+        raise NotImplementedError
+
+    def write_batches(
+        self, session_id: str, node_id: str, batches: Iterable[pd.DataFrame]
+    ) -> int:
+        """Writes the node from batches as they arrive, without holding more
+        than one in memory, and returns its row count."""
+        raise NotImplementedError
+
+    def append(self, session_id: str, node_id: str, dataframe: pd.DataFrame) -> int:
+        """Adds ``dataframe``'s rows, in the node's column order, to the end of
+        the node and returns its new row count. Raises ValueError when they
+        don't fit the node's column types."""
+        raise NotImplementedError
+
+    def delete(self, session_id: str, node_id: str) -> None:
+        """Removes the node's stored contents, including its CSV copy."""
+        for path in (
+            self.blob_path(session_id, node_id),
+            self.csv_path(session_id, node_id),
+        ):
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+    def export_csv(self, session_id: str, node_id: str) -> str:
+        raise NotImplementedError
+
+    def ingest_csv(self, session_id: str, node_id: str) -> int:
+        """Converts the node's uploaded CSV into the store's format and returns
+        its row count."""
+        raise NotImplementedError
+
+
+class CsvNodeStore(NodeStore):
+    def blob_path(self, session_id: str, node_id: str) -> str:
+        return self.csv_path(session_id, node_id)
+
+    def read(self, session_id, node_id, columns=None):
+        with stage("read"):
+            dataframe = pd.read_csv(self.csv_path(session_id, node_id), usecols=columns)
+            return count_read(dataframe if columns is None else dataframe[columns])
+
+    def head(self, session_id, node_id, n):
+        with stage("read"):
+            return count_read(pd.read_csv(self.csv_path(session_id, node_id), nrows=n))
+
+    def num_rows(self, session_id, node_id):
+        with open(self.csv_path(session_id, node_id), newline="") as file:
+            return max(sum(1 for _ in csv.reader(file)) - 1, 0)
+
+    def iter_batches(
+        self,
+        session_id,
+        node_id,
+        columns=None,
+        offset=0,
+        limit=None,
+        batch_rows=BATCH_ROWS,
+    ):
+        if limit == 0:
+            return
+        reader = pd.read_csv(
+            self.csv_path(session_id, node_id),
+            usecols=columns,
+            skiprows=range(1, offset + 1),
+            nrows=limit,
+            chunksize=batch_rows,
+        )
+        with reader:
+            for chunk in read_batches(reader):
+                yield chunk if columns is None else chunk[columns]
+
+    def write(self, session_id, node_id, dataframe):
+        path = self.csv_path(session_id, node_id)
+        with stage("write"):
+            _replace_atomically(
+                path,
+                lambda tmp_path: dataframe.to_csv(tmp_path, index=False),
+                self._publish,
+            )
+        count_written(path)
+
+    def write_batches(self, session_id, node_id, batches):
+        num_rows = 0
+
+        def write(path):
+            nonlocal num_rows
+            with open(path, "w", newline="", encoding="utf-8") as file:
+                for i, batch in enumerate(batches):
+                    with stage("write"):
+                        batch.to_csv(file, index=False, header=i == 0)
+                    num_rows += len(batch)
+
+        path = self.csv_path(session_id, node_id)
+        _replace_atomically(path, write, self._publish)
+        count_written(path)
+        return num_rows
+
+    def append(self, session_id, node_id, dataframe):
+        path = self.csv_path(session_id, node_id)
+
+        def write(tmp_path):
+            # a copy rather than an in-place append; with dedup the file may be
+            # shared with other nodes
+            shutil.copyfile(path, tmp_path)
+            with open(tmp_path, "a", newline="", encoding="utf-8") as file:
+                dataframe.to_csv(file, index=False, header=False)
+
+        with stage("write"):
+            _replace_atomically(path, write, self._publish)
+        count_written(path)
+        return self.num_rows(session_id, node_id)
+
+    def export_csv(self, session_id, node_id):
+        return self.csv_path(session_id, node_id)
+
+    def ingest_csv(self, session_id, node_id):
+        return self.num_rows(session_id, node_id)
+
+
+class FeatherNodeStore(NodeStore):
+    """Uncompressed Arrow IPC (Feather v2) files, read through memory maps so
+    that only the requested columns are paged in.
+
+    Nodes that only have a CSV (sessions created before this store existed)
+    are converted the first time they are read.
+    """
+
+    def blob_path(self, session_id: str, node_id: str) -> str:
+        return os.path.join(session_dir(session_id), f"{node_id}.feather")
+
+    def read_table(self, session_id, node_id, columns=None) -> pa.Table:
+        path = self.blob_path(session_id, node_id)
+        if not os.path.exists(path):
+            self._migrate(session_id, node_id)
+        table = feather.read_table(path, memory_map=True)
+        # selected after the read: reading only some fields copies them out
+        # of the map, while the whole table just points into it
+        return table if columns is None else table.select(columns)
+
+    def read(self, session_id, node_id, columns=None):
+        with stage("read"):
+            return count_read(self.read_table(session_id, node_id, columns).to_pandas())
+
+    def head(self, session_id, node_id, n):
+        with stage("read"):
+            table = self.read_table(session_id, node_id).slice(0, n)
+            return count_read(table.to_pandas())
+
+    def num_rows(self, session_id, node_id):
+        return self.read_table(session_id, node_id).num_rows
+
+    def read_ranges(self, session_id, node_id, ranges, columns=None):
+        with stage("read"):
+            table = self.read_table(session_id, node_id, columns)
+            if not ranges:
+                return table.slice(0, 0).to_pandas()
+            dataframe = pa.concat_tables(
+                [table.slice(start, end - start) for start, end in ranges]
+            ).to_pandas()
+            dataframe.index = np.concatenate(
+                [np.arange(start, end) for start, end in ranges]
+            )
+            return count_read(dataframe)
+
+    def take(self, session_id, node_id, positions, columns=None):
+        with stage("read"):
+            table = self.read_table(session_id, node_id, columns)
+            dataframe = table.take(pa.array(positions)).to_pandas()
+            dataframe.index = positions
+            return count_read(dataframe)
+
+    def iter_batches(
+        self,
+        session_id,
+        node_id,
+        columns=None,
+        offset=0,
+        limit=None,
+        batch_rows=BATCH_ROWS,
+    ):
+        table = self.read_table(session_id, node_id, columns).slice(offset, limit)
+        yield from read_batches(
+            batch.to_pandas() for batch in table.to_batches(batch_rows)
+        )
+
+    def write(self, session_id, node_id, dataframe):
+        path = self.blob_path(session_id, node_id)
+        with stage("write"):
+            table = _to_arrow(dataframe)
+            _replace_atomically(
+                path,
+                lambda tmp_path: feather.write_feather(
+                    table, tmp_path, compression="uncompressed", chunksize=BATCH_ROWS
+                ),
+                self._publish,
+            )
+        count_written(path)
+
+    def write_batches(self, session_id, node_id, batches):
+        num_rows = 0
+
+        def write(path):
+            nonlocal num_rows
+            num_rows = _write_ipc_file(path, batches)
+
+        path = self.blob_path(session_id, node_id)
+        _replace_atomically(path, write, self._publish)
+        count_written(path)
+        return num_rows
+
+    def append(self, session_id, node_id, dataframe):
+        table = self.read_table(session_id, node_id)
+        try:
+            delta = _conform(_to_arrow(dataframe), table.schema)
+            schema = pa.unify_schemas(
+                [table.schema.remove_metadata(), delta.schema.remove_metadata()],
+                promote_options="permissive",
+            )
+            delta = delta.cast(schema)
+        except ARROW_ERRORS as e:
+            raise ValueError(str(e))
+
+        def write(path):
+            # Arrow IPC files end in a footer, so the rows are copied over to
+            # a new file batch by batch rather than appended in place
+            with ipc.new_file(path, schema) as writer:
+                for batch in table.to_batches(BATCH_ROWS):
+                    writer.write_table(pa.Table.from_batches([batch]).cast(schema))
+                writer.write_table(delta, max_chunksize=BATCH_ROWS)
+
+        path = self.blob_path(session_id, node_id)
+        with stage("write"):
+            _replace_atomically(path, write, self._publish)
+            # the CSV copy no longer matches; export writes a new one
+            try:
+                os.remove(self.csv_path(session_id, node_id))
+            except FileNotFoundError:
+                pass
+        count_written(path)
+        return table.num_rows + delta.num_rows
+
+    def export_csv(self, session_id, node_id):
+        csv_path = self.csv_path(session_id, node_id)
+        if os.path.exists(csv_path):
+            return csv_path
+        table = self.read_table(session_id, node_id)
+
+        def write(path):
+            with open(path, "w", newline="", encoding="utf-8") as file:
+                if table.num_rows == 0:
+                    table.to_pandas().to_csv(file, index=False)
+                for i, batch in enumerate(table.to_batches(BATCH_ROWS)):
+                    batch.to_pandas().to_csv(file, index=False, header=i == 0)
+
+        with stage("write"):
+            _replace_atomically(csv_path, write, self._publish)
+        count_written(csv_path)
+        return csv_path
+
+    def ingest_csv(self, session_id, node_id):
+        with stage("write"):
+            num_rows = self._ingest_csv(session_id, node_id)
+        count_written(self.blob_path(session_id, node_id))
+        return num_rows
+
+    def _ingest_csv(self, session_id, node_id):
+        csv_path = self.csv_path(session_id, node_id)
+        try:
+            return self._ingest_chunks(session_id, node_id, csv_path)
+        except ARROW_ERRORS:
+            pass
+        try:
+            # chunks inferred incompatible dtypes (e.g. ints that turn into
+            # floats further down); cast them all to a schema that fits each
+            with pd.read_csv(csv_path, chunksize=BATCH_ROWS) as reader:
+                schema = pa.unify_schemas(
+                    [_to_arrow(chunk).schema for chunk in reader],
+                    promote_options="permissive",
+                )
+            return self._ingest_chunks(session_id, node_id, csv_path, schema)
+        except ARROW_ERRORS:
+            # no common type (e.g. numbers and text in one column); fall back
+            # to a single full parse
+            self._migrate(session_id, node_id)
+            return self.num_rows(session_id, node_id)
+
+    def _ingest_chunks(self, session_id, node_id, csv_path, schema=None) -> int:
+        num_rows = 0
+
+        def write(path):
+            nonlocal num_rows
+            with pd.read_csv(csv_path, chunksize=BATCH_ROWS) as reader:
+                try:
+                    num_rows = _write_ipc_file(path, reader, schema)
+                except ValueError:
+                    # a header without rows yields no chunks
+                    feather.write_feather(
+                        _to_arrow(pd.read_csv(csv_path)),
+                        path,
+                        compression="uncompressed",
+                    )
+
+        _replace_atomically(self.blob_path(session_id, node_id), write, self._publish)
+        return num_rows
+
+    def _migrate(self, session_id, node_id):
+        dataframe = pd.read_csv(self.csv_path(session_id, node_id))
+        self.write(session_id, node_id, dataframe)
+
+
+ARROW_ERRORS = (pa.ArrowInvalid, pa.ArrowTypeError, pa.ArrowNotImplementedError)
+
+
+def _write_ipc_file(
+    path: str, frames: Iterable[pd.DataFrame], schema: Optional[pa.Schema] = None
+) -> int:
+    """Writes frames to one Arrow IPC (Feather v2) file as they arrive, cast to
+    ``schema`` or else to the first frame's schema, and returns the row count.
+    Raises ValueError when there are no frames."""
+    writer = None
+    num_rows = 0
+    try:
+        for frame in frames:
+            with stage("write"):
+                table = _to_arrow(frame)
+                if writer is None:
+                    if schema is None:
+                        schema = table.schema
+                    writer = ipc.new_file(path, schema)
+                writer.write_table(table.cast(schema), max_chunksize=BATCH_ROWS)
+            num_rows += len(frame)
+    finally:
+        if writer is not None:
+            writer.close()
+    if writer is None:
+        raise ValueError("No rows to write")
+    return num_rows
+
+
+def _conform(table: pa.Table, schema: pa.Schema) -> pa.Table:
+    """``table``'s columns in ``schema``'s order, with columns that are all
+    null given the schema's type (pandas parses them as floats)."""
+    columns = []
+    for field in schema:
+        column = table.column(field.name)
+        if column.null_count == len(column) and column.type != field.type:
+            column = pa.nulls(len(column), field.type)
+        columns.append(column)
+    return pa.table(columns, names=schema.names)
+
+
+def _to_arrow(dataframe: pd.DataFrame) -> pa.Table:
+    try:
+        return pa.Table.from_pandas(dataframe, preserve_index=False)
+    except (pa.ArrowInvalid, pa.ArrowTypeError):
+        # mixed-type object columns (e.g. describe() of a string column)
+        mixed = dataframe.select_dtypes(include="object").columns
+        return pa.Table.from_pandas(
+            dataframe.astype({column: "string" for column in mixed}),
+            preserve_index=False,
+        )
+
+
+NODE_STORES = {"feather": FeatherNodeStore, "csv": CsvNodeStore}
+
+
+def make_node_store(name: str, dedup: bool = False) -> NodeStore:
+    if name not in NODE_STORES:
+        raise ValueError(f"Unknown node storage backend: {name}")
+    return NODE_STORES[name](dedup=dedup)
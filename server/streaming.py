@@ -0,0 +1,249 @@
+from typing import Any, Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from operations import OPERATIONS, aggregate, aggregate_scalar, reservoir_sample
+from sketches import KLLSketch
+from storage import make_node_store
+
+# working memory per stored byte while a batch is converted and processed
+MEMORY_OVERHEAD = 4
+MIN_BATCH_ROWS = 1024
+DESCRIBE_QUANTILES = (0.25, 0.5, 0.75)
+
+# partial statistics each aggregation is rebuilt from; all of them merge
+# across batches, so only one batch and the per-group partials are held
+PARTIALS = {
+    "sum": ("sum",),
+    "count": ("count",),
+    "min": ("min",),
+    "max": ("max",),
+    "mean": ("sum", "count"),
+    "std": ("count", "mean", "m2"),
+}
+
+
+class StoredNode(NamedTuple):
+    """A result written straight to the node store instead of returned."""
+
+    node_id: str
+    num_rows: int
+
+
+def stream_batch_rows(
+    stored_bytes: int, num_rows: int, memory_budget: int
+) -> Optional[int]:
+    """Rows per batch when loading the input whole would exceed
+    ``memory_budget``, or None when it fits. Half the budget goes to the
+    batch; the rest is left for partial results."""
+    needed = stored_bytes * MEMORY_OVERHEAD
+    if num_rows == 0 or needed <= memory_budget:
+        return None
+    return max(MIN_BATCH_ROWS, int(memory_budget / 2 * num_rows / needed))
+
+
+def _batch_partial(
+    batch: pd.DataFrame, column: str, gb_cols: Optional[List[str]], stats
+) -> pd.DataFrame:
+    if gb_cols:
+        grouped = batch.groupby(gb_cols)[column]
+    else:
+        grouped = batch[column].groupby(np.zeros(len(batch), dtype=np.int8))
+    partial = pd.DataFrame(
+        {stat: getattr(grouped, stat)() for stat in stats if stat != "m2"}
+    )
+    if "m2" in stats:
+        partial["m2"] = grouped.var(ddof=0) * partial["count"]
+    return partial
+
+
+def _merge_partials(left: Optional[pd.DataFrame], right: pd.DataFrame) -> pd.DataFrame:
+    if left is None:
+        return right
+    # aligning on the union of groups turns integer columns into floats
+    integer = [
+        stat
+        for stat in left.columns
+        if left[stat].dtype.kind in "iu" and right[stat].dtype.kind in "iu"
+    ]
+    index = left.index.union(right.index)
+    left, right = left.reindex(index), right.reindex(index)
+    merged = pd.DataFrame(index=index)
+    for stat in left.columns:
+        if stat in ("sum", "count"):
+            merged[stat] = left[stat].add(right[stat], fill_value=0)
+        elif stat == "min":
+            merged[stat] = pd.concat([left[stat], right[stat]], axis=1).min(axis=1)
+        elif stat == "max":
+            merged[stat] = pd.concat([left[stat], right[stat]], axis=1).max(axis=1)
+    if "m2" in left.columns:
+        # Chan et al.'s pairwise update of the mean and sum of squared
+        # deviations
+        n_left, n_right = left["count"].fillna(0), right["count"].fillna(0)
+        n = n_left + n_right
+        mean_left, mean_right = left["mean"].fillna(0), right["mean"].fillna(0)
+        delta = mean_right - mean_left
+        with np.errstate(invalid="ignore", divide="ignore"):
+            merged["mean"] = (mean_left * n_left + mean_right * n_right) / n
+            merged["m2"] = (
+                left["m2"].fillna(0)
+                + right["m2"].fillna(0)
+                + delta**2 * n_left * n_right / n
+            )
+    for stat in integer:
+        merged[stat] = merged[stat].astype("int64")
+    return merged
+
+
+def _finish(partial: pd.DataFrame, func: str) -> pd.Series:
+    if func == "mean":
+        return partial["sum"] / partial["count"]
+    if func == "std":
+        count = partial["count"]
+        return np.sqrt(partial["m2"] / (count - 1)).where(count > 1)
+    return partial[func]
+
+
+def stream_aggregate(
+    batches: Iterable[pd.DataFrame],
+    columns: List[str],
+    funcs: List[str],
+    gb_cols: Optional[List[str]] = None,
+) -> Dict[Tuple[str, str], Any]:
+    """``aggregate`` over a stream of batches, with the same results. Memory
+    grows with the number of groups (and of distinct values for nunique),
+    not with the number of rows."""
+    stats = sorted({stat for func in funcs for stat in PARTIALS.get(func, ())})
+    partials = dict.fromkeys(columns)
+    distinct = dict.fromkeys(columns)
+    empty = None
+    num_rows = 0
+    for batch in batches:
+        if empty is None:
+            empty = batch.iloc[:0]
+        num_rows += len(batch)
+        for column in columns:
+            if stats:
+                partials[column] = _merge_partials(
+                    partials[column], _batch_partial(batch, column, gb_cols, stats)
+                )
+            if "nunique" in funcs:
+                pairs = batch[list(gb_cols or []) + [column]].drop_duplicates()
+                if distinct[column] is not None:
+                    pairs = pd.concat([distinct[column], pairs]).drop_duplicates()
+                distinct[column] = pairs
+    if num_rows == 0:
+        if empty is None:
+            empty = pd.DataFrame(columns=list(gb_cols or []) + columns)
+        return aggregate(empty, columns, funcs, gb_cols)
+
+    results = {}
+    for column in columns:
+        for func in funcs:
+            if func == "nunique" and gb_cols:
+                values = distinct[column].groupby(gb_cols)[column].nunique()
+            elif func == "nunique":
+                values = pd.Series([distinct[column][column].nunique()])
+            else:
+                values = _finish(partials[column], func)
+            if gb_cols:
+                results[(column, func)] = values.sort_index().rename(column)
+            else:
+                results[(column, func)] = aggregate_scalar(values.iloc[0], func)
+    return results
+
+
+def stream_value_counts(
+    batches: Iterable[pd.DataFrame], params: Dict[str, Any]
+) -> pd.DataFrame:
+    column = params["column"]
+    counts = None
+    for batch in batches:
+        batch_counts = batch[column].value_counts()
+        counts = (
+            batch_counts
+            if counts is None
+            else counts.add(batch_counts, fill_value=0).astype("int64")
+        )
+    if counts is None:
+        counts = pd.Series([], dtype="int64")
+    counts = counts.sort_values(ascending=False, kind="stable")
+    counts.name = "count"
+    counts.index.name = column
+    return counts.to_frame()
+
+
+def stream_describe(
+    batches: Iterable[pd.DataFrame], params: Dict[str, Any]
+) -> pd.DataFrame:
+    """``describe`` over a stream of batches. Count, mean, std, min and max
+    are exact; the quartiles come from a KLL sketch, so they are
+    approximate for inputs larger than the sketch, and the result's
+    ``attrs["approximate"]`` is set."""
+    column = params["column"]
+    numeric = partial = counts = None
+    sketch = KLLSketch()
+    for batch in batches:
+        series = batch[column]
+        if numeric is None:
+            numeric = pd.api.types.is_numeric_dtype(
+                series
+            ) and not pd.api.types.is_bool_dtype(series)
+        if numeric:
+            stats = ("count", "max", "mean", "min", "m2")
+            partial = _merge_partials(
+                partial, _batch_partial(batch, column, None, stats)
+            )
+            sketch.add(series.astype(float).to_numpy())
+        else:
+            batch_counts = series.value_counts()
+            counts = (
+                batch_counts
+                if counts is None
+                else counts.add(batch_counts, fill_value=0).astype("int64")
+            )
+    if numeric is None:
+        return pd.DataFrame(pd.Series([], dtype=float, name=column).describe())
+    if not numeric:
+        index = ["count", "unique", "top", "freq"]
+        values = [counts.sum(), len(counts), None, None]
+        if len(counts):
+            values[2:] = [counts.idxmax(), counts.max()]
+        return pd.DataFrame({column: values}, index=index, dtype=object)
+    stats = partial.iloc[0]
+    count = stats["count"]
+    std = np.sqrt(stats["m2"] / (count - 1)) if count > 1 else np.nan
+    values = [count, stats["mean"] if count else np.nan, std]
+    values += [stats["min"], *sketch.quantiles(DESCRIBE_QUANTILES), stats["max"]]
+    index = ["count", "mean", "std", "min", "25%", "50%", "75%", "max"]
+    description = pd.DataFrame({column: np.array(values, dtype=float)}, index=index)
+    if sketch.rank_error() > 0:
+        description.attrs["approximate"] = True
+    return description
+
+
+def stream_sample(
+    batches: Iterable[pd.DataFrame], params: Dict[str, Any]
+) -> pd.DataFrame:
+    return reservoir_sample(batches, params["n"], params["random_state"])
+
+
+def stream_filter(
+    batches: Iterable[pd.DataFrame],
+    params: Dict[str, Any],
+    store_name: str,
+    dedup: bool,
+    session_id: str,
+    dst_node_id: str,
+    op: str = "filter",
+) -> StoredNode:
+    """Filters batch by batch straight into the ``dst_node_id`` blob, so the
+    result never has to fit in memory either. ``op`` is any row-wise filter
+    operation."""
+    node_store = make_node_store(store_name, dedup)
+    run = OPERATIONS[op]
+    num_rows = node_store.write_batches(
+        session_id, dst_node_id, (run(batch, params) for batch in batches)
+    )
+    return StoredNode(dst_node_id, num_rows)
@@ -0,0 +1,57 @@
+import io
+import os
+
+import pandas as pd
+import pytest
+
+import main
+
+
+@pytest.fixture(scope="session", autouse=True)
+def storage_root(tmp_path_factory):
+    """Runs the suite in a scratch directory: sessions/ and archive/ are
+    relative to the working directory, and worker processes inherit it when
+    they start, so it is the same one for every test."""
+    root = tmp_path_factory.mktemp("storage")
+    previous = os.getcwd()
+    os.chdir(root)
+    yield root
+    os.chdir(previous)
+
+
+@pytest.fixture(autouse=True)
+def background_work():
+    yield
+    # profiles, indexes and quota checks run on this executor
+    main.profile_executor.submit(lambda: None).result()
+
+
+@pytest.fixture
+def client():
+    from fastapi.testclient import TestClient
+
+    return TestClient(main.app)
+
+
+@pytest.fixture
+def session_id(client):
+    response = client.post("/session/init", params={"session_name": "test"})
+    return response.json()["session_id"]
+
+
+@pytest.fixture
+def upload(client, session_id):
+    """Uploads a DataFrame as CSV and returns the new node's id once it has
+    been ingested."""
+
+    def upload(dataframe: pd.DataFrame, name: str = "data.csv") -> str:
+        body = io.StringIO()
+        dataframe.to_csv(body, index=False)
+        response = client.post(
+            f"/session/{session_id}/upload",
+            files={"file": (name, body.getvalue(), "text/csv")},
+        )
+        assert response.status_code == 200, response.text
+        return response.json()["node_id"]
+
+    return upload
@@ -0,0 +1,48 @@
+import pandas as pd
+import pytest
+
+from operations import aggregate
+
+
+@pytest.fixture
+def node_id(upload):
+    return upload(
+        pd.DataFrame(
+            {"a": range(100), "b": [i % 4 for i in range(100)], "s": ["x"] * 100}
+        )
+    )
+
+
+@pytest.mark.parametrize("func", ["sum", "mean", "min", "max"])
+def test_text_column_is_a_bad_request(client, session_id, node_id, func):
+    response = client.post(
+        f"/tools/{func}",
+        params={"session_id": session_id, "node_id": node_id, "column": "s"},
+    )
+    assert response.status_code == 400
+    assert response.json()["detail"] == "Column does not support aggregation"
+
+
+def test_counts_are_ints(client, session_id, node_id):
+    response = client.post(
+        "/tools/aggregate",
+        params={
+            "session_id": session_id,
+            "node_id": node_id,
+            "columns": ["a"],
+            "funcs": ["mean", "nunique", "count"],
+        },
+    )
+    results = response.json()["results"]
+    assert results == {"mean(a)": 49.5, "nunique(a)": 100, "count(a)": 100}
+    assert type(results["nunique(a)"]) is int
+    assert type(results["count(a)"]) is int
+
+
+def test_ungrouped_results_match_pandas():
+    dataset = pd.DataFrame({"a": [1.5, 2.5, None, 2.5]})
+    results = aggregate(dataset, ["a"], ["sum", "count", "nunique", "std"])
+    assert results[("a", "sum")] == dataset["a"].sum()
+    assert results[("a", "count")] == 3
+    assert results[("a", "nunique")] == 2
+    assert results[("a", "std")] == pytest.approx(dataset["a"].std())
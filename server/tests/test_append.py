@@ -0,0 +1,103 @@
+import io
+
+import pandas as pd
+import pytest
+
+import main
+
+
+def append(client, session_id, node_id, dataframe):
+    body = io.StringIO()
+    dataframe.to_csv(body, index=False)
+    return client.post(
+        f"/session/{session_id}/append/{node_id}",
+        files={"file": ("more.csv", body.getvalue(), "text/csv")},
+    )
+
+
+def test_append_brings_derived_nodes_up_to_date(client, session_id, upload):
+    before = pd.DataFrame({"a": range(20), "b": [i % 3 for i in range(20)]})
+    after = pd.DataFrame({"a": range(20, 30), "b": [i % 4 for i in range(10)]})
+    both = pd.concat([before, after], ignore_index=True)
+    node_id = upload(before)
+
+    def tool(path, **params):
+        return client.post(
+            path, params={"session_id": session_id, "node_id": node_id, **params}
+        ).json()
+
+    def results():
+        filtered = tool(
+            "/tools/filter/",
+            column="a",
+            filter_operator="ge",
+            filter_value=5,
+            format="split",
+        )
+        return {
+            "filtered": (filtered["node_id"], filtered["data"]),
+            "sum": tool("/tools/sum", column="a"),
+            "grouped": tool("/tools/mean", column="a", gb_col="b"),
+            "counts": tool("/tools/value_counts", column="b"),
+            "describe": tool("/tools/describe", column="a"),
+        }
+
+    earlier = results()
+    response = append(client, session_id, node_id, after)
+    assert response.status_code == 200, response.text
+    content = response.json()
+    assert (content["num_rows"], content["appended_rows"]) == (30, 10)
+    assert content["updated"] and content["invalidated"]
+
+    # answered from the memo, which holds the updated results
+    current = results()
+    assert current["filtered"][0] == earlier["filtered"][0]
+    assert current["filtered"][1] == both[both["a"] >= 5].values.tolist()
+    assert current["sum"] == both["a"].sum()
+    assert current["grouped"] == {
+        "a": {str(key): value for key, value in both.groupby("b")["a"].mean().items()}
+    }
+    assert current["counts"] == {
+        str(key): count for key, count in both["b"].value_counts().items()
+    }
+    assert current["describe"]["count"] == 30
+    assert current["describe"]["mean"] == pytest.approx(both["a"].mean())
+
+    rows = client.get(
+        f"/session/{session_id}/node_info", params={"node_id": node_id}
+    ).json()
+    assert len(rows) == 30
+
+
+def test_counts_stay_ints_after_an_append(client, session_id, upload):
+    node_id = upload(pd.DataFrame({"a": [1.5, 2.5, 2.5, 4.0]}))
+
+    def counts():
+        return client.post(
+            "/tools/aggregate",
+            params={
+                "session_id": session_id,
+                "node_id": node_id,
+                "columns": ["a"],
+                "funcs": ["count", "nunique", "sum"],
+            },
+        ).json()["results"]
+
+    assert counts() == {"count(a)": 4, "nunique(a)": 3, "sum(a)": 10.5}
+    response = append(client, session_id, node_id, pd.DataFrame({"a": [7.0]}))
+    assert response.status_code == 200, response.text
+    results = counts()
+    assert results == {"count(a)": 5, "nunique(a)": 4, "sum(a)": 17.5}
+    assert type(results["count(a)"]) is int
+    assert type(results["nunique(a)"]) is int
+    assert type(results["sum(a)"]) is float
+
+
+def test_append_rejects_mismatched_rows(client, session_id, upload):
+    node_id = upload(pd.DataFrame({"a": [1, 2], "b": [3, 4]}))
+    response = append(client, session_id, node_id, pd.DataFrame({"a": [1]}))
+    assert response.status_code == 400
+    response = append(client, session_id, node_id, pd.DataFrame({"a": ["x"], "b": [1]}))
+    assert response.status_code == 400
+    with main.metadata_store.snapshot(session_id) as metadata:
+        assert metadata.get_node(node_id)["num_rows"] == 2
@@ -0,0 +1,46 @@
+import math
+
+import numpy as np
+import pandas as pd
+
+from approximate import aggregate_estimate
+from operations import group_key
+
+
+def test_grouped_estimates_on_a_whole_node_sample_are_exact(client, session_id, upload):
+    # groups of one, two and three rows; the sample holds every row
+    dataset = pd.DataFrame({"g": [1, 2, 2, 3, 3, 3], "a": [1.0, 2, 4, 5, 6, 7]})
+    node_id = upload(dataset)
+    content = client.post(
+        "/tools/aggregate",
+        params={
+            "session_id": session_id,
+            "node_id": node_id,
+            "columns": ["a"],
+            "funcs": ["mean", "sum", "count"],
+            "gb_cols": ["g"],
+            "approximate": True,
+        },
+    ).json()
+
+    expected = dataset.groupby("g")["a"].agg(["mean", "sum", "count"])
+    for func in expected.columns:
+        values = {group_key(key): value for key, value in expected[func].items()}
+        assert content["results"][f"{func}(a)"] == values
+        assert content["bounds"][f"{func}(a)"] == {
+            key: [value, value] for key, value in values.items()
+        }
+
+
+def test_single_row_groups_get_bounds_from_a_partial_sample():
+    rng = np.random.default_rng(0)
+    sample = pd.DataFrame({"g": [0] * 50 + [1], "a": rng.normal(size=51)})
+    sketches = {"num_rows": 1000, "columns": {"g": {}, "a": {"moments": {}}}}
+
+    estimate = aggregate_estimate(sketches, sample, "a", "mean", ["g"])
+
+    for key in ("0", "1"):
+        low, high = estimate["bounds"][key]
+        assert math.isfinite(low) and math.isfinite(high)
+        assert low < estimate["result"][key] < high
+    assert estimate["result"]["1"] == sample["a"].iloc[-1]
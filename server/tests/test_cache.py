@@ -0,0 +1,91 @@
+import threading
+
+import numpy as np
+import pandas as pd
+
+import main
+from cache import NodeCache, dataframe_nbytes
+
+
+def frame(rows: int) -> pd.DataFrame:
+    return pd.DataFrame({"a": np.arange(rows, dtype="int64")})
+
+
+def test_evicts_least_recently_used_within_budget():
+    size = dataframe_nbytes(frame(100))
+    cache = NodeCache(max_bytes=2 * size)
+    cache.put("a", frame(100))
+    cache.put("b", frame(100))
+    cache.get("a")
+    cache.put("c", frame(100))
+
+    assert "a" in cache and "c" in cache
+    assert "b" not in cache
+    stats = cache.stats()
+    assert stats["evictions"] == 1
+    assert stats["bytes"] == 2 * size
+
+
+def test_frames_larger_than_the_budget_are_not_cached():
+    cache = NodeCache(max_bytes=dataframe_nbytes(frame(10)))
+    cache.put("big", frame(1000))
+    assert "big" not in cache
+    assert cache.stats()["bytes"] == 0
+
+
+def test_concurrent_misses_load_once():
+    cache = NodeCache(max_bytes=1024**2)
+    calls = []
+    started = threading.Barrier(4)
+
+    def loader():
+        calls.append(1)
+        return frame(10)
+
+    def load():
+        started.wait()
+        cache.get_or_load("key", loader)
+
+    threads = [threading.Thread(target=load) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(calls) == 1
+
+
+def test_invalidate_session_only_drops_that_session():
+    cache = NodeCache(max_bytes=1024**2)
+    cache.put(("s1", "n1"), frame(10))
+    cache.put(("s1", "n2"), frame(10))
+    cache.put(("s2", "n1"), frame(10))
+    cache.invalidate_session("s1")
+    assert ("s2", "n1") in cache
+    assert cache.stats()["entries"] == 1
+
+
+def test_evicted_node_is_materialized_from_its_recipe(client, session_id, upload):
+    node_id = upload(pd.DataFrame({"a": range(50), "b": [i % 5 for i in range(50)]}))
+    response = client.post(
+        "/tools/filter/",
+        params={
+            "session_id": session_id,
+            "node_id": node_id,
+            "column": "b",
+            "filter_operator": "eq",
+            "filter_value": 3,
+        },
+    )
+    filtered_id = response.json()["node_id"]
+    assert not main.node_store.exists(session_id, filtered_id)
+
+    main.node_cache.invalidate((session_id, filtered_id))
+    rows = client.get(
+        f"/session/{session_id}/node_info", params={"node_id": filtered_id}
+    ).json()
+
+    assert [row["a"] for row in rows] == list(range(3, 50, 5))
+    # reading it out wrote it to the store
+    assert main.node_store.exists(session_id, filtered_id)
+    with main.metadata_store.snapshot(session_id) as metadata:
+        assert metadata.get_node(filtered_id)["materialized"] is True
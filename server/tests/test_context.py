@@ -0,0 +1,88 @@
+import json
+
+import pandas as pd
+
+import main
+from context import SummaryCache, build_context, estimate_tokens
+
+
+def test_summary_cache_builds_once_until_invalidated():
+    cache = SummaryCache(max_entries=2)
+    builds = []
+
+    def build(text):
+        def build():
+            builds.append(text)
+            return text
+
+        return build
+
+    assert cache.get_or_build(("s", "a", 5), build("a")) == "a"
+    assert cache.get_or_build(("s", "a", 5), build("a again")) == "a"
+    cache.invalidate("s", "a")
+    assert cache.get_or_build(("s", "a", 5), build("a again")) == "a again"
+    assert builds == ["a", "a again"]
+
+    # summaries that could not be built are not kept
+    assert cache.get_or_build(("s", "b", 5), lambda: None) is None
+    assert cache.get_or_build(("s", "b", 5), build("b")) == "b"
+    # least recently used first
+    cache.get_or_build(("s", "a", 5), build("unused"))
+    cache.get_or_build(("t", "c", 5), build("c"))
+    assert cache.get_or_build(("s", "b", 5), build("b rebuilt")) == "b rebuilt"
+    cache.invalidate("s")
+    assert cache.get_or_build(("t", "c", 5), build("unused")) == "c"
+
+
+def graph(count):
+    nodes = [
+        {"node_id": f"node-{i:02d}", "node_name": f"n{i}", "columns": []}
+        for i in range(count)
+    ]
+    edges = [
+        {"src_id": f"node-{i:02d}", "dst_id": f"node-{i + 1:02d}", "operation": "op"}
+        for i in range(count - 1)
+    ]
+    return nodes, edges
+
+
+def summary(node):
+    return json.dumps({"node_id": node["node_id"], "padding": "x" * 200})
+
+
+def test_context_fits_the_budget_and_lists_the_rest():
+    nodes, edges = graph(30)
+    text = build_context("session", "look at node-07", nodes, edges, summary, 400)
+    assert estimate_tokens(text) <= 400
+    assert text.startswith("Session ID: session\n")
+    assert text.endswith("Instruction: look at node-07")
+    # the node the prompt names comes first
+    assert text.split("Nodes:\n")[1].startswith('{"node_id": "node-07"')
+    included = [node["node_id"] for node in nodes if f'"{node["node_id"]}"' in text]
+    assert "node-07" in included and len(included) < len(nodes)
+    assert f"Other nodes ({len(nodes) - len(included)}" in text
+    assert "node-06 -> node-07: op" in text
+
+
+def test_context_holds_everything_within_a_large_budget():
+    nodes, edges = graph(5)
+    text = build_context("session", "hi", nodes, edges, summary, 10_000)
+    assert all(f'"{node["node_id"]}"' in text for node in nodes)
+    assert all(f"{e['src_id']} -> {e['dst_id']}: op" in text for e in edges)
+    assert "Other nodes" not in text
+
+
+def test_ingest_refreshes_the_prompt_summary(monkeypatch, client, session_id, upload):
+    deferred = []
+    monkeypatch.setattr(main, "ingest_node", lambda *args: deferred.append(args))
+    node_id = upload(pd.DataFrame({"a": [1, 2, 3]}))
+
+    def num_rows():
+        with main.metadata_store.snapshot(session_id) as metadata:
+            node = metadata.get_node(node_id)
+        return json.loads(main.node_summary(session_id, node, {}, 5))["num_rows"]
+
+    assert num_rows() is None
+    monkeypatch.undo()
+    main.ingest_node(*deferred[0])
+    assert num_rows() == 3
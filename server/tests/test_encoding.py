@@ -0,0 +1,58 @@
+import datetime
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import encoding
+from encoding import DATA_FORMATS, dumps, encode_data, json_response
+
+pytest.importorskip("orjson")
+
+VALUES = [
+    {"sum(a)": 1.5, "count(a)": 3, "name": "café", "flag": True, "none": None},
+    [float("nan"), float("inf"), -float("inf"), np.float64("nan"), 1e16, 0.1],
+    [np.int64(3), np.float32(0.5), np.bool_(True), np.array([1.0, np.nan])],
+    {1: "int key", 2.5: "float key", None: "null key"},
+    [
+        datetime.datetime(2024, 1, 2, 3, 4, 5, 123456),
+        datetime.datetime(2024, 1, 2, tzinfo=datetime.timezone.utc),
+        datetime.date(2024, 1, 2),
+        pd.Timestamp("2024-01-02 03:04:05"),
+        pd.Timestamp("2024-01-02", tz="UTC"),
+        pd.NaT,
+        np.datetime64("2024-01-02T03:04:05"),
+    ],
+]
+
+
+def with_stdlib(monkeypatch, encode, *args):
+    with monkeypatch.context() as patch:
+        patch.setattr(encoding, "orjson", None)
+        return encode(*args)
+
+
+@pytest.mark.parametrize("content", VALUES)
+def test_encoders_write_the_same_json(monkeypatch, content):
+    assert dumps(content) == with_stdlib(monkeypatch, dumps, content)
+    assert (
+        json_response(content).body
+        == with_stdlib(monkeypatch, json_response, content).body
+    )
+
+
+@pytest.mark.parametrize("format", DATA_FORMATS)
+def test_encoders_write_the_same_data(monkeypatch, format):
+    dataframe = pd.DataFrame(
+        {
+            "a": [1.5, float("nan"), float("inf")],
+            "b": [1, 2, 3],
+            "t": pd.to_datetime(["2024-01-01 00:00", None, "2024-01-03 12:00"]),
+            "s": ["x", None, "z"],
+        }
+    )
+
+    def encode():
+        return json_response(encode_data(dataframe, "node", format, 2)).body
+
+    assert encode() == with_stdlib(monkeypatch, encode)
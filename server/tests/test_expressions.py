@@ -0,0 +1,108 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+import expressions
+from expressions import ExpressionError, expression_mask, parse_expression
+
+numexpr = pytest.importorskip("numexpr")
+
+
+@pytest.fixture
+def dataset():
+    return pd.DataFrame(
+        {
+            "x": [1.0, 2.5, np.nan, 4.0, -1.0, 10.0],
+            "n": [1, 2, 3, 4, 5, 6],
+            "s": ["a", "b", None, "a", "c", "b"],
+            "flag": [True, False, True, False, True, False],
+            "k": pd.array([1, None, 3, None, 5, 6], dtype="Int64"),
+        }
+    )
+
+
+EXPRESSIONS = [
+    # numeric only: evaluated by numexpr as a whole
+    {"column": "x", "op": "gt", "value": 2},
+    {"column": "x", "op": "ne", "value": 4},
+    {"not": {"column": "x", "op": "le", "value": 2.5}},
+    {
+        "or": [
+            {
+                "and": [
+                    {"column": "x", "op": "ge", "value": 0},
+                    {"column": "n", "op": "lt", "value": 4},
+                ]
+            },
+            {"column": "n", "op": "eq", "value": 6},
+        ]
+    },
+    # parts that need pandas
+    {"column": "x", "op": "in", "value": [1, 4, 7]},
+    {"column": "s", "op": "eq", "value": "a"},
+    {"column": "s", "op": "ne", "value": "a"},
+    {"column": "s", "op": "in", "value": ["b", "c"]},
+    {"column": "flag", "op": "eq", "value": True},
+    {"column": "k", "op": "gt", "value": 2},
+    {"column": "k", "op": "ne", "value": 3},
+    {"column": "x", "op": "is_null"},
+    {"not": {"column": "s", "op": "not_null"}},
+    {
+        "and": [
+            {"column": "x", "op": "lt", "value": 5},
+            {
+                "or": [
+                    {"column": "s", "op": "in", "value": ["a"]},
+                    {"column": "k", "op": "is_null"},
+                ]
+            },
+        ]
+    },
+]
+
+
+def pandas_mask(dataset, expr):
+    with pytest.MonkeyPatch.context() as patch:
+        patch.setattr(expressions, "numexpr", None)
+        return expression_mask(dataset, expr)
+
+
+@pytest.mark.parametrize("expr", EXPRESSIONS)
+def test_numexpr_and_pandas_give_the_same_mask(dataset, expr):
+    expr = parse_expression(expr, list(dataset.columns))
+    mask = expression_mask(dataset, expr)
+    assert mask.dtype == bool
+    np.testing.assert_array_equal(mask, pandas_mask(dataset, expr))
+
+
+def test_numeric_expressions_use_numexpr(dataset, monkeypatch):
+    calls = []
+    evaluate = numexpr.evaluate
+    monkeypatch.setattr(
+        numexpr,
+        "evaluate",
+        lambda *args, **kwargs: calls.append(args[0]) or evaluate(*args, **kwargs),
+    )
+    expr = parse_expression(EXPRESSIONS[3], list(dataset.columns))
+    np.testing.assert_array_equal(
+        expression_mask(dataset, expr), [True, True, False, False, False, True]
+    )
+    assert len(calls) == 1
+
+
+def test_nulls_only_match_ne_and_is_null(dataset):
+    columns = list(dataset.columns)
+    for op in ("lt", "le", "gt", "ge", "eq"):
+        expr = parse_expression({"column": "x", "op": op, "value": 0}, columns)
+        assert not expression_mask(dataset, expr)[2]
+    for op, value in (("ne", 0), ("is_null", None)):
+        expr = parse_expression({"column": "x", "op": op, "value": value}, columns)
+        assert expression_mask(dataset, expr)[2]
+
+
+def test_order_comparison_on_text_is_rejected(dataset):
+    expr = parse_expression(
+        {"column": "s", "op": "lt", "value": 1}, list(dataset.columns)
+    )
+    with pytest.raises(ExpressionError):
+        expression_mask(dataset, expr)
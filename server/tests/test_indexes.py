@@ -0,0 +1,85 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+import main
+from indexes import ColumnIndex
+from operations import FILTER_OPERATORS
+
+OPERATORS = list(FILTER_OPERATORS)
+
+
+@pytest.fixture
+def dataset():
+    rng = np.random.default_rng(0)
+    rows = 2000
+    dataset = pd.DataFrame(
+        {"a": rng.integers(0, 500, rows).astype(float), "b": np.arange(rows)}
+    )
+    dataset.loc[rng.random(rows) < 0.05, "a"] = np.nan
+    return dataset
+
+
+@pytest.mark.parametrize("filter_operator", OPERATORS)
+def test_lookup_matches_the_filter_mask(dataset, filter_operator):
+    index = ColumnIndex.build(dataset["a"])
+    for value in (-1.0, 0.0, 250.0, 250.5, 499.0, 1000.0):
+        mask = FILTER_OPERATORS[filter_operator](dataset["a"], value)
+        positions = index.lookup(filter_operator, value)
+        np.testing.assert_array_equal(positions, np.flatnonzero(mask))
+
+
+def test_lookup_gives_up_past_max_rows(dataset):
+    index = ColumnIndex.build(dataset["a"])
+    assert index.lookup("ge", 0.0, max_rows=100) is None
+    assert len(index.lookup("eq", 7.0, max_rows=100)) <= 100
+
+
+def test_indexed_filters_match_a_full_scan(
+    monkeypatch, client, session_id, upload, dataset
+):
+    indexed_id, scanned_id = upload(dataset), upload(dataset)
+    response = client.post(
+        f"/session/{session_id}/index/{indexed_id}", params={"column": "a"}
+    )
+    assert response.status_code == 200
+    assert response.json()["null_count"] == int(dataset["a"].isna().sum())
+
+    answered = []
+    indexed_rows = main.indexed_rows
+
+    def spy(session_id, node_id, params):
+        rows = indexed_rows(session_id, node_id, params)
+        if node_id == indexed_id:
+            answered.append(rows is not None)
+        return rows
+
+    monkeypatch.setattr(main, "indexed_rows", spy)
+
+    def filtered(node_id, filter_operator, filter_value):
+        response = client.post(
+            "/tools/filter/",
+            params={
+                "session_id": session_id,
+                "node_id": node_id,
+                "column": "a",
+                "filter_operator": filter_operator,
+                "filter_value": filter_value,
+                "format": "split",
+            },
+        ).json()
+        return response["num_rows"], response["data"]
+
+    # all but ne are selective enough to be answered from the index
+    for filter_operator, filter_value in [
+        ("eq", 42),
+        ("lt", 20),
+        ("le", 20),
+        ("gt", 480),
+        ("ge", 480),
+        ("ne", 42),
+    ]:
+        assert filtered(indexed_id, filter_operator, filter_value) == filtered(
+            scanned_id, filter_operator, filter_value
+        )
+    assert answered == [True] * 5 + [False]
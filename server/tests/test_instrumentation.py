@@ -0,0 +1,104 @@
+import re
+
+import pandas as pd
+import pytest
+
+import main
+from instrumentation import METRIC_PREFIX, Metrics
+
+STAGES = {"metadata", "read", "compute", "write", "encode"}
+
+
+def samples(text, name):
+    """{labels: value} of the metric's samples in a Prometheus text body."""
+    found = {}
+    pattern = re.compile(rf"^{METRIC_PREFIX}_{name}\{{(.*)\}} (\S+)$")
+    for line in text.splitlines():
+        match = pattern.match(line)
+        if match:
+            labels = tuple(sorted(re.findall(r'(\w+)="([^"]*)"', match.group(1))))
+            found[labels] = float(match.group(2))
+    return found
+
+
+def server_timing(header):
+    entries = {}
+    for entry in header.split(", "):
+        name, _, value = entry.partition(";")
+        entries[name] = value
+    return entries
+
+
+@pytest.fixture
+def node_id(upload):
+    return upload(pd.DataFrame({"a": range(1000), "b": [i % 3 for i in range(1000)]}))
+
+
+def test_server_timing_names_the_stages(client, session_id, node_id):
+    main.node_cache.invalidate((session_id, node_id))
+    response = client.post(
+        "/tools/aggregate",
+        params={
+            "session_id": session_id,
+            "node_id": node_id,
+            "columns": ["a"],
+            "funcs": ["sum", "std"],
+            "gb_cols": ["b"],
+        },
+    )
+    entries = server_timing(response.headers["Server-Timing"])
+    durations = {name for name, value in entries.items() if value.startswith("dur=")}
+    assert {"metadata", "read", "compute", "encode", "total"} <= durations
+    assert durations - {"total"} <= STAGES
+    assert all(float(entries[name][4:]) >= 0 for name in durations)
+    assert entries["rows_in"] == 'desc="1000"'
+
+
+def test_request_counts_match_the_requests(client, session_id, node_id):
+    labels = (("method", "POST"), ("route", "/tools/sum"), ("status", "200"))
+
+    def observed():
+        text = client.get("/metrics").text
+        count = samples(text, "request_duration_seconds_count").get(labels, 0)
+        buckets = {
+            dict(key)["le"]: value
+            for key, value in samples(text, "request_duration_seconds_bucket").items()
+            if tuple(item for item in key if item[0] != "le") == labels
+        }
+        return count, buckets
+
+    before, _ = observed()
+    for _ in range(5):
+        response = client.post(
+            "/tools/sum",
+            params={"session_id": session_id, "node_id": node_id, "column": "a"},
+        )
+        assert response.status_code == 200
+    after, buckets = observed()
+    assert after - before == 5
+    assert buckets["+Inf"] == after
+
+    response = client.get("/metrics")
+    assert response.headers["content-type"].startswith("text/plain; version=0.0.4")
+    text = response.text
+    stages = samples(text, "stage_duration_seconds_count")
+    assert any(
+        dict(key) == {"phase": "request", "route": "/tools/sum", "stage": "compute"}
+        for key in stages
+    )
+    assert text.count(f"# TYPE {METRIC_PREFIX}_request_duration_seconds ") == 1
+
+
+def test_histogram_buckets_are_cumulative():
+    metrics = Metrics(buckets=(0.1, 1.0, float("inf")))
+    for seconds in (0.05, 0.5, 0.5, 5.0):
+        metrics.observe_request("GET", "/x", 200, seconds)
+    metrics.add_count("/x", "rows_in", "request", 7)
+    text = metrics.render()
+    buckets = samples(text, "request_duration_seconds_bucket")
+    by_bound = {float(dict(key)["le"]): value for key, value in buckets.items()}
+    assert [by_bound[bound] for bound in sorted(by_bound)] == [1, 3, 4]
+    assert list(samples(text, "request_duration_seconds_count").values()) == [4]
+    assert list(samples(text, "request_duration_seconds_sum").values()) == [6.05]
+    assert list(samples(text, "rows_in_total").values()) == [7]
+    assert f"# TYPE {METRIC_PREFIX}_rows_in_total counter" in text
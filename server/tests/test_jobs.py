@@ -0,0 +1,93 @@
+import json
+import time
+
+import pandas as pd
+import pytest
+
+import main
+
+
+@pytest.fixture
+def async_jobs(monkeypatch):
+    """Sends every computation to the worker processes as a job."""
+    monkeypatch.setattr(main, "EXECUTOR_MIN_ROWS", 1)
+    monkeypatch.setattr(main, "ASYNC_JOB_MIN_ROWS", 1)
+
+
+@pytest.fixture
+def node_id(upload):
+    return upload(pd.DataFrame({"a": range(100), "s": ["x"] * 100}))
+
+
+def submit(client, session_id, node_id, func, column):
+    # the test client returns once the background task completing the job
+    # has run
+    response = client.post(
+        f"/tools/{func}",
+        params={"session_id": session_id, "node_id": node_id, "column": column},
+    )
+    assert response.status_code == 202
+    assert response.json()["status"] == "queued"
+    return response.json()["job_id"]
+
+
+def test_job_completes_with_the_result(async_jobs, client, session_id, node_id):
+    job_id = submit(client, session_id, node_id, "sum", "a")
+
+    job = client.get(f"/session/{session_id}/jobs/{job_id}").json()
+    assert job["status"] == "done"
+    assert job["result"] == 4950.0
+    assert job["operation"] == "sum(a)"
+
+    # recorded like a synchronous result, so the memo answers the next request
+    response = client.post(
+        "/tools/sum",
+        params={"session_id": session_id, "node_id": node_id, "column": "a"},
+    )
+    assert response.status_code == 200
+    assert response.json() == 4950.0
+
+
+@pytest.mark.parametrize("func", ["sum", "mean"])
+def test_failed_job_reports_the_error(async_jobs, client, session_id, node_id, func):
+    job_id = submit(client, session_id, node_id, func, "s")
+
+    response = client.get(f"/session/{session_id}/jobs/{job_id}/stream")
+    updates = [json.loads(line) for line in response.text.splitlines()]
+    assert updates[-1]["status"] == "failed"
+    assert updates[-1]["error"] == "Column does not support aggregation"
+    with main.metadata_store.snapshot(session_id) as metadata:
+        assert metadata.active_jobs() == 0
+
+
+def test_unknown_job_is_not_found(client, session_id):
+    response = client.get(f"/session/{session_id}/jobs/missing")
+    assert response.status_code == 404
+
+
+def test_startup_fails_jobs_left_by_an_earlier_process(client, session_id, node_id):
+    from fastapi.testclient import TestClient
+
+    with main.metadata_store.transaction(session_id) as metadata:
+        metadata.add_job("queued-job", "sum(a)", node_id)
+        metadata.add_job("running-job", "mean(a)", node_id)
+        metadata.update_job("running-job", "running")
+    response = client.post(f"/session/{session_id}/archive")
+    assert response.status_code == 409
+
+    with TestClient(main.app):
+        # jobs of the running process are left alone
+        with main.metadata_store.transaction(session_id) as metadata:
+            metadata.add_job("new-job", "sum(a)", node_id)
+        assert main.fail_interrupted_jobs(time.time() - 3600) == 0
+        with main.metadata_store.snapshot(session_id) as metadata:
+            for job_id in ("queued-job", "running-job"):
+                job = metadata.get_job(job_id)
+                assert job["status"] == "failed"
+                assert job["error"] == "Server restarted before the job finished"
+            assert metadata.get_job("new-job")["status"] == "queued"
+        with main.metadata_store.transaction(session_id) as metadata:
+            metadata.update_job("new-job", "done", result="4950.0")
+
+    response = client.post(f"/session/{session_id}/archive")
+    assert response.status_code == 200, response.text
@@ -0,0 +1,76 @@
+import pandas as pd
+
+import main
+
+
+def run_chain(client, session_id, node_id, lazy):
+    """filter -> filter_expr -> grouped sum; returns the two filtered node ids
+    and the sums by group."""
+    filtered = client.post(
+        "/tools/filter/",
+        params={
+            "session_id": session_id,
+            "node_id": node_id,
+            "column": "a",
+            "filter_operator": "ge",
+            "filter_value": 10,
+            "lazy": lazy,
+        },
+    ).json()["node_id"]
+    selected = client.post(
+        "/tools/filter_expr",
+        params={"session_id": session_id, "node_id": filtered, "lazy": lazy},
+        json={
+            "or": [
+                {"column": "b", "op": "in", "value": [1, 2]},
+                {"column": "c", "op": "is_null"},
+            ]
+        },
+    ).json()["node_id"]
+    response = client.post(
+        "/tools/sum",
+        params={
+            "session_id": session_id,
+            "node_id": selected,
+            "column": "a",
+            "gb_col": "b",
+            "lazy": lazy,
+        },
+    ).json()
+    if lazy:
+        rows = node_rows(client, session_id, response["node_id"])
+        sums = [row["a"] for row in rows]
+    else:
+        sums = list(response["a"].values())
+    return filtered, selected, sums
+
+
+def node_rows(client, session_id, node_id):
+    return client.get(
+        f"/session/{session_id}/node_info", params={"node_id": node_id}
+    ).json()
+
+
+def test_lazy_chain_matches_eager_chain(client, session_id, upload):
+    dataset = pd.DataFrame(
+        {
+            "a": range(200),
+            "b": [i % 4 for i in range(200)],
+            "c": [None if i % 7 == 0 else i for i in range(200)],
+        }
+    )
+    # separate sources, so the eager chain isn't answered from the lazy memo
+    lazy = run_chain(client, session_id, upload(dataset), lazy=True)
+    eager = run_chain(client, session_id, upload(dataset), lazy=False)
+
+    with main.metadata_store.snapshot(session_id) as metadata:
+        assert metadata.get_node(lazy[0])["materialized"] is False
+    for lazy_id, eager_id in zip(lazy[:2], eager[:2]):
+        assert node_rows(client, session_id, lazy_id) == node_rows(
+            client, session_id, eager_id
+        )
+
+    expected = dataset[
+        (dataset["a"] >= 10) & (dataset["b"].isin([1, 2]) | dataset["c"].isna())
+    ]
+    assert lazy[2] == eager[2] == expected.groupby("b")["a"].sum().tolist()
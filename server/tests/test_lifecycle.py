@@ -0,0 +1,149 @@
+import asyncio
+import os
+import subprocess
+import sys
+import time
+
+import pandas as pd
+import pytest
+
+import main
+from lifecycle import SessionArchive, disk_usage
+from storage import session_dir
+
+
+@pytest.fixture
+def derived(client, session_id, upload):
+    """An uploaded node and a stored filter of it that was last used an
+    hour ago."""
+    node_id = upload(pd.DataFrame({"a": range(500), "b": [i % 5 for i in range(500)]}))
+    filtered = client.post(
+        "/tools/filter/",
+        params={
+            "session_id": session_id,
+            "node_id": node_id,
+            "column": "b",
+            "filter_operator": "eq",
+            "filter_value": 2,
+            "format": "split",
+        },
+    ).json()
+    filtered_id = filtered["node_id"]
+    main.persist_node(session_id, filtered_id)
+    an_hour_ago = time.time() - 3600
+    os.utime(main.node_store.blob_path(session_id, filtered_id), (an_hour_ago,) * 2)
+    main.access_log.forget(session_id)
+    return node_id, filtered_id, filtered["data"]
+
+
+def node_rows(client, session_id, node_id):
+    return client.get(
+        f"/session/{session_id}/node_info",
+        params={"node_id": node_id, "format": "json"},
+    ).json()
+
+
+def test_quota_evicts_cold_nodes_first(monkeypatch, client, session_id, derived):
+    node_id, filtered_id, rows = derived
+    usage = disk_usage(session_dir(session_id))
+    monkeypatch.setattr(main, "SESSION_QUOTA_BYTES", usage - 1)
+
+    report = main.enforce_quotas([session_id])
+
+    assert report["evicted_bytes"] > 0
+    assert not main.node_store.exists(session_id, filtered_id)
+    assert main.node_store.exists(session_id, node_id)
+    main.node_cache.invalidate((session_id, filtered_id))
+    # rebuilt from its recipe when next read
+    assert [
+        list(row.values()) for row in node_rows(client, session_id, filtered_id)
+    ] == rows
+
+
+def test_upload_over_the_quota_is_refused(monkeypatch, client, session_id, upload):
+    monkeypatch.setattr(main, "SESSION_QUOTA_BYTES", 1)
+    with pytest.raises(AssertionError, match="413"):
+        upload(pd.DataFrame({"a": range(100)}))
+    # the uploaded file is removed again
+    assert not [
+        name for name in os.listdir(session_dir(session_id)) if name.endswith(".csv")
+    ]
+
+
+def test_archived_session_is_restored_on_use(client, session_id, derived):
+    node_id, filtered_id, rows = derived
+    uploaded = node_rows(client, session_id, node_id)
+
+    response = client.post(f"/session/{session_id}/archive")
+    assert response.status_code == 200
+    assert not os.path.exists(session_dir(session_id))
+    assert main.session_archive.exists(session_id)
+
+    assert node_rows(client, session_id, node_id) == uploaded
+    assert [
+        list(row.values()) for row in node_rows(client, session_id, filtered_id)
+    ] == rows
+    assert os.path.isdir(session_dir(session_id))
+    assert not main.session_archive.exists(session_id)
+
+
+def test_archive_lock_holds_across_processes(tmp_path):
+    archive = SessionArchive(str(tmp_path))
+    session_id = "locked-session"
+    os.makedirs(archive.root, exist_ok=True)
+    holder = subprocess.Popen(
+        [
+            sys.executable,
+            "-c",
+            "import fcntl, sys, time\n"
+            "file = open(sys.argv[1], 'a')\n"
+            "fcntl.flock(file, fcntl.LOCK_EX)\n"
+            "print('locked', flush=True)\n"
+            "time.sleep(0.5)\n",
+            archive.lock_path(session_id),
+        ],
+        stdout=subprocess.PIPE,
+        text=True,
+    )
+    try:
+        assert holder.stdout.readline().strip() == "locked"
+        started = time.monotonic()
+        # waits for the other process, then finds nothing to restore
+        assert archive.restore(session_id) is False
+        assert time.monotonic() - started >= 0.3
+    finally:
+        holder.wait()
+
+
+def test_restore_without_an_archive_leaves_no_lock_file(tmp_path):
+    archive = SessionArchive(str(tmp_path / "archive"))
+    assert archive.restore("never-archived") is False
+    assert not os.path.exists(archive.root)
+
+
+@pytest.mark.parametrize(
+    "path, kwargs",
+    [
+        (
+            "/session/archived-session/upload",
+            {"files": {"file": ("data.csv", "a\n1\n", "text/csv")}},
+        ),
+        ("/gemini", {"params": {"session_id": "archived-session", "prompt": "hi"}}),
+    ],
+)
+def test_async_handlers_restore_sessions_off_the_event_loop(
+    monkeypatch, client, path, kwargs
+):
+    on_loop = []
+
+    def session_exists(session_id):
+        try:
+            asyncio.get_running_loop()
+            on_loop.append(True)
+        except RuntimeError:
+            on_loop.append(False)
+        return False
+
+    monkeypatch.setattr(main, "session_exists", session_exists)
+    assert client.post(path, **kwargs).status_code == 404
+    assert on_loop == [False]
@@ -0,0 +1,28 @@
+import asyncio
+
+from fastmcp import FastMCP
+
+from mcp_session import MCPConnection
+
+
+def test_tool_calls_are_not_bounded_by_the_connect_timeout():
+    server = FastMCP("test")
+
+    @server.tool
+    async def slow() -> str:
+        await asyncio.sleep(0.3)
+        return "done"
+
+    async def run():
+        connection = MCPConnection(server, connect_timeout=0.1)
+        try:
+            first = await (await connection.session()).call_tool("slow", {})
+            second = await (await connection.session()).call_tool("slow", {})
+            return first, second, connection.connects
+        finally:
+            await connection.close()
+
+    first, second, connects = asyncio.run(run())
+    assert not first.is_error and first.content[0].text == "done"
+    assert not second.is_error
+    assert connects == 1
@@ -0,0 +1,62 @@
+import pandas as pd
+
+import main
+from memo import recipe_fingerprint
+
+
+def memo_counts(client, op):
+    stats = client.get("/memo/stats").json()["by_op"].get(op, {})
+    return stats.get("hits", 0), stats.get("misses", 0)
+
+
+def filter_rows(client, session_id, node_id):
+    response = client.post(
+        "/tools/filter/",
+        params={
+            "session_id": session_id,
+            "node_id": node_id,
+            "column": "b",
+            "filter_operator": "lt",
+            "filter_value": 2,
+            "format": "split",
+        },
+    ).json()
+    return response["node_id"], response["data"]
+
+
+def test_fingerprint_ignores_int_float_spelling():
+    params = {"column": "a", "filter_operator": "eq"}
+    assert recipe_fingerprint(
+        main.make_recipe("filter", "n", {**params, "filter_value": 10})
+    ) == recipe_fingerprint(
+        main.make_recipe("filter", "n", {**params, "filter_value": 10.0})
+    )
+
+
+def test_memo_hits_survive_eviction(client, session_id, upload):
+    node_id = upload(pd.DataFrame({"a": range(40), "b": [i % 5 for i in range(40)]}))
+    hits, misses = memo_counts(client, "filter")
+
+    filtered_id, rows = filter_rows(client, session_id, node_id)
+    assert memo_counts(client, "filter") == (hits, misses + 1)
+
+    # evicted from memory and from the store: the memo still answers, and the
+    # node is rebuilt from its recipe
+    main.evict_node(session_id, filtered_id)
+    assert not main.node_store.exists(session_id, filtered_id)
+    main.node_cache.invalidate((session_id, filtered_id))
+    assert filter_rows(client, session_id, node_id) == (filtered_id, rows)
+    assert memo_counts(client, "filter") == (hits + 1, misses + 1)
+
+    stats = client.get("/memo/stats", params={"session_id": session_id}).json()
+    assert stats["session"] == {"entries": 1, "hits": 1}
+
+
+def test_new_parameters_miss(client, session_id, upload):
+    node_id = upload(pd.DataFrame({"a": range(10)}))
+    hits, misses = memo_counts(client, "aggregate")
+    params = {"session_id": session_id, "node_id": node_id, "column": "a"}
+    assert client.post("/tools/sum", params=params).json() == 45
+    assert client.post("/tools/mean", params=params).json() == 4.5
+    assert client.post("/tools/sum", params=params).json() == 45
+    assert memo_counts(client, "aggregate") == (hits + 1, misses + 2)
@@ -0,0 +1,106 @@
+import json
+import os
+import sqlite3
+import threading
+from uuid import uuid4
+
+import pytest
+
+from metadata import SCHEMA_VERSION, MetadataStore
+from storage import session_dir
+
+
+def node(node_id: str):
+    return {"node_id": node_id, "node_name": node_id, "type": "data"}
+
+
+@pytest.fixture
+def store():
+    return MetadataStore(busy_timeout=5.0)
+
+
+@pytest.fixture
+def new_session(store):
+    session_id = str(uuid4())
+    store.create(session_id, "test")
+    return session_id
+
+
+def test_create_sets_up_wal_and_schema_once(store, new_session):
+    conn = sqlite3.connect(store.db_path(new_session))
+    try:
+        assert conn.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+        assert conn.execute("PRAGMA user_version").fetchone()[0] == SCHEMA_VERSION
+    finally:
+        conn.close()
+    with store.snapshot(new_session) as metadata:
+        assert metadata.session_name == "test"
+
+
+def test_connections_skip_setup_once_prepared(store, new_session, monkeypatch):
+    prepared = []
+    prepare = MetadataStore._prepare
+    monkeypatch.setattr(
+        MetadataStore,
+        "_prepare",
+        lambda self, *args: prepared.append(1) or prepare(self, *args),
+    )
+    for _ in range(3):
+        with store.snapshot(new_session):
+            pass
+        with MetadataStore().transaction(new_session):
+            pass
+    # once for each store that had not opened the file before
+    assert len(prepared) == 3
+
+
+def test_snapshots_are_not_blocked_by_a_writer(store, new_session):
+    with store.transaction(new_session) as metadata:
+        metadata.add_node(node("committed"))
+    # a fresh store has not opened the file yet in this process
+    reader = MetadataStore(busy_timeout=0.1)
+    with store.transaction(new_session) as metadata:
+        metadata.add_node(node("pending"))
+        with reader.snapshot(new_session) as snapshot:
+            assert [n["node_id"] for n in snapshot.nodes()] == ["committed"]
+
+
+def test_failed_transaction_rolls_back(store, new_session):
+    with pytest.raises(RuntimeError):
+        with store.transaction(new_session) as metadata:
+            metadata.add_node(node("lost"))
+            raise RuntimeError
+    with store.snapshot(new_session) as metadata:
+        assert metadata.get_node("lost") is None
+
+
+def test_concurrent_writers_are_serialised(store, new_session):
+    def write(worker: int):
+        for i in range(20):
+            with store.transaction(new_session) as metadata:
+                metadata.add_node(node(f"{worker}-{i}"))
+
+    threads = [threading.Thread(target=write, args=(w,)) for w in range(6)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    with store.snapshot(new_session) as metadata:
+        assert len(metadata.nodes()) == 120
+
+
+def test_legacy_json_is_imported_on_first_access(store):
+    session_id = str(uuid4())
+    os.makedirs(session_dir(session_id))
+    legacy = {
+        "session_name": "old",
+        "nodes": [node("a"), node("b")],
+        "edges": [{"src_id": "a", "dst_id": "b", "operation": "filter"}],
+        "scalar_map": {"b": 3},
+    }
+    with open(store.json_path(session_id), "w") as file:
+        json.dump(legacy, file)
+
+    with store.snapshot(session_id) as metadata:
+        assert metadata.to_dict() == legacy
+    assert not os.path.exists(store.json_path(session_id))
@@ -0,0 +1,100 @@
+import json
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pytest
+
+import storage
+
+
+@pytest.fixture
+def dataset():
+    return pd.DataFrame(
+        {
+            "a": np.arange(250, dtype="float64"),
+            "b": [f"s{i}" for i in range(250)],
+            "c": np.arange(250) % 3,
+        }
+    )
+
+
+@pytest.fixture
+def node_id(monkeypatch, upload, dataset):
+    # stored as several record batches, so reads stream several
+    monkeypatch.setattr(storage, "BATCH_ROWS", 64)
+    return upload(dataset)
+
+
+def strict_loads(text):
+    def reject(constant):
+        raise ValueError(f"Invalid JSON constant: {constant}")
+
+    return json.loads(text, parse_constant=reject)
+
+
+def node_info(client, session_id, node_id, **params):
+    return client.get(
+        f"/session/{session_id}/node_info", params={"node_id": node_id, **params}
+    )
+
+
+def test_whole_node(client, session_id, node_id, dataset):
+    response = node_info(client, session_id, node_id)
+    assert response.headers["X-Total-Count"] == "250"
+    assert "X-Next-Offset" not in response.headers
+    assert strict_loads(response.text) == dataset.to_dict("records")
+
+
+@pytest.mark.parametrize(
+    "offset, limit, next_offset", [(0, 100, "100"), (200, 100, None), (250, 10, None)]
+)
+def test_pages(client, session_id, node_id, dataset, offset, limit, next_offset):
+    response = node_info(client, session_id, node_id, offset=offset, limit=limit)
+    assert response.headers["X-Total-Count"] == "250"
+    assert response.headers.get("X-Next-Offset") == next_offset
+    assert strict_loads(response.text) == dataset.iloc[offset : offset + limit].to_dict(
+        "records"
+    )
+
+
+def test_projection(client, session_id, node_id, dataset):
+    response = node_info(
+        client, session_id, node_id, columns=["c", "a"], offset=10, limit=5
+    )
+    assert strict_loads(response.text) == dataset[["c", "a"]].iloc[10:15].to_dict(
+        "records"
+    )
+    response = node_info(client, session_id, node_id, columns=["missing"])
+    assert response.status_code == 400
+
+
+def test_ndjson(client, session_id, node_id, dataset):
+    response = node_info(
+        client, session_id, node_id, format="ndjson", offset=60, limit=10
+    )
+    assert response.headers["content-type"] == "application/x-ndjson"
+    assert response.headers["X-Next-Offset"] == "70"
+    lines = response.text.splitlines()
+    assert [strict_loads(line) for line in lines] == dataset.iloc[60:70].to_dict(
+        "records"
+    )
+
+
+def test_arrow(client, session_id, node_id, dataset):
+    response = node_info(
+        client, session_id, node_id, format="arrow", columns=["a"], limit=100
+    )
+    table = pa.ipc.open_stream(response.content).read_all()
+    assert table.column("a").to_pylist() == dataset["a"][:100].tolist()
+
+
+@pytest.mark.parametrize("format", ["json", "ndjson"])
+def test_non_finite_values_are_null(client, session_id, upload, format):
+    node_id = upload(pd.DataFrame({"x": [1.5, np.inf, -np.inf, np.nan]}))
+    response = node_info(client, session_id, node_id, format=format)
+    if format == "json":
+        rows = strict_loads(response.text)
+    else:
+        rows = [strict_loads(line) for line in response.text.splitlines()]
+    assert rows == [{"x": 1.5}, {"x": None}, {"x": None}, {"x": None}]
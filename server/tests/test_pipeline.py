@@ -0,0 +1,137 @@
+import pandas as pd
+import pytest
+
+
+@pytest.fixture
+def dataset():
+    return pd.DataFrame(
+        {
+            "a": range(40),
+            "b": [i % 4 for i in range(40)],
+            "s": [f"x{i % 3}" for i in range(40)],
+        }
+    )
+
+
+@pytest.fixture
+def node_id(upload, dataset):
+    return upload(dataset)
+
+
+def pipeline(client, session_id, node_id, steps):
+    return client.post(
+        "/tools/pipeline",
+        params={"session_id": session_id, "node_id": node_id, "format": "split"},
+        json=steps,
+    )
+
+
+def tool(client, path, **params):
+    response = client.post(path, params=params)
+    assert response.status_code == 200, response.text
+    return response.json()
+
+
+FILTER = {"op": "filter", "column": "a", "filter_operator": "ge", "filter_value": 10}
+
+
+@pytest.mark.parametrize("func", ["count", "nunique", "sum", "mean", "max"])
+def test_scalar_steps_match_the_single_tools(client, session_id, node_id, func):
+    content = pipeline(
+        client, session_id, node_id, [FILTER, {"op": func, "column": "a"}]
+    ).json()
+    filtered_id, scalar_id = [step["node_id"] for step in content["steps"]]
+
+    filtered = tool(
+        client,
+        "/tools/filter/",
+        session_id=session_id,
+        node_id=node_id,
+        column="a",
+        filter_operator="ge",
+        filter_value=10,
+    )
+    assert filtered["node_id"] == filtered_id
+    # answered from the memo the pipeline left
+    aggregated = tool(
+        client,
+        "/tools/aggregate",
+        session_id=session_id,
+        node_id=filtered_id,
+        columns=["a"],
+        funcs=[func],
+    )
+    assert aggregated["node_ids"] == {f"{func}(a)": scalar_id}
+    assert aggregated["results"][f"{func}(a)"] == content["result"]
+    assert type(content["result"]) is (int if func in ("count", "nunique") else float)
+    assert type(aggregated["results"][f"{func}(a)"]) is type(content["result"])
+
+
+def test_row_and_grouped_steps_match_the_single_tools(
+    client, session_id, node_id, dataset
+):
+    steps = [
+        FILTER,
+        {"op": "value_counts", "column": "b"},
+    ]
+    content = pipeline(client, session_id, node_id, steps).json()
+    filtered_id, counts_id = [step["node_id"] for step in content["steps"]]
+    expected = dataset[dataset["a"] >= 10]
+    assert content["node_id"] == counts_id
+    assert content["result"] == {
+        str(key): count for key, count in expected["b"].value_counts().items()
+    }
+    assert (
+        tool(
+            client,
+            "/tools/value_counts",
+            session_id=session_id,
+            node_id=filtered_id,
+            column="b",
+        )
+        == content["result"]
+    )
+
+    content = pipeline(
+        client,
+        session_id,
+        node_id,
+        [FILTER, {"op": "mean", "column": "a", "gb_col": "b"}],
+    ).json()
+    assert content["steps"][0]["node_id"] == filtered_id
+    assert (
+        tool(
+            client,
+            "/tools/mean",
+            session_id=session_id,
+            node_id=filtered_id,
+            column="a",
+            gb_col="b",
+        )
+        == content["result"]
+        == {"a": {str(k): v for k, v in expected.groupby("b")["a"].mean().items()}}
+    )
+
+
+def test_final_row_step_returns_its_rows(client, session_id, node_id, dataset):
+    content = pipeline(client, session_id, node_id, [FILTER]).json()
+    assert content["result"]["data"] == dataset[dataset["a"] >= 10].values.tolist()
+
+
+@pytest.mark.parametrize(
+    "steps",
+    [
+        [],
+        [{"op": "median", "column": "a"}],
+        [{"op": "sum", "column": "missing"}],
+        [{"op": "filter", "column": "a", "filter_operator": "between"}],
+        [{"op": "sum", "column": "a"}, FILTER],
+        [{"op": "sample", "n": -1}],
+        [{"op": "sample", "n": 41}],
+        [{"op": "sum", "column": "s"}],
+        [{"op": "mean", "column": "s"}],
+    ],
+)
+def test_invalid_steps_are_bad_requests(client, session_id, node_id, steps):
+    response = pipeline(client, session_id, node_id, steps)
+    assert response.status_code == 400, response.text
@@ -0,0 +1,40 @@
+import threading
+
+import pandas as pd
+
+import main
+
+
+def test_ingest_profile_is_queued_behind_appends(client, session_id, upload):
+    release = threading.Event()
+    # holds the profile executor until the append is in
+    main.profile_executor.submit(release.wait, 10)
+    try:
+        node_id = upload(pd.DataFrame({"a": range(100)}))
+        with main.metadata_store.snapshot(session_id) as metadata:
+            assert metadata.get_node(node_id)["ingest_status"] == "ready"
+        assert main.node_profiles.read(session_id, node_id) is None
+        response = client.post(
+            f"/session/{session_id}/append/{node_id}",
+            files={"file": ("more.csv", "a\n1000\n1001\n", "text/csv")},
+        )
+        assert response.status_code == 200, response.text
+    finally:
+        release.set()
+    main.profile_executor.submit(lambda: None).result()
+
+    profile = main.node_profiles.read(session_id, node_id)
+    assert profile["columns"]["a"]["max"] == 1001
+    main.node_cache.invalidate((session_id, node_id))
+    # the zone map keeps the appended rows
+    response = client.post(
+        "/tools/filter/",
+        params={
+            "session_id": session_id,
+            "node_id": node_id,
+            "column": "a",
+            "filter_operator": "ge",
+            "filter_value": 1000,
+        },
+    )
+    assert response.json()["num_rows"] == 2
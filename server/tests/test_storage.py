@@ -0,0 +1,95 @@
+import os
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pytest
+
+import main
+from storage import FeatherNodeStore
+
+
+@pytest.fixture
+def store():
+    return FeatherNodeStore()
+
+
+@pytest.fixture
+def dataset():
+    rows = 100_000
+    return pd.DataFrame(
+        {
+            "a": np.arange(rows, dtype="float64"),
+            "b": np.arange(rows) % 7,
+            "s": [f"row {i}" for i in range(rows)],
+        }
+    )
+
+
+def write_csv(session_id, node_id, dataframe):
+    dataframe.to_csv(FeatherNodeStore().csv_path(session_id, node_id), index=False)
+
+
+def test_csv_only_node_is_converted_on_first_read(store, session_id, dataset):
+    # as left by a session created before the Feather store
+    write_csv(session_id, "node", dataset)
+    assert store.exists(session_id, "node")
+    assert not os.path.exists(store.blob_path(session_id, "node"))
+
+    pd.testing.assert_frame_equal(store.read(session_id, "node", ["b"]), dataset[["b"]])
+    assert os.path.exists(store.blob_path(session_id, "node"))
+    assert os.path.exists(store.csv_path(session_id, "node"))
+
+    # later reads come from the Feather file only
+    write_csv(session_id, "node", dataset.head(1))
+    assert store.num_rows(session_id, "node") == len(dataset)
+    pd.testing.assert_frame_equal(store.read(session_id, "node"), dataset)
+
+
+def test_csv_only_node_is_served_through_the_api(client, session_id, upload):
+    dataset = pd.DataFrame({"a": [1, 2, 3], "b": ["x", "y", "z"]})
+    node_id = upload(dataset)
+    os.remove(main.node_store.blob_path(session_id, node_id))
+    main.node_cache.invalidate((session_id, node_id))
+
+    response = client.get(
+        f"/session/{session_id}/node_info", params={"node_id": node_id}
+    )
+    assert response.json() == dataset.to_dict("records")
+    assert os.path.exists(main.node_store.blob_path(session_id, node_id))
+
+
+def test_projected_reads_only_load_the_requested_columns(store, session_id, dataset):
+    store.write(session_id, "node", dataset)
+
+    before = pa.total_allocated_bytes()
+    table = store.read_table(session_id, "node", ["a", "b"])
+    # memory-mapped: the column buffers point into the file rather than
+    # being copied into Arrow's memory pool
+    assert pa.total_allocated_bytes() - before < dataset["a"].nbytes // 10
+    assert table.column_names == ["a", "b"]
+
+    dataframe = store.read(session_id, "node", ["b"])
+    assert list(dataframe.columns) == ["b"]
+    pd.testing.assert_series_equal(dataframe["b"], dataset["b"])
+    pd.testing.assert_frame_equal(
+        store.read_ranges(session_id, "node", [(10, 20)], ["s"]),
+        dataset[["s"]].iloc[10:20],
+    )
+
+
+def test_read_node_projects_stored_nodes(monkeypatch, client, session_id, upload):
+    node_id = upload(pd.DataFrame({"a": [1, 2], "b": [3, 4], "c": [5, 6]}))
+    main.node_cache.invalidate((session_id, node_id))
+    requested = []
+    read = main.node_store.read
+
+    def spy(session_id, node_id, columns=None):
+        requested.append(columns)
+        return read(session_id, node_id, columns)
+
+    monkeypatch.setattr(main.node_store, "read", spy)
+    assert main.read_node(session_id, node_id, ["c"])["c"].tolist() == [5, 6]
+    assert requested == [["c"]]
+    # a projected read does not fill the cache with the whole node
+    assert (session_id, node_id) not in main.node_cache
@@ -0,0 +1,187 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+import main
+from operations import AGGREGATIONS, aggregate
+from streaming import stream_aggregate
+
+
+@pytest.fixture
+def streamed(monkeypatch):
+    """Inputs larger than a few kilobytes are processed in batches."""
+    monkeypatch.setattr(main, "MEMORY_BUDGET_BYTES", 20_000)
+
+
+@pytest.fixture
+def node_id(upload):
+    rows = 5000
+    node_id = upload(
+        pd.DataFrame({"a": np.arange(rows, dtype="float64"), "b": np.arange(rows) % 7})
+    )
+    # zone maps come with the profile
+    main.profile_executor.submit(lambda: None).result()
+    return node_id
+
+
+# every zone map rules out the first; none rule out the second
+@pytest.mark.parametrize("filter_operator, filter_value", [("gt", 1e9), ("eq", 0.5)])
+def test_filter_matching_nothing_gives_an_empty_node(
+    streamed, client, session_id, node_id, filter_operator, filter_value
+):
+    response = client.post(
+        "/tools/filter/",
+        params={
+            "session_id": session_id,
+            "node_id": node_id,
+            "column": "a",
+            "filter_operator": filter_operator,
+            "filter_value": filter_value,
+        },
+    )
+    assert response.status_code == 200, response.text
+    content = response.json()
+    assert content["num_rows"] == 0
+    assert content["columns"] == ["a", "b"]
+
+    filtered = main.node_store.read(session_id, content["node_id"])
+    assert filtered.dtypes.to_dict() == {"a": "float64", "b": "int64"}
+    response = client.post(
+        "/tools/sum",
+        params={"session_id": session_id, "node_id": content["node_id"], "column": "a"},
+    )
+    assert response.json() == 0.0
+
+
+def test_describe_marks_approximate_quartiles(streamed, client, session_id, node_id):
+    def describe():
+        return client.post(
+            "/tools/describe",
+            params={"session_id": session_id, "node_id": node_id, "column": "a"},
+        ).json()
+
+    content = describe()
+    expected = main.node_store.read(session_id, node_id)["a"].describe()
+    assert content.pop("approximate") is True
+    for stat in ("count", "mean", "std", "min", "max"):
+        assert content[stat] == pytest.approx(expected[stat])
+    for stat in ("25%", "50%", "75%"):
+        # within the sketch's rank error of 5000 evenly spaced values
+        assert content[stat] == pytest.approx(expected[stat], abs=0.02 * 5000)
+
+    # remembered, but not as the exact description
+    assert describe() == {**content, "approximate": True}
+    exact = main.make_recipe("describe", node_id, {"column": "a"})
+    with main.metadata_store.snapshot(session_id) as metadata:
+        assert main.memoized_node(metadata, exact) is None
+
+
+def batches(dataset, n):
+    return (dataset.iloc[i : i + n] for i in range(0, len(dataset), n))
+
+
+def assert_same_results(streamed, expected):
+    assert streamed.keys() == expected.keys()
+    for key, result in expected.items():
+        if isinstance(result, pd.Series):
+            pd.testing.assert_series_equal(
+                streamed[key], result, check_dtype=False, check_exact=False
+            )
+        else:
+            assert streamed[key] == pytest.approx(result, nan_ok=True), key
+
+
+@pytest.mark.parametrize("gb_cols", [None, ["g"], ["g", "h"]])
+def test_stream_aggregate_matches_aggregate(gb_cols):
+    rng = np.random.default_rng(0)
+    rows = 1000
+    dataset = pd.DataFrame(
+        {
+            "g": rng.integers(0, 5, rows),
+            "h": rng.choice(["x", "y"], rows),
+            "a": rng.normal(size=rows),
+            "b": rng.integers(-50, 50, rows),
+        }
+    )
+    dataset.loc[rng.random(rows) < 0.1, "a"] = np.nan
+    columns, funcs = ["a", "b"], list(AGGREGATIONS)
+
+    assert_same_results(
+        stream_aggregate(batches(dataset, 128), columns, funcs, gb_cols),
+        aggregate(dataset, columns, funcs, gb_cols),
+    )
+
+
+def test_streamed_aggregates_match_in_memory(
+    monkeypatch, client, session_id, node_id, upload
+):
+    def aggregates(node_id, gb_col):
+        params = {
+            "session_id": session_id,
+            "node_id": node_id,
+            "columns": ["a"],
+            "funcs": ["sum", "mean", "std", "nunique", "count"],
+        }
+        if gb_col is not None:
+            params["gb_cols"] = [gb_col]
+        return client.post("/tools/aggregate", params=params).json()["results"]
+
+    in_memory = {gb_col: aggregates(node_id, gb_col) for gb_col in (None, "b")}
+    # a copy, so the results aren't answered from the memo
+    copy_id = upload(main.node_store.read(session_id, node_id))
+    streams = []
+    monkeypatch.setattr(main, "MEMORY_BUDGET_BYTES", 20_000)
+    monkeypatch.setattr(
+        main,
+        "stream_aggregate",
+        lambda *args: streams.append(1) or stream_aggregate(*args),
+    )
+
+    streamed = {gb_col: aggregates(copy_id, gb_col) for gb_col in (None, "b")}
+    assert len(streams) == 2
+    assert streamed[None] == pytest.approx(in_memory[None])
+    for name, groups in in_memory["b"].items():
+        assert streamed["b"][name] == pytest.approx(groups)
+
+
+def test_stream_aggregate_single_row_groups():
+    dataset = pd.DataFrame({"g": [1, 2, 2, 3, 4, 4], "a": [1.0, 2, 4, 5, np.nan, 7]})
+    funcs = list(AGGREGATIONS)
+    expected = dataset.groupby("g")["a"].agg(funcs)
+
+    results = stream_aggregate(batches(dataset, 1), ["a"], funcs, ["g"])
+
+    for func in funcs:
+        pd.testing.assert_series_equal(
+            results[("a", func)], expected[func].rename("a"), check_dtype=False
+        )
+
+
+# n is validated by FastAPI; the upper bound needs the node's row count
+@pytest.mark.parametrize("n, status_code", [(-1, 422), (5001, 400)])
+def test_sample_size_out_of_range_is_refused(
+    streamed, client, session_id, node_id, n, status_code
+):
+    response = client.post(
+        "/tools/sample",
+        params={"session_id": session_id, "node_id": node_id, "n": n},
+    )
+    assert response.status_code == status_code
+    with main.metadata_store.snapshot(session_id) as metadata:
+        assert [node["node_id"] for node in metadata.nodes()] == [node_id]
+
+
+def test_streamed_sample_has_n_distinct_rows(streamed, client, session_id, node_id):
+    response = client.post(
+        "/tools/sample",
+        params={
+            "session_id": session_id,
+            "node_id": node_id,
+            "n": 300,
+            "format": "split",
+        },
+    ).json()
+    rows = response["data"]
+    assert response["num_rows"] == len(rows) == 300
+    assert len({row[0] for row in rows}) == 300
+    assert all(row[1] == row[0] % 7 for row in rows)
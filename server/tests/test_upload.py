@@ -0,0 +1,110 @@
+import os
+import shutil
+
+import pandas as pd
+import pytest
+
+import main
+
+
+@pytest.fixture
+def deferred(monkeypatch):
+    """Holds back the conversion that runs after the upload's response; call
+    the returned function to run it."""
+    calls = []
+    ingest_node = main.ingest_node
+    monkeypatch.setattr(main, "ingest_node", lambda *args: calls.append(args))
+
+    def run():
+        for args in calls:
+            ingest_node(*args)
+
+    return run
+
+
+def post_csv(client, session_id, body, name="data.csv"):
+    return client.post(
+        f"/session/{session_id}/upload",
+        files={"file": (name, body, "text/csv")},
+    )
+
+
+def get_node(session_id, node_id):
+    with main.metadata_store.snapshot(session_id) as metadata:
+        return metadata.get_node(node_id)
+
+
+def test_upload_is_copied_in_chunks(monkeypatch, client, session_id, deferred):
+    body = "a,b\n" + "".join(f"{i},{i * 2}\n" for i in range(500))
+    lengths = []
+    copy = shutil.copyfileobj
+
+    def copyfileobj(source, target, length=0):
+        lengths.append(length)
+        copy(source, target, length)
+
+    monkeypatch.setattr(main, "UPLOAD_CHUNK_BYTES", 64)
+    monkeypatch.setattr(main.shutil, "copyfileobj", copyfileobj)
+    response = post_csv(client, session_id, body)
+    assert response.status_code == 200, response.text
+    node_id = response.json()["node_id"]
+
+    assert lengths == [64]
+    with open(main.node_store.csv_path(session_id, node_id)) as file:
+        assert file.read() == body
+
+
+def test_conversion_runs_after_the_response(monkeypatch, client, session_id, deferred):
+    monkeypatch.setattr(main, "INGEST_SNIFF_ROWS", 10)
+    body = "a,b\n" + "".join(f"{i},{i % 3}\n" for i in range(500))
+    node_id = post_csv(client, session_id, body).json()["node_id"]
+
+    node = get_node(session_id, node_id)
+    assert node["ingest_status"] == "pending"
+    assert node["columns"] == ["a", "b"]
+    assert node["num_rows"] is None
+    assert not os.path.exists(main.node_store.blob_path(session_id, node_id))
+    response = client.post(
+        f"/session/{session_id}/append/{node_id}",
+        files={"file": ("more.csv", "a,b\n1,2\n", "text/csv")},
+    )
+    assert response.status_code == 409
+
+    deferred()
+    node = get_node(session_id, node_id)
+    assert node["ingest_status"] == "ready"
+    assert node["num_rows"] == 500
+    assert os.path.exists(main.node_store.blob_path(session_id, node_id))
+    assert main.node_store.read(session_id, node_id)["a"].tolist() == list(range(500))
+
+
+def test_rows_past_the_sniffed_prefix_can_fail_the_conversion(
+    monkeypatch, client, session_id, deferred
+):
+    monkeypatch.setattr(main, "INGEST_SNIFF_ROWS", 2)
+    body = "a,b\n1,2\n3,4\n5,6\n7,8,9,10\n"
+    response = post_csv(client, session_id, body)
+    assert response.status_code == 200, response.text
+    node_id = response.json()["node_id"]
+
+    deferred()
+    node = get_node(session_id, node_id)
+    assert node["ingest_status"] == "failed"
+    assert node["ingest_error"]
+
+
+def test_unreadable_upload_is_refused(client, session_id):
+    response = post_csv(client, session_id, "")
+    assert response.status_code == 500
+    assert not [
+        name
+        for name in os.listdir(main.session_dir(session_id))
+        if name.endswith(".csv")
+    ]
+
+
+def test_ingested_upload_matches_pandas(client, session_id, upload):
+    dataset = pd.DataFrame({"a": [1.5, None, 3.0], "s": ["x", "y", None]})
+    node_id = upload(dataset)
+    assert get_node(session_id, node_id)["ingest_status"] == "ready"
+    pd.testing.assert_frame_equal(main.node_store.read(session_id, node_id), dataset)